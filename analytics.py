@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+from sqlalchemy import distinct, func, select
+
+from models import db, Courses, EnrollmentSummary
+
+# Reports for /api/analytics, aggregated from the enrollment summary rather
+# than from enrollments: a page of courses or instructors costs two grouped
+# queries over a few summary rows per course, however many students enrolled.
+
+GRADE_POINTS = {'A': 4, 'B': 3, 'C': 2, 'D': 1, 'F': 0}
+FAILING = 'F'
+DROPPED = 'dropped'
+# Summary columns ?semester= filters on
+FILTERS = (EnrollmentSummary.semester,)
+COURSE_TABLES = ('courses', 'enrollment_summary')
+INSTRUCTOR_TABLES = ('courses', 'enrollment_summary', 'instructors')
+
+
+def grade_report(counts):
+    # counts is {grade: enrollments}; grades outside GRADE_POINTS are listed
+    # but left out of the mean
+    graded = sum(counts.values())
+    scored = {grade: count for grade, count in counts.items() if grade in GRADE_POINTS}
+    scored_total = sum(scored.values())
+    return {
+        'distribution': dict(sorted(counts.items())),
+        'graded': graded,
+        'mean_grade_points': round(sum(GRADE_POINTS[grade] * count for grade, count in scored.items())
+                                   / scored_total, 2) if scored_total else None,
+        'pass_rate': round((graded - counts.get(FAILING, 0)) / graded, 3) if graded else None,
+    }
+
+
+def _grades(key, keys, criteria):
+    # {key value: {grade: enrollments}} for the given course or instructor ids
+    grades = defaultdict(dict)
+    statement = select(key, EnrollmentSummary.grade, func.sum(EnrollmentSummary.count))
+    if key is Courses.instructor_id:
+        statement = statement.join(Courses, Courses.id == EnrollmentSummary.course_id)
+    rows = db.session.execute(
+        statement.where(key.in_(keys), EnrollmentSummary.grade != '', *criteria)
+        .group_by(key, EnrollmentSummary.grade)
+    )
+    for value, grade, count in rows:
+        grades[value][grade] = count
+    return grades
+
+
+def course_reports(course_ids, criteria=()):
+    # {course_id: {'semesters': [...], 'grades': {...}}}, with an entry for
+    # every id asked for
+    semesters = defaultdict(lambda: defaultdict(dict))
+    rows = db.session.execute(
+        select(EnrollmentSummary.course_id, EnrollmentSummary.semester, EnrollmentSummary.status,
+               func.sum(EnrollmentSummary.count))
+        .where(EnrollmentSummary.course_id.in_(course_ids), *criteria)
+        .group_by(EnrollmentSummary.course_id, EnrollmentSummary.semester, EnrollmentSummary.status)
+    )
+    for course_id, semester, status, count in rows:
+        semesters[course_id][semester][status] = count
+    grades = _grades(EnrollmentSummary.course_id, course_ids, criteria)
+    return {
+        course_id: {
+            'semesters': [
+                {'semester': semester, 'total': sum(statuses.values()), **dict(sorted(statuses.items()))}
+                for semester, statuses in sorted(semesters[course_id].items())
+            ],
+            'grades': grade_report(grades[course_id]),
+        }
+        for course_id in course_ids
+    }
+
+
+def instructor_reports(instructor_ids, criteria=()):
+    # Teaching load per semester: courses with at least one student who did
+    # not drop, those students, and the credit hours they earn; plus the
+    # grade distribution across all of the instructor's courses
+    semesters = defaultdict(list)
+    rows = db.session.execute(
+        select(Courses.instructor_id, EnrollmentSummary.semester,
+               func.count(distinct(EnrollmentSummary.course_id)), func.sum(EnrollmentSummary.count),
+               func.sum(EnrollmentSummary.count * Courses.credit_hours))
+        .join(Courses, Courses.id == EnrollmentSummary.course_id)
+        .where(Courses.instructor_id.in_(instructor_ids), EnrollmentSummary.status != DROPPED, *criteria)
+        .group_by(Courses.instructor_id, EnrollmentSummary.semester)
+        .order_by(Courses.instructor_id, EnrollmentSummary.semester)
+    )
+    for instructor_id, semester, course_count, students, credit_hours in rows:
+        semesters[instructor_id].append(
+            {'semester': semester, 'courses': course_count, 'students': students, 'credit_hours': credit_hours})
+    grades = _grades(Courses.instructor_id, instructor_ids, criteria)
+    return {
+        instructor_id: {'semesters': semesters[instructor_id], 'grades': grade_report(grades[instructor_id])}
+        for instructor_id in instructor_ids
+    }
@@ -11,61 +11,98 @@ from flask_migrate import Migrate
 from flask_restful import Api
 
 # Local imports
-from models import db  # Import db from models
+from models import db, bcrypt  # Import db from models
+import database
+from commands import check_indexes, check_queries, import_csv, seats, enrollment_summary, transcript_terms, change_log
+import counters  # registers the enrollment counter events
+import summaries  # registers the enrollment summary events
+import transcripts  # registers the transcript events
+import cascades  # registers the cascade delete events
+import versions  # registers the table version events
+import metrics
+import search
+import representations
 
 #Important resources
 from resources import(
-    UsersResource,UserByIdResource,StudentsResource,StudentByIdResource,CoursesResource,CourseByIdResource,EnrollmentsResource,EnrollmentByIdResource,CourseEnrollmentsResource,StudentEnrollmentsResource,InstructorsResource,InstructorByIdResource,InstructorCoursesResource,SighnupResource,LoginResource,LogoutResource
+    MetricsResource,UsersResource,UserByIdResource,StudentsResource,StudentByIdResource,CoursesResource,CourseSearchResource,CourseByIdResource,EnrollmentsResource,EnrollmentByIdResource,CourseEnrollmentsResource,StudentEnrollmentsResource,StudentTranscriptResource,BulkEnrollmentsResource,CourseGradesResource,InstructorsResource,InstructorByIdResource,InstructorCoursesResource,CourseAnalyticsResource,InstructorAnalyticsResource,ChangesResource,ImportResource,SighnupResource,LoginResource,LogoutResource
 )
 
-# Instantiate app, set attributes
-app = Flask(__name__)
-import os
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(app.root_path, "instance", "app.db")}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.json.compact = False
-
-print(f"Database URI: {app.config['SQLALCHEMY_DATABASE_URI']}")
-print(f"Instance path: {app.instance_path}")
-
-# Initialize db with app
-db.init_app(app)
-
-from models import bcrypt
-bcrypt.init_app(app)
-
-migrate = Migrate(app, db)
-
-# Instantiate REST API
-api = Api(app)
-api.prefix = '/api'
-
-# Instantiate CORS
-CORS(app)
-
-
-# add API routes
-api.add_resource(SighnupResource, '/auth/signup')
-api.add_resource(LoginResource, '/auth/login')
-api.add_resource(LogoutResource, '/auth/logout')
-api.add_resource(UsersResource, '/users')
-api.add_resource(UserByIdResource, '/users/<int:user_id>')
-api.add_resource(StudentsResource, '/students')
-api.add_resource(StudentByIdResource, '/students/<int:student_id>')
-api.add_resource(CoursesResource, '/courses')
-api.add_resource(CourseByIdResource, '/courses/<int:course_id>')
-api.add_resource(EnrollmentsResource, '/enrollments')
-api.add_resource(EnrollmentByIdResource, '/enrollments/<int:enrollment_id>')
-api.add_resource(CourseEnrollmentsResource, '/courses/<int:course_id>/enrollments')
-api.add_resource(StudentEnrollmentsResource, '/students/<int:student_id>/enrollments')
-api.add_resource(InstructorsResource, '/instructors')
-api.add_resource(InstructorByIdResource, '/instructors/<int:instructor_id>')
-api.add_resource(InstructorCoursesResource, '/instructors/<int:instructor_id>/courses')
-
-@app.route('/')
-def home():
-    return 'Course Hub API'
+migrate = Migrate(db=db, include_object=search.include_object)
+
+
+def create_app(config=None):
+    # Instantiate app, set attributes
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database.database_url(app.root_path)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['RESPONSE_CACHE'] = os.environ.get('RESPONSE_CACHE', 'memory')
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', database.engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    # Initialize db with app
+    db.init_app(app)
+    database.init_app(app, db)
+    bcrypt.init_app(app)
+    migrate.init_app(app)
+    metrics.init_app(app)
+
+    app.cli.add_command(check_queries)
+    app.cli.add_command(check_indexes)
+    app.cli.add_command(seats)
+    app.cli.add_command(enrollment_summary)
+    app.cli.add_command(transcript_terms)
+    app.cli.add_command(change_log)
+    app.cli.add_command(import_csv)
+
+    # Instantiate REST API
+    api = Api(app)
+    api.prefix = '/api'
+    representations.init_app(app, api)
+
+    # Instantiate CORS
+    CORS(app, expose_headers=['X-Next-Cursor', 'Link', 'ETag', 'Last-Modified', 'Content-Encoding'])
+
+    # add API routes
+    api.add_resource(SighnupResource, '/auth/signup')
+    api.add_resource(LoginResource, '/auth/login')
+    api.add_resource(LogoutResource, '/auth/logout')
+    api.add_resource(UsersResource, '/users')
+    api.add_resource(UserByIdResource, '/users/<int:user_id>')
+    api.add_resource(StudentsResource, '/students')
+    api.add_resource(StudentByIdResource, '/students/<int:student_id>')
+    api.add_resource(CoursesResource, '/courses')
+    api.add_resource(CourseSearchResource, '/courses/search')
+    api.add_resource(CourseByIdResource, '/courses/<int:course_id>')
+    api.add_resource(EnrollmentsResource, '/enrollments')
+    api.add_resource(BulkEnrollmentsResource, '/enrollments/bulk')
+    api.add_resource(EnrollmentByIdResource, '/enrollments/<int:enrollment_id>')
+    api.add_resource(CourseEnrollmentsResource, '/courses/<int:course_id>/enrollments')
+    api.add_resource(CourseGradesResource, '/courses/<int:course_id>/grades')
+    api.add_resource(StudentEnrollmentsResource, '/students/<int:student_id>/enrollments')
+    api.add_resource(StudentTranscriptResource, '/students/<int:student_id>/transcript')
+    api.add_resource(InstructorsResource, '/instructors')
+    api.add_resource(InstructorByIdResource, '/instructors/<int:instructor_id>')
+    api.add_resource(InstructorCoursesResource, '/instructors/<int:instructor_id>/courses')
+    api.add_resource(CourseAnalyticsResource, '/analytics/courses')
+    api.add_resource(InstructorAnalyticsResource, '/analytics/instructors')
+    api.add_resource(ChangesResource, '/changes')
+    api.add_resource(ImportResource, '/import/<string:kind>')
+    api.add_resource(MetricsResource, '/metrics')
+
+    @app.route('/')
+    def home():
+        return 'Course Hub API'
+
+    return app
+
 
 if __name__ == '__main__':
+    # Single-process development server; serve.py is the production entry point
+    app = create_app()
+    print(f"Database URI: {database.display_url(app.config['SQLALCHEMY_DATABASE_URI'])}")
+    print(f"Instance path: {app.instance_path}")
+    print(f"Database profile: {database.profile_name(app.config['SQLALCHEMY_DATABASE_URI'])}")
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
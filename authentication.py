@@ -1,31 +1,90 @@
-from falsk import request
+import time
+from collections import namedtuple
 from functools import wraps
-from models import Users
+
+import jwt
+from flask import request
+from sqlalchemy import select
+
+import metrics
+from cache import TTLCache
+from models import db, Users
+
+# What protected views receive instead of a Users row: enough to authorise
+# without touching the session.
+Principal = namedtuple('Principal', 'id username email role')
+
+# Verified tokens, so an authenticated request costs one dict lookup and a
+# primary-key read of users.token_version instead of a JWT decode and a full
+# user row. Entries never outlive the token's exp claim. Changing a user bumps
+# its token_version in the same transaction, and deleting it removes the row,
+# so every worker process rejects the cached principal on its next use.
+PRINCIPAL_TTL = 60
+principals = TTLCache(maxsize=10000, ttl=PRINCIPAL_TTL)
+
+
+def invalidate_user(user):
+  # Before the commit that changes the user
+  user.token_version = Users.token_version + 1
+
+
+def principal_cache_stats():
+  return principals.stats()
+
+
+metrics.registry.register(
+  'principal_cache_lookups_total', 'counter', 'Principal cache lookups by result',
+  lambda: {'result="hit"': principals.hits, 'result="miss"': principals.misses})
+
+
+def _load_principal(token):
+  try:
+    claims = jwt.decode(token, 'secret_key', algorithms=['HS256'])
+  except jwt.PyJWTError:
+    return None, None
+  user_id, exp = claims.get('user_id'), claims.get('exp')
+  if user_id is None or exp is None:
+    return None, None
+
+  user = Users.query.get(user_id)
+  if user is None:
+    return None, None
+
+  principal = Principal(user.id, user.username, user.email, user.role)
+  ttl = min(PRINCIPAL_TTL, exp - time.time())
+  if ttl > 0:
+    principals.set(token, (user.token_version, claims, principal), ttl=ttl)
+  return claims, principal
+
+
+def authenticate(token):
+  cached = principals.get(token)
+  if cached is not None:
+    version, claims, principal = cached
+    current = db.session.execute(select(Users.token_version).where(Users.id == principal.id)).scalar()
+    if current == version:
+      return principal
+    principals.pop(token)
+  return _load_principal(token)[1]
+
 
 def token_required(f):
   @wraps(f)
   def decorated (*args, **kwags):
-    token = None
-
-    if 'Authorization' in request.headers:
-      authentication_header = request.headers['Authorization']
-      
-      try:
-        token = authentication_header.split(" ")[1]
-      except IndexError:
-          return {'error': 'Token is missing'}, 401
-      
-
-      user = Users.verify_token(token)
-
-      if not user:
-        return {'error': 'Missing token'}, 401
-      
-      users = Users.verify_token(token)
-      if not user:
-        return {'error': 'Token invalid'}, 401
-      
-      return f(user, *args, **kwags)
+    authentication_header = request.headers.get('Authorization')
+    if not authentication_header:
+      return {'error': 'Token is missing'}, 401
+
+    try:
+      token = authentication_header.split(" ")[1]
+    except IndexError:
+      return {'error': 'Token is missing'}, 401
+
+    user = authenticate(token)
+    if not user:
+      return {'error': 'Token invalid'}, 401
+
+    return f(user, *args, **kwags)
   return decorated
 
 
@@ -44,4 +103,3 @@ def admin_required(f):
       return {'error': 'admin acces required'}, 403
     return f(user, *args, **kwags)
   return decorated
-      
\ No newline at end of file
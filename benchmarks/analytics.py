@@ -0,0 +1,126 @@
+"""Analytics from the enrollment summary against scanning enrollments.
+
+Builds a dataset with seed.py's generator, then times the per-course and
+per-instructor reports read from enrollment_summary against the same grouped
+aggregates computed straight from enrollments, both for one page of the API
+and for the whole catalog. Finally times ORM enrollment writes with and
+without the summary events, and fails if the summary has drifted.
+
+    python -m benchmarks.analytics --students 50000 --courses 2000 --semesters 8
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.registration_rush import percentile
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def report(label, samples):
+    print(f'{label:46} p50 {percentile(samples, 50) * 1000:8.2f}ms  p95 {percentile(samples, 95) * 1000:8.2f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--semesters', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--writes', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'analytics.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    from sqlalchemy import event, func, select
+
+    import summaries
+    from app import create_app
+    from models import db, Courses, EnrollmentSummary, Enrollments, Students
+    from seed import fresh_database, generate
+    app = create_app()
+
+    with app.app_context():
+        created = generate(fresh_database(database), students=args.students, courses=args.courses,
+                           semesters=args.semesters, seed=args.seed)
+        groups = db.session.query(func.count()).select_from(EnrollmentSummary).scalar()
+    print(f'{created["enrollments"]} enrollments, {groups} summary rows')
+
+    grade = func.coalesce(Enrollments.grade, '')
+    scans = {
+        'courses': select(Enrollments.course_id, Enrollments.semester, Enrollments.status, grade,
+                          func.count(Enrollments.id))
+        .group_by(Enrollments.course_id, Enrollments.semester, Enrollments.status, grade),
+        'instructors': select(Courses.instructor_id, Enrollments.semester, Enrollments.status, grade,
+                              func.count(Enrollments.id), func.sum(Courses.credit_hours))
+        .join(Courses, Courses.id == Enrollments.course_id)
+        .group_by(Courses.instructor_id, Enrollments.semester, Enrollments.status, grade),
+    }
+    summary = {
+        'courses': select(EnrollmentSummary.course_id, EnrollmentSummary.semester, EnrollmentSummary.status,
+                          EnrollmentSummary.grade, EnrollmentSummary.count),
+        'instructors': select(Courses.instructor_id, EnrollmentSummary.semester, EnrollmentSummary.status,
+                              EnrollmentSummary.grade, func.sum(EnrollmentSummary.count),
+                              func.sum(EnrollmentSummary.count * Courses.credit_hours))
+        .join(Courses, Courses.id == EnrollmentSummary.course_id)
+        .group_by(Courses.instructor_id, EnrollmentSummary.semester, EnrollmentSummary.status,
+                  EnrollmentSummary.grade),
+    }
+
+    client = app.test_client()
+    with app.app_context():
+        first = db.session.query(Courses.id).order_by(Courses.id).first().id
+        page = [row.id for row in db.session.query(Courses.id).order_by(Courses.id).limit(200)]
+        page_scan = scans['courses'].where(Enrollments.course_id.in_(page))
+        report('GET /api/analytics/courses?limit=200',
+               timed(lambda: client.get('/api/analytics/courses?limit=200'), args.repeat))
+        report('  same page from enrollments (SQL only)',
+               timed(lambda: db.session.execute(page_scan).all(), args.repeat))
+        report('GET /api/analytics/instructors?limit=200',
+               timed(lambda: client.get('/api/analytics/instructors?limit=200'), args.repeat))
+        for name in scans:
+            report(f'whole catalog by {name}, from summary', timed(lambda: db.session.execute(summary[name]).all(), args.repeat))
+            report(f'whole catalog by {name}, from enrollments', timed(lambda: db.session.execute(scans[name]).all(), args.repeat))
+
+        rng = random.Random(args.seed)
+        student_ids = [row.id for row in db.session.query(Students.id)]
+
+        def write(semester):
+            enrollment = Enrollments(student_id=rng.choice(student_ids), course_id=first + rng.randrange(args.courses),
+                                     semester=semester, status='completed', grade=rng.choice('ABCDF'))
+            db.session.add(enrollment)
+            db.session.commit()
+            enrollment.grade = rng.choice('ABCDF')
+            db.session.commit()
+            db.session.delete(enrollment)
+            db.session.commit()
+
+        report('ORM insert + update + delete, with summary', timed(lambda: write('bench-a'), args.writes))
+        listeners = [(Enrollments, 'after_insert', summaries._enrollment_inserted),
+                     (Enrollments, 'after_update', summaries._enrollment_updated),
+                     (Enrollments, 'after_delete', summaries._enrollment_deleted)]
+        for listener in listeners:
+            event.remove(*listener)
+        report('ORM insert + update + delete, without summary', timed(lambda: write('bench-b'), args.writes))
+        for listener in listeners:
+            event.listen(*listener)
+
+        drift = summaries.check_summaries()
+        if drift:
+            raise SystemExit(f'enrollment summary drifted: {drift[:5]}')
+        print('enrollment summary is consistent')
+
+
+if __name__ == '__main__':
+    main()
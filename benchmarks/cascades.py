@@ -0,0 +1,117 @@
+"""Deletes cascaded by the database against deletes materialized by the ORM.
+
+Builds a dataset with seed.py's generator (course popularity is Zipf-skewed,
+so course sizes range widely), then deletes courses of increasing size and
+the instructor with the most enrollments, each from a pristine copy of the
+database, two ways:
+
+  * passive: db.session.delete(parent), leaving dependents to ON DELETE
+    CASCADE while cascades.py updates the derived tables in a few set-based
+    statements;
+  * materialized: the dependents are loaded into the session first, which is
+    what cascade='all, delete-orphan' did before, so the ORM deletes them
+    row by row and runs the per-row mapper events.
+
+Reports SQL statements, wall time and peak Python memory (from a separate
+run under tracemalloc) per delete, and fails if seat counts, summaries or transcripts drift.
+
+    python -m benchmarks.cascades --students 20000 --courses 200
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--semesters', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'cascades.db')
+    pristine = os.path.join(directory, 'pristine.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import selectinload
+
+    from app import create_app
+    from counters import check_seat_counts
+    from loading import count_queries
+    from models import db, Courses, Enrollments, Instructors
+    from seed import fresh_database, generate
+    from summaries import check_summaries
+    from transcripts import check_transcripts
+    app = create_app()
+
+    with app.app_context():
+        created = generate(fresh_database(database), students=args.students, courses=args.courses,
+                           semesters=args.semesters, seed=args.seed)
+        sizes = db.session.execute(
+            select(Enrollments.course_id, func.count()).group_by(Enrollments.course_id).order_by(func.count())
+        ).all()
+        busiest = db.session.execute(
+            select(Courses.instructor_id, func.count())
+            .join(Enrollments, Enrollments.course_id == Courses.id)
+            .group_by(Courses.instructor_id).order_by(func.count().desc()).limit(1)
+        ).one()
+        db.session.remove()
+        db.engine.dispose()
+    shutil.copy(database, pristine)
+    print(f'{created["enrollments"]} enrollments over {len(sizes)} courses')
+
+    picks = [sizes[0], sizes[len(sizes) // 2], sizes[-len(sizes) // 10], sizes[-1]]
+    targets = [(f'course with {count} enrollments', Courses, course_id, selectinload(Courses.enrollments))
+               for course_id, count in picks]
+    targets.append((f'instructor with {busiest[1]} enrollments', Instructors, busiest[0],
+                    selectinload(Instructors.courses).selectinload(Courses.enrollments)))
+
+    def restore():
+        db.session.remove()
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database + suffix):
+                os.remove(database + suffix)
+        shutil.copy(pristine, database)
+
+    def delete(model, row_id, load):
+        parent = db.session.get(model, row_id, options=[load] if load is not None else [])
+        db.session.delete(parent)
+        db.session.commit()
+
+    def run(model, row_id, load, traced):
+        restore()
+        # Open the connection and warm the page cache outside the measurement
+        db.session.execute(select(func.count(Enrollments.id))).scalar()
+        if traced:
+            tracemalloc.start()
+        with count_queries() as executed:
+            started = time.perf_counter()
+            delete(model, row_id, load)
+            elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if traced else None
+        tracemalloc.stop()
+        return len(executed), elapsed, peak
+
+    with app.app_context():
+        for label, model, row_id, load in targets:
+            for mode, options in (('passive', None), ('materialized', load)):
+                # Timed and traced separately, as tracemalloc slows everything down
+                statements, elapsed, _ = run(model, row_id, options, False)
+                drift = check_seat_counts(), check_summaries(), check_transcripts()
+                if any(drift):
+                    raise SystemExit(f'{mode} delete of {label} left drift: {[d[:3] for d in drift]}')
+                _, _, peak = run(model, row_id, options, True)
+                print(f'{label:38} {mode:12} {statements:6} statements {elapsed * 1000:9.2f}ms '
+                      f'peak {peak / 1024:9.1f}KB')
+    print('seat counts, summaries and transcripts are consistent')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Polling GET /api/changes against re-fetching the full lists.
+
+Builds a dataset with seed.py's generator, then simulates a client that stays
+current by polling every few seconds while other users write: between polls
+a handful of enrollments are created or regraded and a course or student
+is edited. Each round times and counts the bytes of one
+/api/changes?since= poll against walking every page of /api/courses,
+/api/students and /api/enrollments, which is what the client did before.
+Finally times the ORM write cycle with and without the change-log listener
+and reports what `flask changes prune` compacts.
+
+    python -m benchmarks.changes --students 5000 --courses 300 --rounds 50
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+from benchmarks.analytics import report, timed
+
+LISTS = ('/api/courses', '/api/students', '/api/enrollments')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--courses', type=int, default=300)
+    parser.add_argument('--semesters', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--writes', type=int, default=10, help='writes between two polls')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'changes.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    import changelog
+    from app import create_app
+    from models import db, Changes, Courses, Enrollments, Students
+    from seed import fresh_database, generate
+    app = create_app()
+
+    with app.app_context():
+        created = generate(fresh_database(database), students=args.students, courses=args.courses,
+                           semesters=args.semesters, seed=args.seed)
+        student_ids = [row.id for row in db.session.query(Students.id)]
+        course_ids = [row.id for row in db.session.query(Courses.id)]
+    print(f'{created["enrollments"]} enrollments, {len(student_ids)} students, {len(course_ids)} courses')
+
+    client = app.test_client()
+    rng = random.Random(args.seed)
+
+    def fetch_all(url):
+        size, pages = 0, 0
+        while url:
+            response = client.get(url)
+            size += len(response.data)
+            pages += 1
+            cursor = response.headers.get('X-Next-Cursor')
+            url = cursor and f'{url.split("?")[0]}?limit=200&after={cursor}'
+        return size, pages
+
+    def write():
+        action = rng.random()
+        if action < 0.5:
+            db.session.add(Enrollments(student_id=rng.choice(student_ids), course_id=rng.choice(course_ids),
+                                       semester=f'bench-{rng.randrange(1000000)}', status='completed'))
+        elif action < 0.8:
+            enrollment = db.session.get(Enrollments, rng.randrange(1, created['enrollments']))
+            if enrollment is not None:
+                enrollment.grade = rng.choice('ABCDF')
+        elif action < 0.9:
+            db.session.get(Courses, rng.choice(course_ids)).description = f'Revised {rng.random()}'
+        else:
+            db.session.get(Students, rng.choice(student_ids)).age += 1
+        db.session.commit()
+
+    with app.app_context():
+        cursor = client.get('/api/changes').json['cursor']
+        poll_bytes, poll_times, full_bytes, full_times, changed = [], [], [], [], 0
+        for _ in range(args.rounds):
+            for _ in range(args.writes):
+                write()
+            started = time.perf_counter()
+            response = client.get(f'/api/changes?since={cursor}&limit=2000')
+            poll_times.append(time.perf_counter() - started)
+            poll_bytes.append(len(response.data))
+            cursor = response.json['cursor']
+            changed += len(response.json['changes'])
+
+            started = time.perf_counter()
+            sizes = [fetch_all(f'{url}?limit=200') for url in LISTS]
+            full_times.append(time.perf_counter() - started)
+            full_bytes.append(sum(size for size, _ in sizes))
+        pages = sum(pages for _, pages in sizes)
+
+        print(f'{args.rounds} rounds of {args.writes} writes, {changed / args.rounds:.1f} changed rows per poll')
+        report('GET /api/changes?since=', poll_times)
+        report(f're-fetch the three lists ({pages} pages)', full_times)
+        print(f'{"bytes per poll, change feed":46} {sum(poll_bytes) / len(poll_bytes):12.0f}')
+        print(f'{"bytes per poll, full lists":46} {sum(full_bytes) / len(full_bytes):12.0f}')
+
+        def cycle():
+            enrollment = Enrollments(student_id=rng.choice(student_ids), course_id=rng.choice(course_ids),
+                                     semester=f'bench-{rng.randrange(1000000)}', status='completed')
+            db.session.add(enrollment)
+            db.session.commit()
+            enrollment.grade = rng.choice('ABCDF')
+            db.session.commit()
+            db.session.delete(enrollment)
+            db.session.commit()
+
+        report('ORM insert + update + delete, with change log', timed(cycle, 300))
+        event.remove(Session, 'after_flush', changelog._record_flush)
+        report('ORM insert + update + delete, without', timed(cycle, 300))
+        event.listen(Session, 'after_flush', changelog._record_flush)
+
+        entries = db.session.query(Changes).count()
+        compacted, expired = changelog.prune(timedelta(days=7))
+        print(f'prune: {entries} entries, {compacted} compacted, {expired} past retention')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Response encodings and compression on the largest endpoints.
+
+Builds a dataset with seed.py's generator, takes the payload of each of the
+largest list endpoints at the maximum page size, and for each one times:
+
+  * the encoders: the stdlib json.dumps flask_restful used before (default
+    separators), stdlib compact, orjson compact and pretty, and MessagePack
+    where it is installed;
+  * the compressors over the orjson body: gzip and deflate at the level
+    representations.py uses and at 9, and brotli (where installed) at the
+    quality it uses and at 11;
+  * whole requests through the test client with each Accept and
+    Accept-Encoding a client might send.
+
+    python -m benchmarks.encoding --students 5000 --courses 300
+"""
+import argparse
+import json
+import os
+import tempfile
+import zlib
+
+from benchmarks.analytics import report, timed
+
+ENDPOINTS = ('/api/enrollments?limit=200', '/api/courses?limit=200', '/api/students?limit=200',
+             '/api/analytics/courses?limit=200', '/api/instructors?limit=200')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--courses', type=int, default=300)
+    parser.add_argument('--semesters', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'encoding.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    # Measure the encoders, not the cache in front of them
+    os.environ['RESPONSE_CACHE'] = 'off'
+
+    import representations
+    from app import create_app
+    from seed import fresh_database, generate
+    app = create_app()
+
+    with app.app_context():
+        generate(fresh_database(database), students=args.students, courses=args.courses,
+                 semesters=args.semesters, seed=args.seed)
+
+    encoders = {
+        'json.dumps (before)': lambda data: json.dumps(data).encode('utf-8'),
+        'json.dumps compact': lambda data: json.dumps(data, separators=(',', ':')).encode('utf-8'),
+        'orjson compact': representations.dumps,
+        'orjson pretty': lambda data: representations.dumps(data, pretty=True),
+    }
+    if representations.msgpack is not None:
+        encoders['msgpack'] = lambda data: representations.msgpack.packb(data, use_bin_type=True)
+
+    def deflater(level, wbits):
+        def compress(body):
+            compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+            return compressor.compress(body) + compressor.flush()
+        return compress
+
+    # The levels representations.py serves; the others are slow references
+    served = {f'gzip {representations.GZIP_LEVEL}', f'deflate {representations.GZIP_LEVEL}',
+              f'br {representations.BROTLI_QUALITY}'}
+    compressors = {
+        f'gzip {representations.GZIP_LEVEL}': lambda body: representations.compress(body, 'gzip'),
+        'gzip 9': deflater(9, 16 + zlib.MAX_WBITS),
+        f'deflate {representations.GZIP_LEVEL}': lambda body: representations.compress(body, 'deflate'),
+    }
+    if representations.brotli is not None:
+        brotli = representations.brotli
+        compressors[f'br {representations.BROTLI_QUALITY}'] = lambda body: representations.compress(body, 'br')
+        compressors['br 11'] = lambda body: brotli.compress(body, quality=11)
+
+    requests = {
+        'json': {},
+        'json, gzip': {'Accept-Encoding': 'gzip'},
+        'json, br': {'Accept-Encoding': 'br, gzip'},
+        'msgpack': {'Accept': representations.MSGPACK},
+        'msgpack, br': {'Accept': representations.MSGPACK, 'Accept-Encoding': 'br, gzip'},
+    }
+    if representations.msgpack is None:
+        requests = {name: headers for name, headers in requests.items() if 'msgpack' not in name}
+    if representations.brotli is None:
+        requests = {name: headers for name, headers in requests.items() if 'br' not in name}
+
+    client = app.test_client()
+    with app.app_context():
+        for url in ENDPOINTS:
+            data = json.loads(client.get(url).data)
+            print(f'\n{url}  ({len(data)} items)')
+            for name, encode in encoders.items():
+                body = encode(data)
+                report(f'  encode {name:22} {len(body):9} bytes', timed(lambda: encode(data), args.repeat))
+            body = representations.dumps(data)
+            for name, compress in compressors.items():
+                repeat = args.repeat if name in served else max(3, args.repeat // 10)
+                report(f'  compress {name:20} {len(compress(body)):9} bytes', timed(lambda: compress(body), repeat))
+            for name, headers in requests.items():
+                size = len(client.get(url, headers=headers).data)
+                report(f'  GET {name:25} {size:9} bytes', timed(lambda: client.get(url, headers=headers), args.repeat))
+
+
+if __name__ == '__main__':
+    main()
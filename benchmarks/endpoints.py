@@ -0,0 +1,407 @@
+"""Benchmark every API route against a generated dataset.
+
+Boots the app in-process on a fresh SQLite file built by seed.generate, then
+for each route and method registered under /api:
+
+  * one sequential pass records SQL statements per request and the peak
+    memory allocated while serving it (tracemalloc);
+  * timed passes at each concurrency level record throughput and
+    p50/p95/p99 latency.
+
+A weighted mix of the read-mostly scenarios then runs at each concurrency
+level. Results are written as JSON; with --baseline the run is compared
+against an earlier result and fails if SQL statements, peak memory, p50
+latency or throughput regressed by more than --threshold (--strict adds
+p95/p99).
+
+    python -m benchmarks.endpoints --save baseline.json
+    python -m benchmarks.endpoints --baseline baseline.json --save current.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from itertools import count
+
+from benchmarks.registration_rush import percentile
+
+SKIPPED_METHODS = {'HEAD', 'OPTIONS'}
+# Absolute slack so tiny numbers don't trip the relative threshold
+SQL_SLACK = 0.5
+MEMORY_SLACK_KB = 64
+LATENCY_SLACK_MS = 1.0
+SEARCH_TERMS = ['math', 'phys', 'topics', 'csc1', 'statistics 10', 'introduction']
+
+
+class Workload:
+    # Ids to aim requests at. Seeded rows are only read and patched; every
+    # DELETE takes a row from a pool created for it, so the dataset seen by
+    # the read scenarios does not shrink between passes.
+
+    def __init__(self, db, models, victims, seed):
+        Users, Students, Instructors, Courses, Enrollments = models
+        self.rng = random.Random(seed)
+        self.unique = count(1)
+        self.users, self.students, self.instructors, self.courses, self.enrollments = (
+            db.session.query(db.func.max(model.id)).scalar() for model in models)
+        rosters = {}
+        for enrollment_id, course_id in db.session.query(Enrollments.id, Enrollments.course_id).filter(
+                Enrollments.status == 'completed').limit(20000):
+            rosters.setdefault(course_id, []).append(enrollment_id)
+        self.rosters = [(course_id, ids) for course_id, ids in rosters.items() if len(ids) >= 10]
+        self.victims = self._victims(db, models, victims)
+        # Where a client polling /api/changes since the start of the run began
+        from changelog import latest_cursor
+        self.changes = latest_cursor()
+
+    def _victims(self, db, models, size):
+        Users, Students, Instructors, Courses, Enrollments = models
+        tag = 'bench'
+        first_user = self.users + 1
+        users = [{'id': first_user + i, 'username': f'{tag}{i}', 'email': f'{tag}{i}@example.com',
+                  'role': 'student'} for i in range(size * 3)]
+        db.session.execute(db.insert(Users), users)
+        students = [{'id': self.students + 1 + i, 'name': f'{tag}{i}', 'age': 20, 'student_id': f'{tag}{i}',
+                     'enrolment_year': 2024, 'user_id': first_user + size + i} for i in range(size)]
+        instructors = [{'id': self.instructors + 1 + i, 'name': f'{tag}{i}', 'specialty': 'Benchmarks',
+                        'user_id': first_user + 2 * size + i} for i in range(size)]
+        courses = [{'id': self.courses + 1 + i, 'title': f'{tag}{i}', 'course_code': f'BN{i}',
+                    'description': 'Benchmark', 'credit_hours': 3, 'max_capacity': 30, 'instructor_id': 1}
+                   for i in range(size)]
+        # Dropped, so deleting them leaves the seat counters alone
+        enrollments = [{'id': self.enrollments + 1 + i, 'student_id': 1 + i % self.students, 'course_id': 1,
+                        'semester': f'BN{i}', 'status': 'dropped'} for i in range(size)]
+        for model, rows in ((Students, students), (Instructors, instructors),
+                            (Courses, courses), (Enrollments, enrollments)):
+            db.session.execute(db.insert(model), rows)
+        db.session.commit()
+        return {
+            'users': deque(row['id'] for row in users[:size]),
+            'students': deque(row['id'] for row in students),
+            'instructors': deque(row['id'] for row in instructors),
+            'courses': deque(row['id'] for row in courses),
+            'enrollments': deque(row['id'] for row in enrollments),
+        }
+
+    def pick(self, kind):
+        return self.rng.randint(1, getattr(self, kind))
+
+    def victim(self, kind):
+        return self.victims[kind].popleft()
+
+    def name(self, prefix):
+        return f'{prefix}{next(self.unique)}'
+
+
+def scenarios(work, semester):
+    # route + method -> (weight in the mixed workload, request factory)
+    def enrollment(student=None):
+        return {'student_id': student or work.pick('students'), 'course_id': work.pick('courses'),
+                'semester': semester}
+
+    def grades():
+        course_id, ids = work.rng.choice(work.rosters)
+        items = [{'enrollment_id': i, 'grade': work.rng.choice('ABCDF')} for i in work.rng.sample(ids, 10)]
+        return {'path': f'/api/courses/{course_id}/grades', 'json': items}
+
+    def import_students():
+        rows = ['username,email,student_id,enrollment_year']
+        for _ in range(10):
+            name = work.name('new-import')
+            rows.append(f'{name},{name}@example.com,{name},2024')
+        return {'path': '/api/import/students', 'data': '\n'.join(rows), 'content_type': 'text/csv'}
+
+    def signup():
+        name = work.name('new-signup')
+        return {'path': '/api/auth/signup', 'json': {'name': name, 'email': f'{name}@example.com', 'password': 'password'}}
+
+    def new_user():
+        name = work.name('new-user')
+        return {'path': '/api/users', 'json': {'username': name, 'email': f'{name}@example.com',
+                                               'password_hash': 'x', 'role': 'student'}}
+
+    def new_student():
+        name = work.name('new-student')
+        return {'path': '/api/students', 'json': {'username': name, 'email': f'{name}@example.com',
+                                                  'student_id': name[-20:], 'enrollment_year': 2024}}
+
+    def new_instructor():
+        name = work.name('new-instructor')
+        return {'path': '/api/instructors', 'json': {'username': name, 'email': f'{name}@example.com',
+                                                     'name': name, 'specialty': 'Benchmarks'}}
+
+    def new_course():
+        code = work.name('N')
+        return {'path': '/api/courses', 'json': {'title': code, 'course_code': code, 'description': 'Benchmark',
+                                                 'credit_hours': 3, 'max_capacity': 30, 'instructor_id': work.pick('instructors')}}
+
+    return {
+        'POST /api/auth/signup': (1, signup),
+        'POST /api/auth/login': (3, lambda: {'path': '/api/auth/login',
+                                             'json': {'email': 'test@example.com', 'password': 'password123'}}),
+        'POST /api/auth/logout': (1, lambda: {'path': '/api/auth/logout'}),
+        'GET /api/users': (2, lambda: {'path': '/api/users'}),
+        'POST /api/users': (0, new_user),
+        'GET /api/users/<int:user_id>': (3, lambda: {'path': f'/api/users/{work.pick("users")}'}),
+        'PATCH /api/users/<int:user_id>': (0, lambda: {'path': f'/api/users/{work.pick("users")}',
+                                                       'json': {'email': f'{work.name("patched")}@example.com'}}),
+        'DELETE /api/users/<int:user_id>': (0, lambda: {'path': f'/api/users/{work.victim("users")}'}),
+        'GET /api/students': (3, lambda: {'path': '/api/students'}),
+        'POST /api/students': (0, new_student),
+        'GET /api/students/<int:student_id>': (8, lambda: {'path': f'/api/students/{work.pick("students")}'}),
+        'PATCH /api/students/<int:student_id>': (1, lambda: {'path': f'/api/students/{work.pick("students")}',
+                                                             'json': {'age': work.rng.randint(18, 30)}}),
+        'DELETE /api/students/<int:student_id>': (0, lambda: {'path': f'/api/students/{work.victim("students")}'}),
+        'GET /api/courses': (15, lambda: {'path': '/api/courses'}),
+        'POST /api/courses': (0, new_course),
+        'GET /api/courses/search': (3, lambda: {'path': f'/api/courses/search?q={work.rng.choice(SEARCH_TERMS)}'}),
+        'GET /api/courses/<int:course_id>': (12, lambda: {'path': f'/api/courses/{work.pick("courses")}'}),
+        'PATCH /api/courses/<int:course_id>': (0, lambda: {'path': f'/api/courses/{work.pick("courses")}',
+                                                           'json': {'description': work.name('Updated ')}}),
+        'DELETE /api/courses/<int:course_id>': (0, lambda: {'path': f'/api/courses/{work.victim("courses")}'}),
+        'GET /api/enrollments': (3, lambda: {'path': '/api/enrollments'}),
+        'POST /api/enrollments': (8, lambda: {'path': '/api/enrollments', 'json': enrollment()}),
+        'POST /api/enrollments/bulk': (1, lambda: {'path': '/api/enrollments/bulk',
+                                                   'json': [enrollment() for _ in range(50)]}),
+        'GET /api/enrollments/<int:enrollment_id>': (3, lambda: {'path': f'/api/enrollments/{work.pick("enrollments")}'}),
+        'PATCH /api/enrollments/<int:enrollment_id>': (0, lambda: {'path': f'/api/enrollments/{work.pick("enrollments")}',
+                                                                   'json': {'grade': work.rng.choice('ABCDF')}}),
+        'DELETE /api/enrollments/<int:enrollment_id>': (0, lambda: {'path': f'/api/enrollments/{work.victim("enrollments")}'}),
+        'GET /api/courses/<int:course_id>/enrollments': (6, lambda: {'path': f'/api/courses/{work.pick("courses")}/enrollments'}),
+        'PATCH /api/courses/<int:course_id>/grades': (1, grades),
+        'GET /api/students/<int:student_id>/enrollments': (12, lambda: {'path': f'/api/students/{work.pick("students")}/enrollments'}),
+        'GET /api/students/<int:student_id>/transcript': (4, lambda: {'path': f'/api/students/{work.pick("students")}/transcript'}),
+        'GET /api/instructors': (2, lambda: {'path': '/api/instructors'}),
+        'POST /api/instructors': (0, new_instructor),
+        'GET /api/instructors/<int:instructor_id>': (2, lambda: {'path': f'/api/instructors/{work.pick("instructors")}'}),
+        'PATCH /api/instructors/<int:instructor_id>': (0, lambda: {'path': f'/api/instructors/{work.pick("instructors")}',
+                                                                   'json': {'specialty': 'Benchmarks'}}),
+        'DELETE /api/instructors/<int:instructor_id>': (0, lambda: {'path': f'/api/instructors/{work.victim("instructors")}'}),
+        'GET /api/instructors/<int:instructor_id>/courses': (4, lambda: {'path': f'/api/instructors/{work.pick("instructors")}/courses'}),
+        'POST /api/import/<string:kind>': (0, import_students),
+        'GET /api/analytics/courses': (1, lambda: {'path': f'/api/analytics/courses?semester={semester}'}),
+        'GET /api/analytics/instructors': (1, lambda: {'path': '/api/analytics/instructors'}),
+        'GET /api/changes': (4, lambda: {'path': f'/api/changes?since={work.changes}&limit=50'}),
+        'GET /api/metrics': (0, lambda: {'path': '/api/metrics'}),
+    }
+
+
+def routes(app):
+    for rule in app.url_map.iter_rules():
+        if rule.rule.startswith('/api/'):
+            for method in sorted(rule.methods - SKIPPED_METHODS):
+                yield f'{method} {rule.rule}'
+
+
+def send(client, name, build):
+    method = name.split(' ', 1)[0]
+    return client.open(method=method, **build())
+
+
+def profile(app, db, name, build, samples):
+    # Sequential, so every statement and allocation belongs to this route
+    from loading import count_queries
+
+    client = app.test_client()
+    send(client, name, build)  # warm up compiled serializers and caches
+    statements = 0
+    # Started and stopped per route, so the peak starts from this baseline
+    # (tracemalloc.reset_peak is 3.9+)
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        with app.app_context(), count_queries() as executed:
+            for _ in range(samples):
+                send(client, name, build)
+        statements = len(executed)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return {'sql_per_request': round(statements / samples, 2), 'peak_kb': round(peak / 1024, 1)}
+
+
+def load(app, pick, requests, concurrency, budget):
+    # pick() returns (route name, request factory) for the next request.
+    # Clients stop early once the time budget is spent, so one slow route
+    # can't stretch the whole run.
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + budget
+
+    def client_loop(n):
+        client = app.test_client()
+        for _ in range(n):
+            if time.perf_counter() > deadline:
+                break
+            name, build = pick()
+            started = time.perf_counter()
+            status = send(client, name, build).status_code
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    share = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    threads = [threading.Thread(target=client_loop, args=(n,)) for n in share if n]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'statuses': {str(status): n for status, n in sorted(statuses.items())},
+    }
+
+
+def worse(current, base, threshold, slack, higher_is_worse=True):
+    if higher_is_worse:
+        return current > base * (1 + threshold) + slack
+    return current < base * (1 - threshold) - slack
+
+
+def compare(results, baseline, threshold, strict=False):
+    # Tail latencies at small sample sizes are noisy, so p95/p99 only gate
+    # the run when asked to
+    percentiles = ('p50_ms', 'p95_ms', 'p99_ms') if strict else ('p50_ms',)
+    regressions = []
+
+    def check(label, current, base, slack, higher_is_worse=True):
+        if worse(current, base, threshold, slack, higher_is_worse):
+            regressions.append(f'{label}: {base} -> {current}')
+
+    sections = dict(results['endpoints'])
+    sections['mix'] = results['mix']
+    base_sections = dict(baseline['endpoints'])
+    base_sections['mix'] = baseline.get('mix', {})
+    for name, current in sections.items():
+        base = base_sections.get(name)
+        if not base:
+            continue
+        if 'sql_per_request' in base:
+            check(f'{name} sql/request', current['sql_per_request'], base['sql_per_request'], SQL_SLACK)
+            check(f'{name} peak KB', current['peak_kb'], base['peak_kb'], MEMORY_SLACK_KB)
+        for level, run in current.get('concurrency', {}).items():
+            base_run = base.get('concurrency', {}).get(level)
+            if base_run:
+                for key in percentiles:
+                    check(f'{name} c={level} {key}', run[key], base_run[key], LATENCY_SLACK_MS)
+                check(f'{name} c={level} req/s', run['throughput'], base_run['throughput'], 0, higher_is_worse=False)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--courses', type=int, default=100)
+    parser.add_argument('--semesters', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=40, help='per route and concurrency level')
+    parser.add_argument('--mix-requests', type=int, default=400)
+    parser.add_argument('--profile-requests', type=int, default=5)
+    parser.add_argument('--concurrency', default='1,8', help='comma-separated levels')
+    parser.add_argument('--budget', type=float, default=5, help='seconds per timed pass (four times that for the mix)')
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    parser.add_argument('--only', help='only routes containing this text')
+    parser.add_argument('--save', help='write results JSON here')
+    parser.add_argument('--baseline', help='compare against this results JSON')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression')
+    parser.add_argument('--strict', action='store_true', help='also fail on p95/p99 regressions')
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(args.bcrypt_rounds)
+    database = os.path.join(tempfile.mkdtemp(), 'endpoints.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    import seed
+    from app import create_app
+    from models import db, Users, Students, Instructors, Courses, Enrollments
+    app = create_app()
+
+    models = (Users, Students, Instructors, Courses, Enrollments)
+    started = time.perf_counter()
+    with app.app_context():
+        dataset = seed.generate(seed.fresh_database(database), students=args.students, courses=args.courses,
+                                semesters=args.semesters, seed=args.seed)
+        deletes = args.profile_requests + 1 + args.requests * len(levels)
+        work = Workload(db, models, deletes, args.seed)
+        semester = seed.semester_calendar(2023, args.semesters)[-1][0]
+    print(f'dataset: {dataset} in {time.perf_counter() - started:.1f}s')
+
+    table = scenarios(work, semester)
+    registered = list(routes(app))
+    missing = [name for name in registered if name not in table]
+    if missing:
+        raise SystemExit('No benchmark scenario for: ' + ', '.join(missing))
+    selected = [name for name in registered if not args.only or args.only in name]
+
+    results = {
+        'meta': {
+            'revision': git_revision(), 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+            'cpus': os.cpu_count(), 'dataset': dataset, 'args': vars(args),
+        },
+        'endpoints': {},
+    }
+    for name in selected:
+        build = table[name][1]
+        entry = profile(app, db, name, build, args.profile_requests)
+        entry['concurrency'] = {str(level): load(app, lambda: (name, build), args.requests, level, args.budget) for level in levels}
+        results['endpoints'][name] = entry
+        runs = ' '.join(f'c={level} {run["throughput"]:.0f}/s p95 {run["p95_ms"]:.1f}ms'
+                        for level, run in entry['concurrency'].items())
+        failed = sum(n for run in entry['concurrency'].values()
+                     for status, n in run['statuses'].items() if int(status) >= 400)
+        print(f'{name:52} sql {entry["sql_per_request"]:6.1f}  peak {entry["peak_kb"]:8.1f}KB  {runs}'
+              + (f'  ({failed} 4xx/5xx)' if failed else ''))
+
+    mix = [(name, table[name][1]) for name in selected if table[name][0]]
+    weights = [table[name][0] for name, _ in mix]
+    results['mix'] = {}
+    if mix:
+        rng = random.Random(args.seed)
+        pick = lambda: rng.choices(mix, weights)[0]
+        results['mix'] = {'concurrency': {str(level): load(app, pick, args.mix_requests, level, args.budget * 4) for level in levels}}
+        for level, run in results['mix']['concurrency'].items():
+            print(f'{"mix":52} c={level} {run["throughput"]:.0f}/s p50 {run["p50_ms"]:.1f}ms '
+                  f'p95 {run["p95_ms"]:.1f}ms p99 {run["p99_ms"]:.1f}ms {run["statuses"]}')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'saved {args.save}')
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.strict)
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {args.threshold:.0%}:')
+            for line in regressions:
+                print('  ' + line)
+            raise SystemExit(1)
+        print(f'no regressions beyond {args.threshold:.0%} against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Compare database engine profiles under concurrent reads and writes.
+
+Each profile runs in --processes worker processes against a copy of the same
+generated SQLite file (or against --postgres-url for the postgresql profile). Writer
+clients PATCH students and POST enrollments one at a time with group commit
+disabled, so every request takes the write lock itself, while reader
+clients fetch courses. Reports throughput, latency and how many requests
+failed with "database is locked".
+
+    python -m benchmarks.engine_profiles
+    python -m benchmarks.engine_profiles --postgres-url postgresql://localhost/coursehub_bench
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from benchmarks.registration_rush import percentile
+
+
+def run_profile(args):
+    os.environ['DATABASE_PROFILE'] = args.profile
+    os.environ['DATABASE_URL'] = args.url
+    from app import create_app
+    app = create_app()
+    app.config['ENROLLMENT_BATCH_SIZE'] = 1
+    rng = random.Random(args.seed)
+    latencies = {'read': [], 'write': []}
+    statuses = Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def write(client):
+        if rng.random() < 0.5:
+            return client.patch(f'/api/students/{rng.randint(1, args.students)}', json={'age': rng.randint(18, 30)})
+        return client.post('/api/enrollments', json={'student_id': rng.randint(1, args.students),
+                                                     'course_id': rng.randint(1, args.courses), 'semester': 'Profile'})
+
+    def read(client):
+        return client.get(f'/api/courses/{rng.randint(1, args.courses)}?fields=id,title,enrolled_count')
+
+    def client_loop(kind, request):
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = request(client)
+            elapsed = time.perf_counter() - started
+            body = response.get_data(as_text=True)
+            with lock:
+                latencies[kind].append(elapsed)
+                statuses[response.status_code] += 1
+                if 'locked' in body:
+                    statuses['locked'] += 1
+
+    threads = ([threading.Thread(target=client_loop, args=('write', write)) for _ in range(args.writers)]
+               + [threading.Thread(target=client_loop, args=('read', read)) for _ in range(args.readers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = {'profile': args.profile, 'statuses': {str(k): v for k, v in statuses.items()}}
+    for kind, samples in latencies.items():
+        result[kind] = {
+            'requests': len(samples),
+            'throughput': round(len(samples) / args.seconds, 1),
+            'p50_ms': round(percentile(samples, 50) * 1000, 2) if samples else None,
+            'p99_ms': round(percentile(samples, 99) * 1000, 2) if samples else None,
+        }
+    print(json.dumps(result))
+
+
+def combine(results):
+    # Throughput adds up across processes; latency is the worst process's
+    combined = {'statuses': Counter()}
+    for result in results:
+        combined['statuses'].update(result['statuses'])
+    for kind in ('write', 'read'):
+        runs = [result[kind] for result in results if result[kind]['requests']]
+        combined[kind] = {
+            'throughput': round(sum(run['throughput'] for run in runs), 1),
+            'p50_ms': max((run['p50_ms'] for run in runs), default=None),
+            'p99_ms': max((run['p99_ms'] for run in runs), default=None),
+        }
+    return combined
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', default='default,sqlite', help='comma-separated DATABASE_PROFILE values')
+    parser.add_argument('--postgres-url', help='also run the postgresql profile against this (empty) database')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--courses', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=2, help='worker processes per profile')
+    parser.add_argument('--writers', type=int, default=8, help='writer threads per process')
+    parser.add_argument('--readers', type=int, default=8, help='reader threads per process')
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--profile', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        return run_profile(args)
+
+    workdir = tempfile.mkdtemp()
+    template = os.path.join(workdir, 'template.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{template}')
+    subprocess.run([sys.executable, 'seed.py', '--students', str(args.students), '--courses', str(args.courses),
+                    '--seed', str(args.seed), '--output', template], env=env, check=True, capture_output=True)
+
+    runs = [(profile, None) for profile in args.profiles.split(',')]
+    if args.postgres_url:
+        runs.append(('postgresql', args.postgres_url))
+    common = ['--students', str(args.students), '--courses', str(args.courses), '--writers', str(args.writers),
+              '--readers', str(args.readers), '--seconds', str(args.seconds), '--seed', str(args.seed)]
+    for profile, url in runs:
+        if url is None:
+            path = os.path.join(workdir, f'{profile}.db')
+            shutil.copy(template, path)
+            url = f'sqlite:///{path}'
+        else:
+            engine_env = dict(os.environ, DATABASE_URL=url)
+            subprocess.run([sys.executable, 'seed.py', '--students', str(args.students), '--courses', str(args.courses),
+                            '--seed', str(args.seed)], env=engine_env, check=True, capture_output=True)
+        # Several worker processes, as a multi-worker server would run
+        workers = [subprocess.Popen([sys.executable, '-m', 'benchmarks.engine_profiles', '--profile', profile,
+                                     '--url', url] + common, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                   for _ in range(args.processes)]
+        results = [json.loads(worker.communicate()[0].strip().splitlines()[-1]) for worker in workers]
+        result = combine(results)
+        write, read = result['write'], result['read']
+        print(f'{profile:10} writes {write["throughput"]:6.1f}/s p50 {write["p50_ms"]}ms p99 {write["p99_ms"]}ms | '
+              f'reads {read["throughput"]:6.1f}/s p50 {read["p50_ms"]}ms p99 {read["p99_ms"]}ms | '
+              f'locked {result["statuses"].get("locked", 0)} | {result["statuses"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Start-of-term login load test for POST /api/auth/login.
+
+Concurrent clients log in while a second group keeps reading /api/courses,
+showing how bcrypt affects login latency and everything queued behind it.
+--inline hashes on the request thread, as the API used to, for comparison.
+
+    python -m benchmarks.login_load --clients 32 --logins 400
+    python -m benchmarks.login_load --clients 32 --logins 400 --inline
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import passwords
+from benchmarks.registration_rush import percentile
+
+
+class InlineHasher:
+    def __init__(self, rounds):
+        self.rounds = rounds
+
+    def hash(self, password):
+        return passwords.hash_password(password, self.rounds)
+
+    def verify(self, password, hashed):
+        return passwords.check_password(password, hashed)
+
+    def needs_rehash(self, hashed):
+        return passwords.hash_rounds(hashed) != self.rounds
+
+
+def summary(name, samples):
+    return (f'{name}: {len(samples)} requests, p50 {statistics.median(samples) * 1000:.1f} ms, '
+            f'p95 {percentile(samples, 95) * 1000:.1f} ms, p99 {percentile(samples, 99) * 1000:.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--readers', type=int, default=4, help='clients reading /api/courses meanwhile')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--workers', type=int, help='hashing processes (default: one per CPU)')
+    parser.add_argument('--inline', action='store_true', help='hash on the request thread')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'login.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    from app import create_app
+    from models import db, Users, Instructors, Courses
+    app = create_app()
+    app.config['BCRYPT_LOG_ROUNDS'] = args.rounds
+    app.config['PASSWORD_WORKERS'] = args.workers
+    app.config['PASSWORD_MAX_PENDING'] = args.clients
+    app.config['PASSWORD_QUEUE_TIMEOUT'] = 30
+    if args.inline:
+        inline = InlineHasher(args.rounds)
+        passwords.get_hasher = lambda: inline
+
+    password_hash = passwords.hash_password('password', args.rounds)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Users), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'role': 'student',
+             'password_hash': password_hash}
+            for i in range(1, args.users + 1)
+        ])
+        db.session.execute(db.insert(Instructors), [{'id': 1, 'name': 'Instructor', 'specialty': 'Load', 'user_id': 1}])
+        db.session.execute(db.insert(Courses), [
+            {'id': i, 'title': f'Course {i}', 'course_code': f'C{i}', 'description': 'Load', 'credit_hours': 3,
+             'max_capacity': 30, 'instructor_id': 1}
+            for i in range(1, 51)
+        ])
+        db.session.commit()
+        # Start the pool before timing anything
+        passwords.get_hasher().verify('password', password_hash)
+
+    logins, reads = [], []
+    statuses = Counter()
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def login_loop(users):
+        client = app.test_client()
+        for user in users:
+            started = time.perf_counter()
+            status = client.post('/api/auth/login', json={'email': f'user{user}@example.com', 'password': 'password'}).status_code
+            elapsed = time.perf_counter() - started
+            with lock:
+                logins.append(elapsed)
+                statuses[status] += 1
+
+    def read_loop():
+        client = app.test_client()
+        while not done.is_set():
+            started = time.perf_counter()
+            client.get('/api/courses?limit=20')
+            with lock:
+                reads.append(time.perf_counter() - started)
+
+    work = [1 + i % args.users for i in range(args.logins)]
+    threads = [threading.Thread(target=login_loop, args=(work[i::args.clients],)) for i in range(args.clients)]
+    readers = [threading.Thread(target=read_loop) for _ in range(args.readers)]
+    started = time.perf_counter()
+    for thread in threads + readers:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    mode = 'inline' if args.inline else 'process pool'
+    print(f'{args.logins} logins from {args.clients} clients in {elapsed:.2f}s '
+          f'({args.logins / elapsed:.1f} logins/s, bcrypt cost {args.rounds}, {mode})')
+    print(summary('login', logins))
+    if reads:
+        print(summary('courses', reads))
+    print('responses:', ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items())))
+
+
+if __name__ == '__main__':
+    main()
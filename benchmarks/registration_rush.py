@@ -0,0 +1,106 @@
+"""Registration-day load test for POST /api/enrollments.
+
+Hundreds of concurrent clients enroll random students into a handful of small
+courses. Reports throughput and latency, then fails if any course is overbooked
+or its seat counter disagrees with its enrollment rows.
+
+    python -m benchmarks.registration_rush --clients 300 --requests 6000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=300)
+    parser.add_argument('--requests', type=int, default=6000)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--courses', type=int, default=20)
+    parser.add_argument('--capacity', type=int, default=150)
+    parser.add_argument('--batch-size', type=int, default=64, help='1 disables group commit')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'rush.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    from app import create_app
+    from models import db, Users, Students, Instructors, Courses, Enrollments
+    app = create_app()
+    app.config['ENROLLMENT_BATCH_SIZE'] = args.batch_size
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Users), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'role': 'student'}
+            for i in range(1, args.students + 2)
+        ])
+        db.session.execute(db.insert(Instructors), [{'id': 1, 'name': 'Instructor', 'specialty': 'Load', 'user_id': args.students + 1}])
+        db.session.execute(db.insert(Students), [
+            {'id': i, 'name': f'student{i}', 'age': 20, 'student_id': f'S{i}', 'enrolment_year': 2024, 'user_id': i}
+            for i in range(1, args.students + 1)
+        ])
+        db.session.execute(db.insert(Courses), [
+            {'id': i, 'title': f'Course {i}', 'course_code': f'C{i}', 'description': 'Rush', 'credit_hours': 3,
+             'max_capacity': args.capacity, 'instructor_id': 1}
+            for i in range(1, args.courses + 1)
+        ])
+        db.session.commit()
+
+    rng = random.Random(42)
+    work = [{'student_id': rng.randint(1, args.students), 'course_id': rng.randint(1, args.courses), 'semester': 'rush'}
+            for _ in range(args.requests)]
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def client_loop(items):
+        client = app.test_client()
+        for payload in items:
+            started = time.perf_counter()
+            status = client.post('/api/enrollments', json=payload).status_code
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    threads = [threading.Thread(target=client_loop, args=(work[i::args.clients],)) for i in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f'{args.requests} requests from {args.clients} clients in {elapsed:.2f}s '
+          f'({args.requests / elapsed:.0f} req/s, batch size {args.batch_size})')
+    print(f'latency p50 {statistics.median(latencies) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms')
+    print('responses:', ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items())))
+
+    with app.app_context():
+        rows = db.session.execute(
+            db.select(Courses.id, Courses.enrolled_count, Courses.max_capacity,
+                      db.select(db.func.count(Enrollments.id))
+                      .where(Enrollments.course_id == Courses.id, Enrollments.status == 'enrolled')
+                      .scalar_subquery())
+        ).all()
+    overbooked = [row for row in rows if row[3] > row[2] or row[1] != row[3]]
+    seats = sum(row[3] for row in rows)
+    print(f'{seats} seats filled of {args.courses * args.capacity}; created responses: {statuses[201]}')
+    if overbooked or seats != statuses[201]:
+        print('OVERBOOKED or inconsistent:', overbooked)
+        raise SystemExit(1)
+    print('no overbooking')
+
+
+if __name__ == '__main__':
+    main()
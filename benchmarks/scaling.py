@@ -0,0 +1,195 @@
+"""Throughput of serve.py as worker processes are added.
+
+Builds a dataset with seed.py's generator and a fixed list of GET requests
+drawn from the read-mostly mix in benchmarks/endpoints.py, then for each
+server configuration starts the server on a free port, warms it up and
+drives it over real HTTP from --load-processes client processes holding
+--connections connections between them:
+
+  * `python app.py`, the threaded single-process development server it
+    replaces, as the baseline;
+  * serve.py with each of --workers worker processes of --threads threads.
+
+Reports requests per second, p50/p95/p99 latency, failures and the speedup
+over one serve.py worker. The client processes run on the same CPUs as the
+server, so the curve flattens before the core count; RESPONSE_CACHE is off
+by default so every request does its full work.
+
+    python -m benchmarks.scaling --workers 1,2,4,8 --threads 4 --duration 10
+"""
+import argparse
+import http.client
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from urllib.parse import quote
+
+from benchmarks.registration_rush import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = 5000
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_ready(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def drive(port, paths, connections, start, stop, seed):
+    # One client process: `connections` threads, each sending requests back
+    # to back. Only requests sent between start and stop are recorded.
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+
+    def loop(offset):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        index = offset
+        while time.time() < stop:
+            path = paths[index % len(paths)]
+            index += 1
+            sent = time.time()
+            began = time.perf_counter()
+            try:
+                connection.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = 'error'
+            elapsed = time.perf_counter() - began
+            if sent >= start:
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[status] += 1
+
+    rng = random.Random(seed)
+    threads = [threading.Thread(target=loop, args=(rng.randrange(len(paths)),)) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses
+
+
+def measure(port, paths, args):
+    start = time.time() + args.warmup
+    stop = start + args.duration
+    share = [args.connections // args.load_processes + (i < args.connections % args.load_processes)
+             for i in range(args.load_processes)]
+    latencies, statuses = [], Counter()
+    with ProcessPoolExecutor(args.load_processes, mp_context=get_context('fork')) as pool:
+        futures = [pool.submit(drive, port, paths, n, start, stop, args.seed + i) for i, n in enumerate(share) if n]
+        for future in futures:
+            samples, counts = future.result()
+            latencies += samples
+            statuses += counts
+    return {
+        'throughput': len(latencies) / args.duration,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'failed': sum(n for status, n in statuses.items() if status == 'error' or status >= 500),
+    }
+
+
+def run(label, command, env, paths, args):
+    port = free_port()
+    process = subprocess.Popen(command(port), cwd=ROOT, env=dict(env, PORT=str(port)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_ready(port, process):
+            raise SystemExit(f'{label} did not start')
+        return measure(port, paths, args)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(args.warmup + args.duration + 30)
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--courses', type=int, default=100)
+    parser.add_argument('--semesters', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', default=','.join(str(2 ** i) for i in range(cpus.bit_length()) if 2 ** i <= cpus),
+                        help='comma-separated worker counts (default: powers of two up to the CPU count)')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--connections', type=int, default=32, help='concurrent client connections')
+    parser.add_argument('--load-processes', type=int, default=max(1, cpus // 2), help='client processes')
+    parser.add_argument('--duration', type=float, default=10, help='seconds measured per configuration')
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--response-cache', default='off', choices=('off', 'memory', 'sqlite'))
+    parser.add_argument('--no-baseline', action='store_true', help='skip the app.py development server')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'scaling.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', RESPONSE_CACHE=args.response_cache)
+    os.environ.update(env)
+
+    import seed
+    from app import create_app
+    from benchmarks.endpoints import Workload, scenarios
+    from models import db, Users, Students, Instructors, Courses, Enrollments
+    app = create_app()
+
+    with app.app_context():
+        dataset = seed.generate(seed.fresh_database(database), students=args.students, courses=args.courses,
+                                semesters=args.semesters, seed=args.seed)
+        work = Workload(db, (Users, Students, Instructors, Courses, Enrollments), 1, args.seed)
+        semester = seed.semester_calendar(2023, args.semesters)[-1][0]
+        db.session.remove()
+        db.engine.dispose()
+    # GETs only, so every configuration reads the same data
+    mix = [(build, weight) for name, (weight, build) in scenarios(work, semester).items()
+           if name.startswith('GET ') and weight]
+    builds, weights = zip(*mix)
+    # The test client quotes paths itself; http.client does not
+    paths = [quote(build()['path'], safe='/?=&') for build in work.rng.choices(builds, weights, k=PATHS)]
+    print(f'dataset: {dataset}; {cpus} CPUs, {args.connections} connections from {args.load_processes} '
+          f'client processes, {args.duration:.0f}s per configuration')
+
+    configurations = []
+    if not args.no_baseline:
+        configurations.append(('app.py (development server)', lambda port: [sys.executable, 'app.py']))
+    for workers in (int(n) for n in args.workers.split(',')):
+        configurations.append((f'serve.py {workers} workers x {args.threads} threads',
+                               lambda port, workers=workers: [sys.executable, 'serve.py', '--bind', f'127.0.0.1:{port}',
+                                                              '--workers', str(workers), '--threads', str(args.threads)]))
+
+    single = None
+    for label, command in configurations:
+        result = run(label, command, env, paths, args)
+        if single is None and label.startswith('serve.py'):
+            single = result['throughput']
+        speedup = f'x{result["throughput"] / single:.2f}' if single and label.startswith('serve.py') else ''
+        print(f'{label:38} {result["throughput"]:8.0f} req/s  p50 {result["p50_ms"]:7.1f}ms  '
+              f'p95 {result["p95_ms"]:7.1f}ms  p99 {result["p99_ms"]:7.1f}ms  {result["failed"]:4} failed  {speedup}')
+
+
+if __name__ == '__main__':
+    main()
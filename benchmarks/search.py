@@ -0,0 +1,97 @@
+"""Latency of GET /api/courses/search on a large generated catalog.
+
+Builds a catalog with seed.py's generator, then times each query both as the
+ranked id lookup alone and as a full request through the app. Exits non-zero
+if any query's p95 lookup time exceeds --budget-ms, or if its results are
+not the best-scoring of all its matches.
+
+    python -m benchmarks.search --courses 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.registration_rush import percentile
+
+QUERIES = [
+    'mathematics',        # one subject: a twelfth of the catalog
+    'phys',               # prefix of a subject
+    'p',                  # one-letter prefix: most of the catalog
+    'topics',             # in almost every description
+    'statistics 14',      # subject and level prefix
+    'csc4',               # course code prefix
+    'introduction chem',  # the few introductory courses
+    'zzzz',               # no matches
+]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=100000)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'search.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    from sqlalchemy import text
+
+    import search
+    from app import create_app
+    from models import db
+    from seed import fresh_database, generate
+    app = create_app()
+
+    started = time.perf_counter()
+    with app.app_context():
+        created = generate(fresh_database(database), students=args.students, courses=args.courses,
+                           instructors=max(5, args.courses // 50), semesters=2, seed=args.seed)
+    print(f'catalog: {created["courses"]} courses in {time.perf_counter() - started:.1f}s')
+
+    def best_of_all_matches(terms):
+        # Every match scored and sorted here, to check the lookup ranks them all
+        query = ' '.join(f'"{term}"*' for term in terms)
+        rows = db.session.execute(text(
+            f'SELECT rowid, bm25(courses_fts, {", ".join(map(str, search.WEIGHTS))}) '
+            'FROM courses_fts WHERE courses_fts MATCH :query'), {'query': query}).all()
+        return len(rows), [row_id for row_id, _ in sorted(rows, key=lambda row: (row[1], row[0]))[:args.limit]]
+
+    client = app.test_client()
+    failures = 0
+    print(f'{"query":22} {"matches":>8} {"lookup p50":>10} {"p95":>8} {"request p50":>12} {"p95":>8}  results')
+    for query in QUERIES:
+        terms = search.TOKEN.findall(query)
+        with app.test_request_context():
+            ids, lookups = timed(lambda: search.ranked_course_ids(terms, args.limit), args.repeat)
+            matches, best = best_of_all_matches(terms)
+            if ids != best:
+                print(f'{query}: results are not the best-scoring matches')
+                failures += 1
+        response, requests = timed(
+            lambda: client.get('/api/courses/search', query_string={'q': query, 'limit': args.limit}), args.repeat)
+        assert response.status_code == 200 and len(response.get_json()) == len(ids)
+        p95 = percentile(lookups, 95) * 1000
+        failures += p95 > args.budget_ms
+        print(f'{query:22} {matches:8} {percentile(lookups, 50) * 1000:8.2f}ms {p95:6.2f}ms '
+              f'{percentile(requests, 50) * 1000:10.2f}ms {percentile(requests, 95) * 1000:6.2f}ms  {len(ids)}'
+              f'{"  OVER BUDGET" if p95 > args.budget_ms else ""}')
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Compare SerializerMixin.to_dict with the compiled serializers.
+
+Run against any database with: DATABASE_URL=sqlite:///path.db python -m benchmarks.serialization
+"""
+import argparse
+import timeit
+
+from app import create_app
+import resources
+from serializers import to_dict
+app = create_app()
+
+ENDPOINTS = ('/api/courses', '/api/enrollments')
+
+
+def mixin_to_dict(obj):
+    return obj.to_dict()
+
+
+def time_endpoint(client, url, repeat):
+    client.get(url)  # warm up
+    return min(timeit.repeat(lambda: client.get(url), number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=200)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    print(f'{"endpoint":<20} {"rows":>5} {"to_dict":>12} {"compiled":>12} {"speedup":>8}')
+    for endpoint in ENDPOINTS:
+        url = f'{endpoint}?limit={args.limit}'
+        rows = len(client.get(url).get_json())
+
+        resources.to_dict = mixin_to_dict
+        try:
+            mixin = time_endpoint(client, url, args.repeat)
+        finally:
+            resources.to_dict = to_dict
+        compiled = time_endpoint(client, url, args.repeat)
+
+        print(f'{endpoint:<20} {rows:>5} {mixin * 1000:>9.2f} ms {compiled * 1000:>9.2f} ms {mixin / compiled:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
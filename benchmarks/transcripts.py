@@ -0,0 +1,99 @@
+"""GET /api/students/<id>/transcript against computing GPA from enrollments.
+
+Builds a dataset with long student histories using seed.py's generator, then
+times the transcript endpoint, which reads the per-semester totals in
+transcript_terms, against the page-view computation it replaces: loading
+every enrollment of the student with its course and mapping grades to
+points. Then times grade changes through PATCH /api/enrollments/<id> with and
+without the transcript events, and fails if any total has drifted.
+
+    python -m benchmarks.transcripts --students 20000 --semesters 12
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from benchmarks.analytics import report, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--courses', type=int, default=500)
+    parser.add_argument('--semesters', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'transcripts.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    from sqlalchemy import event, func
+    from sqlalchemy.orm import joinedload
+
+    import transcripts
+    from analytics import GRADE_POINTS
+    from app import create_app
+    from models import db, Enrollments
+    from seed import fresh_database, generate
+    app = create_app()
+
+    with app.app_context():
+        created = generate(fresh_database(database), students=args.students, courses=args.courses,
+                           semesters=args.semesters, seed=args.seed)
+        # The students with the longest histories, where the old way hurt most
+        busiest = db.session.query(Enrollments.student_id, func.count()).group_by(Enrollments.student_id) \
+            .order_by(func.count().desc()).limit(200).all()
+        enrollment_ids = [row.id for row in db.session.query(Enrollments.id).filter(Enrollments.status == 'completed')]
+    print(f'{created["enrollments"]} enrollments; the 200 busiest students have '
+          f'{busiest[-1][1]} to {busiest[0][1]} each')
+    busiest = [student_id for student_id, _ in busiest]
+
+    def from_enrollments(student_id):
+        totals = {}
+        enrollments = (Enrollments.query.options(joinedload(Enrollments.course))
+                       .filter(Enrollments.student_id == student_id, Enrollments.status != 'dropped').all())
+        for enrollment in enrollments:
+            term = totals.setdefault(enrollment.semester, {'hours': 0, 'points': 0})
+            if enrollment.grade in GRADE_POINTS:
+                term['hours'] += enrollment.course.credit_hours
+                term['points'] += GRADE_POINTS[enrollment.grade] * enrollment.course.credit_hours
+        return {semester: term['points'] / term['hours'] if term['hours'] else None for semester, term in totals.items()}
+
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    with app.app_context():
+        report('GET /api/students/<id>/transcript',
+               timed(lambda: client.get(f'/api/students/{rng.choice(busiest)}/transcript'), args.repeat))
+        report('  transcript totals from transcript_terms',
+               timed(lambda: transcripts.transcript(rng.choice(busiest)), args.repeat))
+        report('  GPA from enrollments + courses',
+               timed(lambda: from_enrollments(rng.choice(busiest)), args.repeat))
+
+        def regrade():
+            client.patch(f'/api/enrollments/{rng.choice(enrollment_ids)}', json={'grade': rng.choice('ABCDF')})
+
+        report('PATCH enrollment grade, with transcripts', timed(regrade, args.repeat))
+        listeners = [(Enrollments, 'after_insert', transcripts._enrollment_inserted),
+                     (Enrollments, 'after_update', transcripts._enrollment_updated),
+                     (Enrollments, 'after_delete', transcripts._enrollment_deleted)]
+        for listener in listeners:
+            event.remove(*listener)
+        report('PATCH enrollment grade, without transcripts', timed(regrade, args.repeat))
+        for listener in listeners:
+            event.listen(*listener)
+        # The unmaintained regrades above left drift; repair it, then check
+        # the maintained path from a clean state
+        transcripts.rebuild_transcripts(db.session.connection())
+        db.session.commit()
+        timed(regrade, args.repeat)
+
+        drift = transcripts.check_transcripts()
+        if drift:
+            raise SystemExit(f'transcripts drifted: {drift[:5]}')
+        print('transcripts are consistent')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+from collections import Counter, defaultdict
+
+from sqlalchemy import bindparam, select, tuple_, update
+
+import changelog
+from models import Students, Courses, Enrollments
+from counters import ENROLLED, release_seats, seat_deltas, take_available_seats, take_seats
+from registration import enrollment_fact, enrollment_values, insert_ignoring_duplicates
+from summaries import apply_summary_deltas, summary_key
+from transcripts import apply_enrollment_changes
+
+MAX_BATCH = 1000
+STATUSES = ('enrolled', 'completed', 'dropped')
+
+CREATED = 'created'
+UPDATED = 'updated'
+DUPLICATE = 'duplicate'
+FULL = 'full'
+NOT_FOUND = 'not_found'
+
+
+class BatchError(ValueError):
+    def __init__(self, errors):
+        super().__init__('Invalid batch')
+        self.errors = errors
+
+
+def _validate(items, parse):
+    if not isinstance(items, list) or not items:
+        raise BatchError([{'error': 'Expected a non-empty JSON array'}])
+    if len(items) > MAX_BATCH:
+        raise BatchError([{'error': f'At most {MAX_BATCH} items per batch'}])
+
+    parsed, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            parsed.append(parse(item))
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            errors.append({'index': index, 'error': f'Invalid item: {e}'})
+    if errors:
+        raise BatchError(errors)
+    return parsed
+
+
+def enroll_many(connection, items):
+    # The whole batch is validated before anything is written. Rows then go
+    # in with one multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING;
+    # missing references, duplicates and full courses become per-item results.
+    rows = _validate(items, enrollment_values)
+    results = [None] * len(rows)
+
+    students = set(connection.execute(
+        select(Students.id).where(Students.id.in_({row['student_id'] for row in rows}))).scalars())
+    courses = set(connection.execute(
+        select(Courses.id).where(Courses.id.in_({row['course_id'] for row in rows}))).scalars())
+    keys = [(row['student_id'], row['course_id'], row['semester']) for row in rows]
+    existing = set(connection.execute(
+        select(Enrollments.student_id, Enrollments.course_id, Enrollments.semester)
+        .where(tuple_(Enrollments.student_id, Enrollments.course_id, Enrollments.semester).in_(set(keys)))
+    ).tuples())
+
+    seen = set()
+    wanted = defaultdict(list)
+    for index, (row, key) in enumerate(zip(rows, keys)):
+        if row['student_id'] not in students:
+            results[index] = {'index': index, 'status': NOT_FOUND, 'error': 'Student not found'}
+        elif row['course_id'] not in courses:
+            results[index] = {'index': index, 'status': NOT_FOUND, 'error': 'Course not found'}
+        elif key in existing or key in seen:
+            results[index] = {'index': index, 'status': DUPLICATE, 'error': 'Already enrolled for this semester'}
+        else:
+            seen.add(key)
+            if row['status'] == ENROLLED:
+                wanted[row['course_id']].append(index)
+
+    # Seats are granted in batch order, one conditional UPDATE per course
+    for course_id, indexes in wanted.items():
+        granted = take_available_seats(connection, course_id, len(indexes))
+        for index in indexes[granted:]:
+            results[index] = {'index': index, 'status': FULL, 'error': 'Course is full'}
+
+    pending = [index for index, result in enumerate(results) if result is None]
+    if pending:
+        inserted = {
+            (student_id, course_id, semester): enrollment_id
+            for enrollment_id, student_id, course_id, semester in connection.execute(
+                insert_ignoring_duplicates(connection).returning(
+                    Enrollments.id, Enrollments.student_id, Enrollments.course_id, Enrollments.semester),
+                [rows[index] for index in pending],
+            )
+        }
+        released, summary, changes = Counter(), Counter(), []
+        for index in pending:
+            enrollment_id = inserted.get(keys[index])
+            if enrollment_id is None:
+                # Lost a race with a concurrent writer; hand the seat back
+                if rows[index]['status'] == ENROLLED:
+                    released[rows[index]['course_id']] += 1
+                results[index] = {'index': index, 'status': DUPLICATE, 'error': 'Already enrolled for this semester'}
+            else:
+                row = rows[index]
+                summary[summary_key(row['course_id'], row['semester'], row['status'], row['grade'])] += 1
+                changes.append((None, enrollment_fact(row)))
+                results[index] = {'index': index, 'status': CREATED, 'id': enrollment_id}
+        for course_id, count in released.items():
+            release_seats(connection, course_id, count)
+        apply_summary_deltas(connection, summary)
+        apply_enrollment_changes(connection, changes)
+        changelog.record(connection, Enrollments.__tablename__, inserted.values(), changelog.INSERT)
+
+    return results
+
+
+def _grade_values(item):
+    grade = item.get('grade')
+    if grade is not None and (not isinstance(grade, str) or len(grade) > 3):
+        raise ValueError('grade must be a string of at most 3 characters')
+    status = item.get('status')
+    if status is not None and status not in STATUSES:
+        raise ValueError(f'status must be one of {", ".join(STATUSES)}')
+    if item.get('enrollment_id') is not None:
+        key = ('id', int(item['enrollment_id']))
+    else:
+        key = ('student', int(item['student_id']), str(item['semester']))
+    return {'key': key, 'grade': grade, 'has_grade': 'grade' in item, 'status': status}
+
+
+def grade_roster(connection, course_id, items):
+    # Items name an enrollment by enrollment_id, or by student_id + semester,
+    # within the course. All updates go out as one executemany UPDATE.
+    rows = _validate(items, _grade_values)
+
+    ids = {row['key'][1] for row in rows if row['key'][0] == 'id'}
+    students = {row['key'][1] for row in rows if row['key'][0] == 'student'}
+    current = connection.execute(
+        select(Enrollments.id, Enrollments.student_id, Enrollments.semester, Enrollments.grade, Enrollments.status)
+        .where(Enrollments.course_id == course_id,
+               Enrollments.id.in_(ids) | Enrollments.student_id.in_(students))
+    ).all()
+    by_id = {row.id: row for row in current}
+    by_student = {('student', row.student_id, row.semester): row for row in current}
+
+    results, updates, summary = [], {}, Counter()
+    # Seats freed by earlier rows go to later ones before the course is asked
+    # for more; a row that finds none is FULL and leaves its enrollment as is
+    freed = 0
+    for index, row in enumerate(rows):
+        key = row['key']
+        enrollment = by_id.get(key[1]) if key[0] == 'id' else by_student.get(key)
+        if enrollment is None:
+            results.append({'index': index, 'status': NOT_FOUND, 'error': 'Enrollment not found in this course'})
+            continue
+        previous = updates.get(enrollment.id, {'b_grade': enrollment.grade, 'b_status': enrollment.status})
+        status = row['status'] or previous['b_status']
+        grade = row['grade'] if row['has_grade'] else previous['b_grade']
+        delta = seat_deltas((course_id, previous['b_status']), (course_id, status)).get(course_id, 0)
+        if delta > 0:
+            if freed:
+                freed -= 1
+            elif not take_seats(connection, course_id):
+                results.append({'index': index, 'status': FULL, 'error': 'Course is full'})
+                continue
+        elif delta < 0:
+            freed += 1
+        summary[summary_key(course_id, enrollment.semester, previous['b_status'], previous['b_grade'])] -= 1
+        summary[summary_key(course_id, enrollment.semester, status, grade)] += 1
+        updates[enrollment.id] = {'b_id': enrollment.id, 'b_grade': grade, 'b_status': status}
+        results.append({'index': index, 'status': UPDATED, 'id': enrollment.id})
+
+    if freed:
+        release_seats(connection, course_id, freed)
+    if updates:
+        connection.execute(
+            update(Enrollments.__table__)
+            .where(Enrollments.id == bindparam('b_id'))
+            .values(grade=bindparam('b_grade'), status=bindparam('b_status')),
+            list(updates.values()),
+        )
+        apply_summary_deltas(connection, summary)
+        changes = []
+        for enrollment_id, values in updates.items():
+            row = by_id[enrollment_id]
+            changes.append(((row.student_id, course_id, row.semester, row.status, row.grade),
+                            (row.student_id, course_id, row.semester, values['b_status'], values['b_grade'])))
+        apply_enrollment_changes(connection, changes)
+        changelog.record(connection, Enrollments.__tablename__, updates)
+    return results
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    # Thread-safe LRU with a per-entry time to live. Expired entries are
+    # dropped lazily on lookup; the least recently used entry is evicted
+    # once maxsize is reached, or once the summed weigh(value) passes
+    # maxweight when both are given.
+
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic, weigh=None, maxweight=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.weigh = weigh
+        self.maxweight = maxweight
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _weight(self, value):
+        return self.weigh(value) if self.weigh else 0
+
+    def _remove(self, key):
+        expires, value = self._data.pop(key)
+        self.weight -= self._weight(value)
+        return value
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires = self.clock() + (self.ttl if ttl is None else ttl)
+        weight = self._weight(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.maxweight is not None and weight > self.maxweight:
+                # Storing it would flush everything else and then itself
+                return
+            self._data[key] = (expires, value)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._remove(key)
+
+    def pop_matching(self, predicate):
+        # Removes every entry whose value satisfies predicate; returns how many
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {'size': len(self._data), 'weight': self.weight, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
@@ -0,0 +1,58 @@
+from sqlalchemy import event, or_, select
+
+import changelog
+import counters
+import summaries
+import transcripts
+from models import Users, Students, Instructors, Courses, Enrollments
+
+# Deleting a user, student, instructor or course leaves its dependents to ON
+# DELETE CASCADE in the database (the relationships are passive_deletes), so
+# the mapper events that keep seat counters, the enrollment summary,
+# transcripts and the change log in step never see those rows. Each
+# before_delete below does the same bookkeeping with a few set-based
+# statements over the rows the cascade is about to remove, however many
+# there are. Dependents already loaded in the session are still deleted by
+# the ORM, ahead of their parent, and are gone by the time these run.
+
+
+def _cascade(connection, dependents):
+    # dependents is {model: criteria} for every table the cascade reaches
+    enrollments = dependents[Enrollments]
+    counters.release_enrollments(connection, enrollments)
+    summaries.remove_enrollments(connection, enrollments)
+    transcripts.remove_enrollments(connection, enrollments)
+    for model, criteria in dependents.items():
+        changelog.record_deleted(connection, model, criteria)
+
+
+@event.listens_for(Courses, 'before_delete')
+def _course_deleted(mapper, connection, target):
+    _cascade(connection, {Enrollments: [Enrollments.course_id == target.id]})
+
+
+@event.listens_for(Students, 'before_delete')
+def _student_deleted(mapper, connection, target):
+    _cascade(connection, {Enrollments: [Enrollments.student_id == target.id]})
+
+
+@event.listens_for(Instructors, 'before_delete')
+def _instructor_deleted(mapper, connection, target):
+    courses = select(Courses.id).where(Courses.instructor_id == target.id)
+    _cascade(connection, {
+        Courses: [Courses.instructor_id == target.id],
+        Enrollments: [Enrollments.course_id.in_(courses)],
+    })
+
+
+@event.listens_for(Users, 'before_delete')
+def _user_deleted(mapper, connection, target):
+    students = select(Students.id).where(Students.user_id == target.id)
+    instructors = select(Instructors.id).where(Instructors.user_id == target.id)
+    courses = select(Courses.id).where(Courses.instructor_id.in_(instructors))
+    _cascade(connection, {
+        Students: [Students.user_id == target.id],
+        Instructors: [Instructors.user_id == target.id],
+        Courses: [Courses.instructor_id.in_(instructors)],
+        Enrollments: [or_(Enrollments.student_id.in_(students), Enrollments.course_id.in_(courses))],
+    })
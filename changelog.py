@@ -0,0 +1,236 @@
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import delete, event, exists, func, insert, literal, select, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.pool import Pool
+
+from models import db, Users, Students, Instructors, Courses, Enrollments, Changes, ChangeLogState
+from pagination import decode_cursor, encode_cursor
+from serializers import column_keys, compile_projection
+
+# The change log behind GET /api/changes. ORM flushes are recorded by the
+# session event below; code that writes entity rows with Core statements
+# (counters.py, registration.py, bulk.py, importer.py) calls record() itself,
+# and cascades.py writes tombstones for rows the database deletes on cascade.
+# Entries only name the row, so the feed serves each row's current columns
+# (no nested relationships) and a deleted row as a tombstone.
+#
+# A cursor is the position (txid, id) of the last entry served, and every
+# change that commits later must sort after it. SQLite serializes writers, so
+# ids come in commit order and txid is always 0. On PostgreSQL a transaction
+# holding id N can commit after N+1, so entries carry the writing
+# transaction's txid and are served only once every transaction with a lower
+# txid has finished: whatever commits later has a txid at or above that
+# snapshot's xmin, above every entry served so far.
+
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+MODELS = {model.__tablename__: model for model in (Users, Students, Instructors, Courses, Enrollments)}
+
+
+class ChangeFeedError(ValueError):
+    pass
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def _txid(connection):
+    return func.txid_current() if connection.dialect.name == 'postgresql' else literal(0)
+
+
+def _servable():
+    # Entries no change committing later can sort before
+    if db.engine.dialect.name == 'postgresql':
+        return [Changes.txid < func.txid_snapshot_xmin(func.txid_current_snapshot())]
+    return []
+
+
+def _order():
+    # On SQLite txid is always 0, and ids alone keep the primary key's range
+    # scans, which SQLite does not use for a row-value comparison
+    if db.engine.dialect.name == 'postgresql':
+        return [Changes.txid, Changes.id]
+    return [Changes.id]
+
+
+def _after(position):
+    if db.engine.dialect.name == 'postgresql':
+        return tuple_(Changes.txid, Changes.id) > tuple_(*position)
+    return Changes.id > position[1]
+
+
+def _position(entry):
+    return entry.txid, entry.id
+
+
+def _purged(state):
+    return (state.purged_txid, state.purged_through) if state else (0, 0)
+
+
+def _encode(position):
+    txid, change_id = position
+    # SQLite cursors keep their {"id": N} form
+    return encode_cursor(change_id, txid=txid) if txid else encode_cursor(change_id)
+
+
+def record(connection, table_name, row_ids, operation=UPDATE):
+    # Once per row, operation and transaction
+    logged = connection.info.setdefault('logged_changes', set())
+    now = datetime.utcnow()
+    rows = []
+    for row_id in row_ids:
+        key = (table_name, row_id, operation)
+        if key not in logged:
+            logged.add(key)
+            rows.append({'table_name': table_name, 'row_id': row_id, 'operation': operation, 'changed_at': now})
+    if rows:
+        connection.execute(insert(Changes).values(txid=_txid(connection)), rows)
+
+
+def record_deleted(connection, model, criteria):
+    # Tombstones for the rows of `model` matching `criteria`, written in one
+    # INSERT ... SELECT before the database cascades a delete to them
+    connection.execute(insert(Changes).from_select(
+        ['table_name', 'row_id', 'operation', 'changed_at', 'txid'],
+        select(literal(model.__tablename__), model.id, literal(DELETE), literal(datetime.utcnow()),
+               _txid(connection)).where(*criteria),
+    ))
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flush(session, flush_context):
+    changes = {}
+    for operation, instances in ((INSERT, session.new), (DELETE, session.deleted),
+                                 (UPDATE, (obj for obj in session.dirty if session.is_modified(obj, include_collections=False)))):
+        for obj in instances:
+            table_name = getattr(obj, '__tablename__', None)
+            if table_name in MODELS:
+                changes.setdefault((table_name, operation), []).append(obj.id)
+    if changes:
+        connection = session.connection()
+        for (table_name, operation), row_ids in changes.items():
+            record(connection, table_name, row_ids, operation)
+
+
+@event.listens_for(Engine, 'commit')
+@event.listens_for(Engine, 'rollback')
+@event.listens_for(Engine, 'rollback_savepoint')
+def _forget_logged(connection, *args):
+    connection.info.pop('logged_changes', None)
+
+
+@event.listens_for(Pool, 'checkin')
+def _forget_logged_on_checkin(dbapi_connection, connection_record):
+    connection_record.info.pop('logged_changes', None)
+
+
+# Rows go out without their relationships or hidden columns
+SERIALIZERS = {table_name: compile_projection(model, column_keys(model), {}) for table_name, model in MODELS.items()}
+
+
+def feed_args():
+    since = request.args.get('since')
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ChangeFeedError('limit must be an integer')
+    if limit < 1:
+        raise ChangeFeedError('limit must be positive')
+    if not since:
+        return None, min(limit, MAX_LIMIT)
+    change_id, txid = decode_cursor(since, 'txid')
+    return (txid, change_id), min(limit, MAX_LIMIT)
+
+
+def latest_cursor():
+    # Never behind the pruned entries, even when pruning has emptied the log
+    latest = db.session.execute(
+        select(Changes.txid, Changes.id).where(*_servable())
+        .order_by(*(column.desc() for column in _order())).limit(1)
+    ).first()
+    state = db.session.get(ChangeLogState, 1)
+    return _encode(max(_position(latest) if latest else (0, 0), _purged(state)))
+
+
+def changes_since(since, limit):
+    # ([change], cursor, more). A row changed several times within the page
+    # appears once, at its latest position; rows are read as they are now.
+    state = db.session.get(ChangeLogState, 1)
+    if since < _purged(state):
+        raise CursorExpired()
+
+    entries = db.session.execute(
+        select(Changes.id, Changes.txid, Changes.table_name, Changes.row_id, Changes.operation)
+        .where(_after(since), *_servable()).order_by(*_order()).limit(limit + 1)
+    ).all()
+    more = len(entries) > limit
+    entries = entries[:limit]
+    latest = {}
+    for entry in entries:
+        latest.pop((entry.table_name, entry.row_id), None)
+        latest[entry.table_name, entry.row_id] = entry
+
+    wanted = {}
+    for (table_name, row_id), entry in latest.items():
+        if entry.operation != DELETE:
+            wanted.setdefault(table_name, []).append(row_id)
+    rows = {}
+    for table_name, row_ids in wanted.items():
+        model = MODELS[table_name]
+        serialize = SERIALIZERS[table_name]
+        for obj in db.session.execute(select(model).where(model.id.in_(row_ids))).scalars():
+            rows[table_name, obj.id] = serialize(obj)
+
+    changes = []
+    for key, entry in latest.items():
+        row = rows.get(key)
+        # A row gone since it was written shows as deleted; its own delete
+        # entry follows later in the log
+        operation = entry.operation if row is not None or entry.operation == DELETE else DELETE
+        change = {'id': entry.id, 'table': entry.table_name, 'row_id': entry.row_id, 'operation': operation}
+        if operation != DELETE:
+            change['row'] = row
+        changes.append(change)
+    cursor = _encode(_position(entries[-1]) if entries else since)
+    return changes, cursor, more
+
+
+def prune(retention, now=None):
+    # Compaction drops every entry superseded by a later one for the same
+    # row, which no client can need: the later entry serves the row's
+    # current state. Retention then drops what is older than `retention`,
+    # and records how far it went so older cursors are refused.
+    # Returns (compacted, expired).
+    now = now or datetime.utcnow()
+    if db.engine.dialect.name == 'postgresql':
+        later = aliased(Changes)
+        superseded = exists().where(later.table_name == Changes.table_name, later.row_id == Changes.row_id,
+                                    tuple_(later.txid, later.id) > tuple_(Changes.txid, Changes.id))
+    else:
+        # txid is always 0, so a row's latest id is its latest position
+        superseded = Changes.id.not_in(select(func.max(Changes.id)).group_by(Changes.table_name, Changes.row_id))
+    compacted = db.session.execute(delete(Changes).where(superseded)).rowcount
+    # Only entries already servable, so a cursor taken after pruning is
+    # never past a change that commits later
+    old = [Changes.changed_at < now - retention, *_servable()]
+    txid = db.session.execute(select(func.max(Changes.txid)).where(*old)).scalar()
+    expired = 0
+    if txid is not None:
+        horizon = txid, db.session.execute(select(func.max(Changes.id)).where(*old, Changes.txid == txid)).scalar()
+        expired = db.session.execute(delete(Changes).where(~_after(horizon))).rowcount
+        state = db.session.get(ChangeLogState, 1)
+        purged = max(_purged(state), horizon)
+        state = state or ChangeLogState(id=1)
+        state.purged_txid, state.purged_through = purged
+        state.pruned_at = now
+        db.session.add(state)
+    db.session.commit()
+    return compacted, expired
+
@@ -2,7 +2,7 @@ const API_URL = 'http://localhost:5001/api';
 
 const getToken = () => localStorage.getItem('token');
 
-const fetchData = async (endpoint, options = {}) => {
+const sendRequest = async (endpoint, options = {}) => {
   const token = getToken();
   try {
     const response = await fetch(`${API_URL}${endpoint}`, {
@@ -25,13 +25,31 @@ const fetchData = async (endpoint, options = {}) => {
       throw new Error(errorData.message || `HTTP error! status: ${response.status}`);
     }
 
-    return await response.json();
+    return response;
   } catch (error) {
     console.error('API error:', error);
     throw error;
   }
 };
 
+const fetchData = async (endpoint, options = {}) => {
+  const response = await sendRequest(endpoint, options);
+  return response.json();
+};
+
+// Collection endpoints are cursor-paginated; follow X-Next-Cursor until exhausted.
+const fetchAll = async (endpoint) => {
+  const items = [];
+  let cursor = null;
+  do {
+    const page = cursor ? `${endpoint}?after=${encodeURIComponent(cursor)}` : endpoint;
+    const response = await sendRequest(page);
+    items.push(...(await response.json()));
+    cursor = response.headers.get('X-Next-Cursor');
+  } while (cursor);
+  return items;
+};
+
 export const signup = (data) => fetchData('/auth/signup', {
   method: 'POST',
   body: JSON.stringify(data),
@@ -42,7 +60,7 @@ export const login = (data) => fetchData('/auth/login', {
   body: JSON.stringify(data),
 });
 
-export const getCourses = () => fetchData('/courses');
+export const getCourses = () => fetchAll('/courses');
 export const createCourse = (data) => fetchData('/courses', {
   method: 'POST',
   body: JSON.stringify(data),
@@ -56,7 +74,7 @@ export const deleteCourse = (id) => fetchData(`/courses/${id}`, {
   method: 'DELETE',
 });
 
-export const getStudents = () => fetchData('/students');
+export const getStudents = () => fetchAll('/students');
 export const getStudent = (id) => fetchData(`/students/${id}`);
 export const createStudent = (data) => fetchData('/students', {
   method: 'POST',
@@ -70,7 +88,7 @@ export const deleteStudent = (id) => fetchData(`/students/${id}`, {
   method: 'DELETE',
 });
 
-export const getInstructors = () => fetchData('/instructors');
+export const getInstructors = () => fetchAll('/instructors');
 export const createInstructor = (data) => fetchData('/instructors', {
   method: 'POST',
   body: JSON.stringify(data),
@@ -84,7 +102,7 @@ export const deleteInstructor = (id) => fetchData(`/instructors/${id}`, {
   method: 'DELETE',
 });
 
-export const getEnrollments = () => fetchData('/enrollments');
+export const getEnrollments = () => fetchAll('/enrollments');
 export const createEnrollment = (data) => fetchData('/enrollments', {
   method: 'POST',
   body: JSON.stringify(data),
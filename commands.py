@@ -0,0 +1,168 @@
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import db
+from loading import assert_constant_queries, collection_urls
+import filtering
+from counters import check_seat_counts, rebuild_seat_counts
+from summaries import check_summaries, rebuild_summaries
+from transcripts import FIELDS, check_transcripts, rebuild_transcripts
+import importer
+import changelog
+
+
+@click.command('check-queries')
+@click.option('--rows', default=50, show_default=True, help='Page size to compare against a single-row page.')
+@with_appcontext
+def check_queries(rows):
+    """Fail if any collection endpoint's SQL statement count grows with its page size."""
+    client = current_app.test_client()
+    failures = 0
+    for url in collection_urls():
+        try:
+            counts = assert_constant_queries(client, url, large=rows)
+        except AssertionError as e:
+            failures += 1
+            click.echo(f'FAIL {e}')
+            continue
+        summary = ', '.join(f'{n} rows: {queries} queries' for queries, n in counts.values())
+        click.echo(f'ok   {url} ({summary})')
+
+    if failures:
+        raise SystemExit(1)
+
+
+@click.command('check-indexes')
+@click.option('--verbose', is_flag=True, help='Print the query plan for every combination.')
+@with_appcontext
+def check_indexes(verbose):
+    """Fail if any combination of collection filters is answered by a table scan."""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('check-indexes reads SQLite query plans; run it against a SQLite database')
+    failures = 0
+    for model, columns in filtering.DECLARED:
+        for keys, uses_index, plan in filtering.query_plans(model, columns):
+            failures += not uses_index
+            click.echo(f'{"ok  " if uses_index else "FAIL"} {model.__tablename__}?{"&".join(keys)}')
+            if verbose or not uses_index:
+                for line in plan:
+                    click.echo(f'       {line}')
+    if failures:
+        raise SystemExit(1)
+
+
+@click.group('seats')
+def seats():
+    """Inspect or repair Courses.enrolled_count."""
+
+
+@seats.command('check')
+@with_appcontext
+def seats_check():
+    """List courses whose stored seat count disagrees with their enrollments."""
+    drift = check_seat_counts()
+    for course_id, stored, counted in drift:
+        click.echo(f'course {course_id}: stored {stored}, counted {counted}')
+    if drift:
+        raise SystemExit(1)
+    click.echo('Seat counts are consistent')
+
+
+@seats.command('rebuild')
+@with_appcontext
+def seats_rebuild():
+    """Recount enrolled students for every course."""
+    click.echo(f'Rebuilt seat counts for {rebuild_seat_counts()} courses')
+
+
+@click.group('summaries')
+def enrollment_summary():
+    """Inspect or repair the enrollment summary behind /api/analytics."""
+
+
+@enrollment_summary.command('check')
+@with_appcontext
+def summaries_check():
+    """List summary groups whose count disagrees with the enrollments."""
+    drift = check_summaries()
+    for (course_id, semester, status, grade), stored, counted in drift:
+        click.echo(f'course {course_id} {semester} {status} {grade or "-"}: stored {stored}, counted {counted}')
+    if drift:
+        raise SystemExit(1)
+    click.echo('Enrollment summary is consistent')
+
+
+@enrollment_summary.command('rebuild')
+@with_appcontext
+def summaries_rebuild():
+    """Recount the enrollment summary from the enrollments table."""
+    groups = rebuild_summaries(db.session.connection())
+    db.session.commit()
+    click.echo(f'Rebuilt {groups} enrollment summary groups')
+
+
+@click.group('transcripts')
+def transcript_terms():
+    """Inspect or repair the per-semester totals behind student transcripts."""
+
+
+@transcript_terms.command('check')
+@with_appcontext
+def transcripts_check():
+    """List students and semesters whose stored totals disagree with their enrollments."""
+    drift = check_transcripts()
+    for (student_id, semester), stored, counted in drift:
+        differences = ', '.join(f'{field} {old} != {new}' for field, old, new in zip(FIELDS, stored, counted) if old != new)
+        click.echo(f'student {student_id} {semester}: {differences}')
+    if drift:
+        raise SystemExit(1)
+    click.echo('Transcripts are consistent')
+
+
+@transcript_terms.command('rebuild')
+@with_appcontext
+def transcripts_rebuild():
+    """Recompute every student's per-semester totals from their enrollments."""
+    terms = rebuild_transcripts(db.session.connection())
+    db.session.commit()
+    click.echo(f'Rebuilt {terms} transcript semesters')
+
+
+@click.group('changes')
+def change_log():
+    """Maintain the change log behind /api/changes."""
+
+
+@change_log.command('prune')
+@click.option('--retention-days', default=7, show_default=True, type=float,
+              help='Drop changes older than this; clients with older cursors must reload.')
+@with_appcontext
+def changes_prune(retention_days):
+    """Compact superseded changes and drop the ones past retention.
+
+    Nothing runs this for you: schedule it, daily from cron for instance,
+    or the change log grows without bound.
+    """
+    compacted, expired = changelog.prune(timedelta(days=retention_days))
+    click.echo(f'Compacted {compacted} superseded changes, expired {expired} past retention')
+
+
+@click.command('import-csv')
+@click.argument('kind', type=click.Choice(sorted(importer.KINDS)))
+@click.argument('path', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--batch-size', default=importer.BATCH_SIZE, show_default=True)
+@click.option('--workers', type=int, help='Password hashing processes (default: one per CPU).')
+@with_appcontext
+def import_csv(kind, path, batch_size, workers):
+    """Stream-import students, instructors or courses from a CSV file."""
+    rounds = current_app.config.get('BCRYPT_LOG_ROUNDS', 12)
+    for event in importer.import_csv(kind, path, rounds, batch_size=batch_size, workers=workers):
+        if event['event'] == 'error':
+            click.echo(f'line {event["row"]}: {event["error"]}', err=True)
+        else:
+            click.echo(f'{event["event"]}: {event["rows"]} rows read, {event["imported"]} imported, {event["errors"]} errors')
+    if event['errors']:
+        raise SystemExit(1)
@@ -0,0 +1,32 @@
+import hashlib
+
+from flask import Response, request
+from werkzeug.http import http_date, is_resource_modified, quote_etag
+
+import representations
+import versions
+
+# Conditional GET for resources whose body depends only on some tables. The
+# validators come from table_versions, one primary-key lookup, so a 304 costs
+# neither the resource's queries nor its serialization.
+
+
+def check(tables=None):
+    # Returns (304 response or None, headers for the full response). Versions
+    # must be read before the data: a version older than the body only costs
+    # the client one extra full response, a newer one would pin a stale body.
+    rows = versions.current(tables)
+    args = sorted(request.args.items(multi=True))
+    media_type = representations.negotiated()
+    digest = hashlib.sha1(repr((request.path, args, media_type, rows)).encode('utf-8')).hexdigest()[:20]
+    # Weak: the same representation may be sent with different encodings
+    etag = quote_etag(digest, weak=True)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    last_modified = max((updated_at for _, _, updated_at in rows), default=None)
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+
+    if request.method in ('GET', 'HEAD') and not is_resource_modified(
+            request.environ, etag=etag, last_modified=last_modified):
+        return Response(status=304, headers=headers), headers
+    return None, headers
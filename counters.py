@@ -0,0 +1,139 @@
+from collections import Counter
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm.attributes import get_history
+
+import changelog
+from models import db, Courses, Enrollments
+
+# Courses.enrolled_count mirrors COUNT(*) of the course's 'enrolled'
+# enrollments and never exceeds max_capacity. ORM flushes keep it current
+# through the mapper events below; code that writes enrollments with Core
+# statements must take and release seats itself.
+
+ENROLLED = 'enrolled'
+
+
+def previous_value(target, key):
+    history = get_history(target, key)
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, key)
+
+
+def seat_deltas(before, after):
+    # before/after are (course_id, status) pairs, or None for a missing row
+    deltas = Counter()
+    if before is not None and before[1] == ENROLLED:
+        deltas[before[0]] -= 1
+    if after is not None and after[1] == ENROLLED:
+        deltas[after[0]] += 1
+    return {course_id: delta for course_id, delta in deltas.items() if delta}
+
+
+class CourseFull(Exception):
+    def __init__(self, course_id):
+        super().__init__(f'Course {course_id} is full')
+        self.course_id = course_id
+
+
+def take_seats(connection, course_id, count=1):
+    # A conditional UPDATE is the capacity check and the reservation in one
+    # statement, so two writers can never both see the last free seat.
+    result = connection.execute(
+        update(Courses)
+        .where(Courses.id == course_id, Courses.enrolled_count + count <= Courses.max_capacity)
+        .values(enrolled_count=Courses.enrolled_count + count)
+    )
+    if result.rowcount != 1:
+        return False
+    changelog.record(connection, Courses.__tablename__, [course_id])
+    return True
+
+
+def take_available_seats(connection, course_id, wanted):
+    # Takes up to `wanted` seats and returns how many were granted; retries
+    # if another writer took seats between the read and the conditional UPDATE.
+    while wanted:
+        free = connection.execute(
+            select(Courses.max_capacity - Courses.enrolled_count).where(Courses.id == course_id)
+        ).scalar()
+        granted = min(wanted, free or 0)
+        if granted <= 0:
+            return 0
+        if take_seats(connection, course_id, granted):
+            return granted
+    return 0
+
+
+def release_seats(connection, course_id, count=1):
+    connection.execute(
+        update(Courses).where(Courses.id == course_id).values(enrolled_count=Courses.enrolled_count - count)
+    )
+    changelog.record(connection, Courses.__tablename__, [course_id])
+
+
+def release_enrollments(connection, criteria):
+    # Frees the seats held by the enrollments matching `criteria`, for a
+    # delete the database cascades to them, in one UPDATE across their courses
+    held = (
+        select(func.count(Enrollments.id))
+        .where(Enrollments.course_id == Courses.id, Enrollments.status == ENROLLED, *criteria)
+        .scalar_subquery()
+    )
+    course_ids = connection.execute(
+        update(Courses)
+        .where(Courses.id.in_(select(Enrollments.course_id).where(Enrollments.status == ENROLLED, *criteria)))
+        .values(enrolled_count=Courses.enrolled_count - held)
+        .returning(Courses.id)
+    ).scalars().all()
+    changelog.record(connection, Courses.__tablename__, course_ids)
+
+
+def apply_seat_deltas(connection, deltas):
+    for course_id, delta in deltas.items():
+        if delta < 0:
+            release_seats(connection, course_id, -delta)
+        elif not take_seats(connection, course_id, delta):
+            raise CourseFull(course_id)
+
+
+@event.listens_for(Enrollments, 'after_insert')
+def _enrollment_inserted(mapper, connection, target):
+    apply_seat_deltas(connection, seat_deltas(None, (target.course_id, target.status)))
+
+
+@event.listens_for(Enrollments, 'after_update')
+def _enrollment_updated(mapper, connection, target):
+    before = (previous_value(target, 'course_id'), previous_value(target, 'status'))
+    apply_seat_deltas(connection, seat_deltas(before, (target.course_id, target.status)))
+
+
+@event.listens_for(Enrollments, 'after_delete')
+def _enrollment_deleted(mapper, connection, target):
+    apply_seat_deltas(connection, seat_deltas((previous_value(target, 'course_id'), previous_value(target, 'status')), None))
+
+
+def _actual_seat_counts():
+    return (
+        select(func.count(Enrollments.id))
+        .where(Enrollments.course_id == Courses.id, Enrollments.status == ENROLLED)
+        .scalar_subquery()
+    )
+
+
+def check_seat_counts():
+    actual = _actual_seat_counts()
+    rows = db.session.execute(
+        select(Courses.id, Courses.enrolled_count, actual).where(Courses.enrolled_count != actual)
+    )
+    return [(course_id, stored, counted) for course_id, stored, counted in rows]
+
+
+def rebuild_seat_counts():
+    result = db.session.execute(
+        update(Courses).values(enrolled_count=_actual_seat_counts()),
+        execution_options={'synchronize_session': False},
+    )
+    db.session.commit()
+    return result.rowcount
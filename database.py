@@ -0,0 +1,105 @@
+import os
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Engine profiles, chosen with DATABASE_PROFILE. Left unset, the profile
+# follows the DATABASE_URL scheme; 'default' keeps SQLAlchemy's defaults.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',         # readers no longer block the writer
+    'synchronous': 'NORMAL',       # fsync at checkpoints, not every commit
+    'busy_timeout': 5000,          # ms to wait for the write lock
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,      # KiB, per connection
+    'temp_store': 'MEMORY',
+}
+
+
+def _int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def database_url(root_path):
+    url = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(root_path, "instance", "app.db")}')
+    # Some hosts still hand out the pre-1.4 scheme
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def display_url(url):
+    # For logs: the password, if any, masked
+    return make_url(url).render_as_string(hide_password=True)
+
+
+def profile_name(url):
+    profile = os.environ.get('DATABASE_PROFILE')
+    if profile:
+        return profile
+    return 'postgresql' if make_url(url).get_backend_name() in ('postgresql', 'postgres') else 'sqlite'
+
+
+def engine_options(url):
+    profile = profile_name(url)
+    if profile == 'postgresql':
+        return {
+            'pool_size': _int('DATABASE_POOL_SIZE', 10),
+            'max_overflow': _int('DATABASE_MAX_OVERFLOW', 20),
+            'pool_timeout': _int('DATABASE_POOL_TIMEOUT', 30),
+            # Connections idle past the server's or a proxy's timeout are
+            # replaced instead of failing the first query that uses them
+            'pool_pre_ping': True,
+            'pool_recycle': _int('DATABASE_POOL_RECYCLE', 1800),
+            'connect_args': {'application_name': os.environ.get('DATABASE_APPLICATION_NAME', 'coursehub')},
+        }
+    if profile == 'sqlite':
+        # Pragmas are applied per connection by init_app
+        return {
+            'pool_size': _int('DATABASE_POOL_SIZE', 10),
+            'max_overflow': _int('DATABASE_MAX_OVERFLOW', 20),
+        }
+    if profile == 'default':
+        return {}
+    raise ValueError(f'Unknown DATABASE_PROFILE {profile!r}')
+
+
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    # Deletes rely on ON DELETE CASCADE, which SQLite only honours with this
+    # on, so it is set under every profile
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+_engines = weakref.WeakSet()
+
+
+def _dispose_inherited_pools():
+    # A forked worker must not touch the parent's sockets or SQLite handles.
+    # close=False drops them from the child's pool without closing them, so
+    # the parent's connections stay usable.
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_inherited_pools)
+
+
+def init_app(app, db):
+    with app.app_context():
+        for engine in db.engines.values():
+            _engines.add(engine)
+            if engine.dialect.name != 'sqlite':
+                continue
+            event.listen(engine, 'connect', _enable_foreign_keys)
+            if profile_name(str(engine.url)) == 'sqlite':
+                event.listen(engine, 'connect', _set_sqlite_pragmas)
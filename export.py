@@ -0,0 +1,101 @@
+import csv
+import io
+
+from flask import Response, request, stream_with_context
+from sqlalchemy import inspect, select
+
+import projection
+from representations import dumps
+from models import db
+from pagination import decode_cursor
+from projection import ProjectionError
+from serializers import column_converter, column_keys, is_hidden
+
+NDJSON = 'application/x-ndjson'
+CSV = 'text/csv'
+
+BATCH_SIZE = 1000
+CHUNK_BYTES = 64 * 1024
+
+
+def requested_format():
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON, CSV])
+    return best if best in (NDJSON, CSV) else None
+
+
+def _chunked(lines):
+    # Coalesce small lines into ~64KB writes
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _batches(statement):
+    # yield_per streams rows from a server-side cursor where the driver has
+    # one. The session's identity map only holds weak references to clean
+    # objects, so each batch is released once it has been written out.
+    result = db.session.execute(statement.execution_options(yield_per=BATCH_SIZE))
+    yield from result.partitions()
+
+
+def _ndjson_lines(model, view, after, criteria):
+    statement = select(model).options(*view.options).where(*criteria).order_by(model.id)
+    if after is not None:
+        statement = statement.where(model.id > after)
+    for batch in _batches(statement):
+        for (obj,) in batch:
+            yield dumps(view.serialize(obj)).decode('utf-8') + '\n'
+
+
+def _csv_lines(model, fields, after, criteria):
+    mapper = inspect(model)
+    keys = fields or column_keys(model)
+    for key in keys:
+        if key not in mapper.column_attrs or is_hidden(model, key):
+            raise ProjectionError(f'Unknown field {key!r} on {model.__name__} (CSV exports columns only)')
+    columns = [mapper.column_attrs[key].columns[0] for key in keys]
+    converters = [column_converter(model, column) for column in columns]
+
+    statement = select(*columns).where(*criteria).order_by(model.id)
+    if after is not None:
+        statement = statement.where(model.id > after)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(keys)
+        for batch in _batches(statement):
+            for row in batch:
+                writer.writerow([value if convert is None else convert(value)
+                                 for value, convert in zip(row, converters)])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    return generate()
+
+
+def export(model, load_plan, mimetype, criteria=()):
+    # Validation happens before the first byte is sent so errors can still
+    # be reported with a status code.
+    after = request.args.get('after')
+    after = decode_cursor(after) if after else None
+    if mimetype == CSV:
+        if request.args.get('include'):
+            raise ProjectionError('include is not supported for CSV exports')
+        fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+        body = _csv_lines(model, fields, after, criteria)
+    else:
+        body = _chunked(_ndjson_lines(model, projection.from_request(model, load_plan), after, criteria))
+
+    filename = f'{model.__tablename__}.{"csv" if mimetype == CSV else "ndjson"}'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
@@ -0,0 +1,70 @@
+from itertools import combinations
+
+from flask import request
+from sqlalchemy import select
+
+from models import db, Courses, Enrollments
+
+# Filter parameters each collection accepts, mirroring the composite indexes
+# declared on the models. ?status=enrolled,completed matches either value.
+ENROLLMENTS = (Enrollments.semester, Enrollments.status, Enrollments.course_id, Enrollments.student_id)
+COURSES = (Courses.instructor_id, Courses.credit_hours)
+DECLARED = ((Enrollments, ENROLLMENTS), (Courses, COURSES))
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _values(column, raw):
+    convert = column.type.python_type
+    values = []
+    for part in raw.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            values.append(convert(part))
+        except ValueError:
+            raise FilterError(f'{column.key} must be {"an integer" if convert is int else "a string"}')
+    return values
+
+
+def from_request(columns):
+    # Empty parameters are ignored, as an empty form field would send them
+    criteria = []
+    for column in columns:
+        values = _values(column, request.args.get(column.key, ''))
+        if len(values) == 1:
+            criteria.append(column == values[0])
+        elif values:
+            criteria.append(column.in_(values))
+    return criteria
+
+
+def query_plans(model, columns):
+    # EXPLAIN QUERY PLAN for every combination of filters, as paginate() would
+    # run them; SQLite only. Yields (keys, uses_index, plan lines).
+    #
+    # Planner statistics make SQLite scan small or low-cardinality tables
+    # instead, so they are hidden for the duration: the question is whether
+    # an index can serve each filter, not whether today's data needs it.
+    table = model.__tablename__
+    samples = {int: 1, str: 'x'}
+    with db.engine.connect() as connection:
+        try:
+            if connection.execute(db.text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")).first():
+                connection.execute(db.text('DELETE FROM sqlite_stat1'))
+            connection.execute(db.text('ANALYZE sqlite_schema'))
+            for size in range(1, len(columns) + 1):
+                for combination in combinations(columns, size):
+                    statement = (select(model)
+                                 .where(*(column == samples[column.type.python_type] for column in combination))
+                                 .order_by(model.id).limit(51))
+                    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+                    plan = [row[-1] for row in connection.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}'))]
+                    uses_index = any(line.startswith(f'SEARCH {table} ') for line in plan)
+                    yield [column.key for column in combination], uses_index, plan
+        finally:
+            connection.rollback()
+            connection.execute(db.text('ANALYZE sqlite_schema'))
@@ -0,0 +1,249 @@
+import csv
+from contextlib import nullcontext
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+import changelog
+from models import db, Users, Students, Instructors, Courses
+from passwords import hash_many, hash_password, hashing_pool
+
+DEFAULT_PASSWORD = 'defaultpassword'
+BATCH_SIZE = 2000
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(row, key, attribute, required=True):
+    value = (row.get(key) or '').strip()
+    if not value:
+        if required:
+            raise RowError(f'{key} is required')
+        return None
+    length = attribute.type.length
+    if length and len(value) > length:
+        raise RowError(f'{key} is longer than {length} characters')
+    return value
+
+
+def _int(row, key, default=None):
+    value = (row.get(key) or '').strip()
+    if not value:
+        if default is None:
+            raise RowError(f'{key} is required')
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RowError(f'{key} must be an integer')
+
+
+class _Rows:
+    required = ()
+    unique = {}  # parsed key -> column it must be unique in
+
+    def parse(self, row):
+        raise NotImplementedError
+
+    def conflicts(self, connection, rows):
+        # Values already taken in the database, per unique key
+        return {
+            key: set(connection.execute(select(column).where(column.in_({row[key] for row in rows}))).scalars())
+            for key, column in self.unique.items()
+        }
+
+    def write(self, connection, rows):
+        raise NotImplementedError
+
+
+class _UserRows(_Rows):
+    role = None
+    profile = None
+
+    def parse(self, row):
+        username = _text(row, 'username', Users.username)
+        return {
+            'username': username,
+            'email': _text(row, 'email', Users.email),
+            'password': (row.get('password') or '').strip() or None,
+            **self.parse_profile(row, username),
+        }
+
+    def write(self, connection, rows):
+        user_ids = connection.execute(
+            insert(Users).returning(Users.id, sort_by_parameter_order=True),
+            [{'username': row['username'], 'email': row['email'], 'role': self.role,
+              'password_hash': row['password_hash']} for row in rows],
+        ).scalars().all()
+        columns = [column.key for column in self.profile.__table__.columns if column.key not in ('id', 'user_id')]
+        profile_ids = connection.execute(
+            insert(self.profile).returning(self.profile.id),
+            [{'user_id': user_id, **{key: row[key] for key in columns}} for user_id, row in zip(user_ids, rows)],
+        ).scalars().all()
+        changelog.record(connection, Users.__tablename__, user_ids, changelog.INSERT)
+        changelog.record(connection, self.profile.__tablename__, profile_ids, changelog.INSERT)
+
+
+class StudentRows(_UserRows):
+    role = 'student'
+    profile = Students
+    required = ('username', 'email', 'student_id')
+    unique = {'username': Users.username, 'email': Users.email, 'student_id': Students.student_id}
+
+    def parse_profile(self, row, username):
+        return {
+            'name': _text(row, 'name', Students.name, required=False) or username,
+            'age': _int(row, 'age', default=18),
+            'student_id': _text(row, 'student_id', Students.student_id),
+            'enrolment_year': _int(row, 'enrolment_year' if row.get('enrolment_year') else 'enrollment_year'),
+        }
+
+
+class InstructorRows(_UserRows):
+    role = 'instructor'
+    profile = Instructors
+    required = ('username', 'email', 'name', 'specialty')
+    unique = {'username': Users.username, 'email': Users.email}
+
+    def parse_profile(self, row, username):
+        return {
+            'name': _text(row, 'name', Instructors.name),
+            'specialty': _text(row, 'specialty', Instructors.specialty),
+        }
+
+
+class CourseRows(_Rows):
+    required = ('title', 'course_code', 'description', 'credit_hours', 'max_capacity', 'instructor_id')
+    unique = {'course_code': Courses.course_code}
+
+    def parse(self, row):
+        return {
+            'title': _text(row, 'title', Courses.title),
+            'course_code': _text(row, 'course_code', Courses.course_code),
+            'description': _text(row, 'description', Courses.description),
+            'credit_hours': _int(row, 'credit_hours'),
+            'max_capacity': _int(row, 'max_capacity'),
+            'instructor_id': _int(row, 'instructor_id'),
+        }
+
+    def conflicts(self, connection, rows):
+        taken = super().conflicts(connection, rows)
+        known = set(connection.execute(
+            select(Instructors.id).where(Instructors.id.in_({row['instructor_id'] for row in rows}))).scalars())
+        for row in rows:
+            if row['instructor_id'] not in known:
+                row['error'] = f'Instructor {row["instructor_id"]} not found'
+        return taken
+
+    def write(self, connection, rows):
+        course_ids = connection.execute(insert(Courses).returning(Courses.id), rows).scalars().all()
+        changelog.record(connection, Courses.__tablename__, course_ids, changelog.INSERT)
+
+
+KINDS = {'students': StudentRows, 'instructors': InstructorRows, 'courses': CourseRows}
+
+
+def _numbered(reader):
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _write_each(spec, rows, errors):
+    # After a batch hit a unique value (or an instructor) that a concurrent
+    # writer changed since the check, each row goes in under its own
+    # SAVEPOINT so only the conflicting ones fail. Returns the rows written.
+    written = []
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'sqlite':
+            # pysqlite only opens a transaction before DML, and a SAVEPOINT
+            # taken outside one commits on release
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+        for row in rows:
+            try:
+                with connection.begin_nested():
+                    spec.write(connection, [row])
+            except IntegrityError:
+                taken = spec.conflicts(connection, [row])
+                key = next((key for key in spec.unique if row[key] in taken[key]), None)
+                error = row.get('error') or (f'{key} {row[key]!r} already exists' if key else 'Conflicts with a concurrent write')
+                errors.append({'event': 'error', 'row': row['line'], 'error': error})
+                continue
+            written.append(row)
+    return written
+
+
+def import_csv(kind, stream, rounds, batch_size=BATCH_SIZE, workers=None):
+    # Generator of progress events: one 'error' per rejected row, one
+    # 'progress' per committed batch and a final 'done'. Each batch is parsed,
+    # checked against the database, password-hashed in a process pool and
+    # written in its own transaction, so memory stays bounded by batch_size.
+    spec = KINDS[kind]()
+    reader = csv.DictReader(stream)
+    missing = [column for column in spec.required if column not in (reader.fieldnames or ())]
+    if missing:
+        yield {'event': 'error', 'row': 1, 'error': f'Missing columns: {", ".join(missing)}'}
+        yield {'event': 'done', 'rows': 0, 'imported': 0, 'errors': 1}
+        return
+
+    users = isinstance(spec, _UserRows)
+    default_hash = hash_password(DEFAULT_PASSWORD, rounds) if users else None
+    seen = {key: set() for key in spec.unique}
+    totals = {'rows': 0, 'imported': 0, 'errors': 0}
+    lines = _numbered(reader)
+
+    pool = hashing_pool(workers) if users and 'password' in reader.fieldnames else nullcontext()
+    with pool:
+        while True:
+            chunk = list(islice(lines, batch_size))
+            if not chunk:
+                break
+            totals['rows'] += len(chunk)
+
+            rows, errors = [], []
+            for line, row in chunk:
+                try:
+                    rows.append({'line': line, **spec.parse(row)})
+                except RowError as e:
+                    errors.append({'event': 'error', 'row': line, 'error': str(e)})
+
+            accepted = []
+            with db.engine.connect() as connection:
+                taken = spec.conflicts(connection, rows) if rows else {}
+            for row in rows:
+                for key in spec.unique:
+                    if row[key] in taken[key] or row[key] in seen[key]:
+                        row.setdefault('error', f'{key} {row[key]!r} already exists')
+                if 'error' in row:
+                    errors.append({'event': 'error', 'row': row['line'], 'error': row['error']})
+                    continue
+                for key in spec.unique:
+                    seen[key].add(row[key])
+                accepted.append(row)
+
+            if users and accepted:
+                # Hash before opening the write transaction so bcrypt never
+                # runs while the database write lock is held
+                explicit = [row for row in accepted if row['password']]
+                if explicit:
+                    hashes = hash_many(pool, [row['password'] for row in explicit], rounds)
+                    for row, hashed in zip(explicit, hashes):
+                        row['password_hash'] = hashed
+                for row in accepted:
+                    row.setdefault('password_hash', default_hash)
+            if accepted:
+                try:
+                    with db.engine.begin() as connection:
+                        spec.write(connection, accepted)
+                except IntegrityError:
+                    accepted = _write_each(spec, accepted, errors)
+
+            # Events go out only after the batch has committed
+            yield from sorted(errors, key=lambda event: event['row'])
+            totals['errors'] += len(errors)
+            totals['imported'] += len(accepted)
+            yield {'event': 'progress', **totals}
+
+    yield {'event': 'done', **totals}
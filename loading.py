@@ -0,0 +1,107 @@
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, Users, Students, Instructors, Courses, Enrollments
+
+# Loading plans mirror the object graph that Model.to_dict() walks for each
+# model's serialize_rules. Scalar relationships are joined into the parent
+# SELECT, collections are fetched with one extra SELECT ... IN per level.
+# The one-to-one profile back-references are serialized as null for users who
+# do not have that profile, so they must be loaded too.
+
+
+def _student_with_user(path):
+    return path.joinedload(Students.user).joinedload(Users.instructor_profile)
+
+
+def _instructor_with_user(path):
+    return path.joinedload(Instructors.user).joinedload(Users.student_profile)
+
+
+ENROLLMENTS = (
+    _student_with_user(joinedload(Enrollments.student)),
+    _instructor_with_user(joinedload(Enrollments.course).joinedload(Courses.instructor)),
+)
+
+COURSES = (
+    _student_with_user(selectinload(Courses.enrollments).joinedload(Enrollments.student)),
+    _instructor_with_user(joinedload(Courses.instructor)),
+)
+
+STUDENTS = (
+    joinedload(Students.user).joinedload(Users.instructor_profile),
+    _instructor_with_user(
+        selectinload(Students.enrollments).joinedload(Enrollments.course).joinedload(Courses.instructor)),
+)
+
+INSTRUCTORS = (
+    joinedload(Instructors.user).joinedload(Users.student_profile),
+    _student_with_user(
+        selectinload(Instructors.courses).selectinload(Courses.enrollments).joinedload(Enrollments.student)),
+)
+
+USERS = (
+    _instructor_with_user(
+        joinedload(Users.student_profile).selectinload(Students.enrollments)
+        .joinedload(Enrollments.course).joinedload(Courses.instructor)),
+    _student_with_user(
+        joinedload(Users.instructor_profile).selectinload(Instructors.courses)
+        .selectinload(Courses.enrollments).joinedload(Enrollments.student)),
+)
+
+
+def collection_urls():
+    # Every paginated endpoint, with the nested collections of the first
+    # parent row that exists
+    urls = ['/api/users', '/api/students', '/api/courses', '/api/enrollments', '/api/instructors',
+            '/api/analytics/courses', '/api/analytics/instructors']
+    for model, url in ((Courses, '/api/courses/{}/enrollments'),
+                       (Students, '/api/students/{}/enrollments'),
+                       (Instructors, '/api/instructors/{}/courses')):
+        first = model.query.order_by(model.id).first()
+        if first is not None:
+            urls.append(url.format(first.id))
+    return urls
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def assert_constant_queries(client, url, small=1, large=50):
+    # Lazy loads re-run the same parameterized SELECT once per parent row,
+    # while eager loads issue each statement once per page. A statement whose
+    # repeat count grows with the page size is therefore an N+1.
+    pages = {}
+    for limit in (small, large):
+        separator = '&' if '?' in url else '?'
+        # Requests share the caller's app context, and with it a session whose
+        # identity map would otherwise hide lazy loads behind earlier requests
+        db.session.remove()
+        with count_queries() as statements:
+            response = client.get(f'{url}{separator}limit={limit}')
+        if response.status_code != 200:
+            raise AssertionError(f'GET {url} returned {response.status_code}')
+        pages[limit] = (Counter(statements), len(response.get_json()))
+
+    (small_counts, small_rows), (large_counts, large_rows) = pages[small], pages[large]
+    if large_rows > small_rows:
+        for statement, repeats in large_counts.items():
+            if repeats > max(small_counts.get(statement, 0), 1):
+                raise AssertionError(
+                    f'GET {url}: statement ran {repeats} times for {large_rows} rows '
+                    f'(N+1): {" ".join(statement.split())[:200]}')
+    return {limit: (sum(counts.values()), rows) for limit, (counts, rows) in pages.items()}
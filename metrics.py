@@ -0,0 +1,164 @@
+import threading
+from bisect import bisect_left
+from collections import Counter
+from time import perf_counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PREFIX = 'coursehub'
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+HISTOGRAMS = (
+    ('request_duration_seconds', 'Time from first byte of the request to the response being returned', SECONDS),
+    ('sql_queries', 'SQL statements executed per request', QUERIES),
+    ('sql_duration_seconds', 'Time spent executing SQL per request', SECONDS),
+    ('serialize_duration_seconds', 'Time spent serializing models per request', SECONDS),
+    ('response_size_bytes', 'Response body size (streamed responses excluded)', BYTES),
+)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        # Prometheus buckets are "less than or equal", hence bisect_left
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestTimings:
+    __slots__ = ('started', 'queries', 'sql', 'serialize')
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.serialize = 0.0
+
+
+class Registry:
+    # Aggregates for this process, keyed by route template and method
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.responses = Counter()
+        self.collectors = {}
+
+    def record(self, route, method, status, timings, duration, size):
+        key = (route, method)
+        with self.lock:
+            histograms = self.histograms.get(key)
+            if histograms is None:
+                histograms = self.histograms[key] = {name: Histogram(buckets) for name, _, buckets in HISTOGRAMS}
+            histograms['request_duration_seconds'].observe(duration)
+            histograms['sql_queries'].observe(timings.queries)
+            histograms['sql_duration_seconds'].observe(timings.sql)
+            histograms['serialize_duration_seconds'].observe(timings.serialize)
+            if size is not None:
+                histograms['response_size_bytes'].observe(size)
+            self.responses[(route, method, status)] += 1
+
+    def register(self, name, kind, help, collect):
+        # collect() is called at scrape time and returns {labels: number}
+        self.collectors[name] = (kind, help, collect)
+
+    def render(self):
+        with self.lock:
+            snapshot = {key: {name: (list(h.counts), h.sum, h.count) for name, h in histograms.items()}
+                        for key, histograms in self.histograms.items()}
+            responses = dict(self.responses)
+
+        lines = [f'# HELP {PREFIX}_responses_total Responses by route, method and status',
+                 f'# TYPE {PREFIX}_responses_total counter']
+        for (route, method, status), value in sorted(responses.items()):
+            lines.append(f'{PREFIX}_responses_total{{route="{route}",method="{method}",status="{status}"}} {value}')
+
+        for name, help, buckets in HISTOGRAMS:
+            lines.append(f'# HELP {PREFIX}_{name} {help}')
+            lines.append(f'# TYPE {PREFIX}_{name} histogram')
+            for (route, method), histograms in sorted(snapshot.items()):
+                counts, total, count = histograms[name]
+                labels = f'route="{route}",method="{method}"'
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{PREFIX}_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}_{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'{PREFIX}_{name}_sum{{{labels}}} {total}')
+                lines.append(f'{PREFIX}_{name}_count{{{labels}}} {count}')
+
+        for name, (kind, help, collect) in sorted(self.collectors.items()):
+            lines.append(f'# HELP {PREFIX}_{name} {help}')
+            lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+            for labels, value in sorted(collect().items()):
+                lines.append(f'{PREFIX}_{name}{{{labels}}} {value}' if labels else f'{PREFIX}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _timings():
+    if has_request_context():
+        return g.get('timings')
+    return None
+
+
+def add_serialize_time(seconds):
+    timings = _timings()
+    if timings is not None:
+        timings.serialize += seconds
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Statements run by the enrollment writer thread have no request context
+    # and are not attributed to any request
+    timings = _timings()
+    if timings is not None and context is not None:
+        timings.queries += 1
+        timings.sql += perf_counter() - getattr(context, '_metrics_started', perf_counter())
+
+
+def _start():
+    g.timings = RequestTimings()
+
+
+def _finish(response):
+    timings = g.pop('timings', None)
+    if timings is None:
+        return response
+    duration = perf_counter() - timings.started
+    response.headers['Server-Timing'] = (
+        f'app;dur={duration * 1000:.2f}, '
+        f'db;dur={timings.sql * 1000:.2f};desc="{timings.queries} queries", '
+        f'serialize;dur={timings.serialize * 1000:.2f}'
+    )
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    size = None if response.is_streamed else response.content_length
+    registry.record(route, request.method, response.status_code, timings, duration, size)
+    return response
+
+
+def init_app(app):
+    app.before_request(_start)
+    app.after_request(_finish)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
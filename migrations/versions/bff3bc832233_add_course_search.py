@@ -0,0 +1,67 @@
+"""add course search
+
+Revision ID: bff3bc832233
+Revises: 30ca9fc30097
+Create Date: 2026-10-18 20:37:41.775571
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'bff3bc832233'
+down_revision = '30ca9fc30097'
+branch_labels = None
+depends_on = None
+
+
+# Copied from search.py at the time of writing, so later changes there do
+# not rewrite history
+SQLITE_UPGRADE = (
+    "CREATE VIRTUAL TABLE courses_fts USING fts5("
+    "title, course_code, description, content='courses', content_rowid='id', "
+    "tokenize='porter unicode61 remove_diacritics 2', prefix='1 2 3 4 5 6')",
+    "CREATE TRIGGER courses_fts_insert AFTER INSERT ON courses BEGIN "
+    "INSERT INTO courses_fts (rowid, title, course_code, description) "
+    "VALUES (new.id, new.title, new.course_code, new.description); END",
+    "CREATE TRIGGER courses_fts_delete AFTER DELETE ON courses BEGIN "
+    "INSERT INTO courses_fts (courses_fts, rowid, title, course_code, description) "
+    "VALUES ('delete', old.id, old.title, old.course_code, old.description); END",
+    "CREATE TRIGGER courses_fts_update AFTER UPDATE OF title, course_code, description ON courses BEGIN "
+    "INSERT INTO courses_fts (courses_fts, rowid, title, course_code, description) "
+    "VALUES ('delete', old.id, old.title, old.course_code, old.description); "
+    "INSERT INTO courses_fts (rowid, title, course_code, description) "
+    "VALUES (new.id, new.title, new.course_code, new.description); END",
+    "INSERT INTO courses_fts (courses_fts) VALUES ('rebuild')",
+)
+SQLITE_DOWNGRADE = (
+    "DROP TRIGGER courses_fts_update",
+    "DROP TRIGGER courses_fts_delete",
+    "DROP TRIGGER courses_fts_insert",
+    "DROP TABLE courses_fts",
+)
+POSTGRESQL_UPGRADE = (
+    "ALTER TABLE courses ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(course_code, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')) STORED",
+    "CREATE INDEX ix_courses_search_vector ON courses USING gin (search_vector)",
+)
+POSTGRESQL_DOWNGRADE = (
+    "DROP INDEX ix_courses_search_vector",
+    "ALTER TABLE courses DROP COLUMN search_vector",
+)
+
+
+def _run(sqlite, postgresql):
+    dialect = op.get_bind().dialect.name
+    for statement in {'sqlite': sqlite, 'postgresql': postgresql}.get(dialect, ()):
+        op.execute(statement)
+
+
+def upgrade():
+    _run(SQLITE_UPGRADE, POSTGRESQL_UPGRADE)
+
+
+def downgrade():
+    _run(SQLITE_DOWNGRADE, POSTGRESQL_DOWNGRADE)
@@ -10,6 +10,7 @@ from flask_bcrypt import Bcrypt
 
 # Define naming convention
 metadata = MetaData(naming_convention={
+    "ix": "ix_%(column_0_label)s",
     "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
 })
 
@@ -21,16 +22,21 @@ class Users(db.Model, SerializerMixin):
     __tablename__ = 'users'
 
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(50), nullable=False)
+    username = db.Column(db.String(50), nullable=False, unique=True, index=True)
     email = db.Column(db.String(100), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     password_hash = db.Column(db.String)
     role = db.Column(db.String(50), nullable=False)
+    # Bumped by authentication.invalidate_user; cached principals of an older
+    # version are rejected in every worker
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
+    # passive_deletes leaves dependents to ON DELETE CASCADE in the database;
+    # cascades.py keeps the derived tables in step
     student_profile = db.relationship(
-        'Students', back_populates='user', uselist=False, cascade='all, delete-orphan')
+        'Students', back_populates='user', uselist=False, cascade='all, delete-orphan', passive_deletes=True)
     instructor_profile = db.relationship(
-        'Instructors', back_populates='user', uselist=False, cascade='all, delete-orphan')
+        'Instructors', back_populates='user', uselist=False, cascade='all, delete-orphan', passive_deletes=True)
 
     serialize_rules = ('-student_profile.user', '-instructor_profile.user')
 
@@ -68,10 +74,10 @@ class Students(db.Model, SerializerMixin):
     age = db.Column(db.Integer, nullable=False)
     student_id = db.Column(db.String(20), unique=True, nullable=False)
     enrolment_year = db.Column(db.Integer, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
 
     user = db.relationship('Users', back_populates='student_profile')
-    enrollments = db.relationship('Enrollments', back_populates='student', cascade='all, delete-orphan')
+    enrollments = db.relationship('Enrollments', back_populates='student', cascade='all, delete-orphan', passive_deletes=True)
     courses = association_proxy('enrollments', 'course')
 
     serialize_rules = ('-user.student_profile', '-enrollments.student')
@@ -86,10 +92,10 @@ class Instructors(db.Model, SerializerMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     specialty = db.Column(db.String(100), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
 
     user = db.relationship('Users', back_populates='instructor_profile')
-    courses = db.relationship('Courses', back_populates='instructor', cascade='all, delete-orphan')
+    courses = db.relationship('Courses', back_populates='instructor', cascade='all, delete-orphan', passive_deletes=True)
 
     serialize_rules = ('-user.instructor_profile', '-courses.instructor')
 
@@ -104,33 +110,49 @@ class Courses(db.Model, SerializerMixin):
     title = db.Column(db.String(50), nullable=False)
     course_code = db.Column(db.String(10), unique=True, nullable=False)
     description = db.Column(db.String(200), nullable=False)
-    credit_hours = db.Column(db.Integer, nullable=False)
+    # transcripts.py reweights the course's grades when this changes
+    credit_hours = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)
     max_capacity = db.Column(db.Integer, nullable=False)
-    instructor_id = db.Column(db.Integer, db.ForeignKey('instructors.id'), nullable=False)
+    instructor_id = db.Column(db.Integer, db.ForeignKey('instructors.id', ondelete='CASCADE'), nullable=False)
+    # Kept in step with enrollments by counters.py; rebuild with `flask seats rebuild`
+    enrolled_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     instructor = db.relationship('Instructors', back_populates='courses')
-    enrollments = db.relationship('Enrollments', back_populates='course', cascade='all, delete-orphan')
+    enrollments = db.relationship('Enrollments', back_populates='course', cascade='all, delete-orphan', passive_deletes=True)
     students = association_proxy('enrollments', 'student')
 
-    serialize_rules = ('-instructor.courses', '-enrollments.course')
+    serialize_rules = ('-instructor.courses', '-enrollments.course', 'seats_remaining')
+
+    # Back the ?instructor_id= and ?credit_hours= filters (see filtering.py)
+    __table_args__ = (
+        db.Index('ix_courses_instructor_id_credit_hours', 'instructor_id', 'credit_hours'),
+        db.Index('ix_courses_credit_hours', 'credit_hours'),
+    )
 
     def __repr__(self):
         return f'<Course {self.course_code} {self.title}>'
 
     def current_enrollment(self):
-        return len([enrollment for enrollment in self.enrollments if enrollment.status == 'enrolled'])
+        return self.enrolled_count
+
+    @property
+    def seats_remaining(self):
+        return max(self.max_capacity - self.enrolled_count, 0)
 
 
 class Enrollments(db.Model, SerializerMixin):
     __tablename__ = 'enrollments'
 
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
-    grade = db.Column(db.String(3), nullable=True)
-    semester = db.Column(db.String(10), nullable=False)
+    # active_history loads the old value when one of these is set on an
+    # expired instance, so counters.py, summaries.py and transcripts.py can see
+    # what changed
+    student_id = db.column_property(db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), nullable=False), active_history=True)
+    course_id = db.column_property(db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False), active_history=True)
+    grade = db.column_property(db.Column(db.String(3), nullable=True), active_history=True)
+    semester = db.column_property(db.Column(db.String(10), nullable=False), active_history=True)
     enrollment_date = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(10), nullable=False, default='enrolled')
+    status = db.column_property(db.Column(db.String(10), nullable=False, default='enrolled'), active_history=True)
 
     student = db.relationship('Students', back_populates='enrollments')
     course = db.relationship('Courses', back_populates='enrollments')
@@ -142,4 +164,94 @@ class Enrollments(db.Model, SerializerMixin):
     
     __table_args__ = (
         db.UniqueConstraint('student_id', 'course_id', 'semester', name='unique_enrollment_per_semester'),
-    )
\ No newline at end of file
+        # The unique constraint's index already covers ?student_id=; SQLite
+        # appends the rowid to every index, so equality on all of an index's
+        # columns also returns rows in id order for keyset pagination
+        db.Index('ix_enrollments_course_id_semester_status', 'course_id', 'semester', 'status'),
+        db.Index('ix_enrollments_semester_status', 'semester', 'status'),
+        db.Index('ix_enrollments_semester', 'semester'),
+        db.Index('ix_enrollments_status', 'status'),
+    )
+
+class EnrollmentSummary(db.Model):
+    __tablename__ = 'enrollment_summary'
+
+    # COUNT(*) of enrollments per course, semester, status and grade ('' when
+    # ungraded), kept in step by summaries.py; rebuild with `flask summaries rebuild`
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), primary_key=True)
+    semester = db.Column(db.String(10), primary_key=True)
+    status = db.Column(db.String(10), primary_key=True)
+    grade = db.Column(db.String(3), primary_key=True, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<EnrollmentSummary {self.course_id} {self.semester} {self.status} {self.grade} {self.count}>'
+
+
+class TranscriptTerms(db.Model):
+    __tablename__ = 'transcript_terms'
+
+    # One row per student and semester with at least one enrollment that was
+    # not dropped, kept in step by transcripts.py; rebuild with
+    # `flask transcripts rebuild`. GPA is grade_points / gpa_credits.
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), primary_key=True)
+    semester = db.Column(db.String(10), primary_key=True)
+    courses = db.Column(db.Integer, nullable=False, default=0)
+    credits_attempted = db.Column(db.Integer, nullable=False, default=0)
+    credits_earned = db.Column(db.Integer, nullable=False, default=0)
+    gpa_credits = db.Column(db.Integer, nullable=False, default=0)
+    grade_points = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<TranscriptTerm {self.student_id} {self.semester}>'
+
+
+class Changes(db.Model):
+    __tablename__ = 'changes'
+
+    # Inserts, updates and deletes on the entity tables, written by
+    # changelog.py. (txid, id) is the /api/changes cursor: txid is the writing
+    # transaction on PostgreSQL and 0 on SQLite. AUTOINCREMENT keeps SQLite
+    # from handing out the ids of pruned rows again.
+    id = db.Column(db.Integer, primary_key=True)
+    txid = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    table_name = db.Column(db.String(64), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(6), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_changes_txid_id', 'txid', 'id'),
+        db.Index('ix_changes_table_name_row_id', 'table_name', 'row_id'),
+        db.Index('ix_changes_changed_at', 'changed_at'),
+        {'sqlite_autoincrement': True},
+    )
+
+    def __repr__(self):
+        return f'<Change {self.id} {self.operation} {self.table_name} {self.row_id}>'
+
+
+class ChangeLogState(db.Model):
+    __tablename__ = 'change_log_state'
+
+    # A single row: changes up to (purged_txid, purged_through) have been
+    # pruned, so clients holding an older cursor have to reload everything
+    id = db.Column(db.Integer, primary_key=True)
+    purged_through = db.Column(db.Integer, nullable=False, default=0)
+    purged_txid = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    pruned_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ChangeLogState {self.purged_through}>'
+
+
+class TableVersions(db.Model):
+    __tablename__ = 'table_versions'
+
+    # One row per table, bumped in the writing transaction by versions.py
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<TableVersion {self.table_name} {self.version}>'
@@ -0,0 +1,70 @@
+import base64
+import binascii
+import json
+from urllib.parse import urlencode
+
+from flask import request
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(last_id, **position):
+    raw = json.dumps({'id': last_id, **position}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, *position):
+    # The last id, or (last id, *position) with 0 for a key the cursor lacks
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        last_id = int(values['id'])
+        if not position:
+            return last_id
+        return (last_id, *(int(values.get(key, 0)) for key in position))
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError):
+        raise PaginationError('Invalid cursor')
+
+
+def page_args():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    after = request.args.get('after')
+    return limit, decode_cursor(after) if after else None
+
+
+def next_page_headers(cursor, limit):
+    args = request.args.to_dict()
+    args.update(after=cursor, limit=limit)
+    return {
+        'X-Next-Cursor': cursor,
+        'Link': f'<{request.base_url}?{urlencode(args)}>; rel="next"',
+    }
+
+
+def paginate(query, key):
+    # Keyset pagination: WHERE key > :after ORDER BY key LIMIT :limit, so every
+    # page is an index range scan no matter how deep the client has paged.
+    limit, after = page_args()
+    if after is not None:
+        query = query.filter(key > after)
+
+    # Fetch one extra row to learn whether another page exists
+    items = query.order_by(key).limit(limit + 1).all()
+    if len(items) <= limit:
+        return items, {}
+
+    items = items[:limit]
+    cursor = encode_cursor(getattr(items[-1], key.key))
+    return items, next_page_headers(cursor, limit)
@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+
+import bcrypt
+
+# Kept free of Flask and model imports so spawned pool workers start quickly.
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def check_password(password, hashed):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+def hash_rounds(hashed):
+    # $2b$12$<salt+digest>
+    return int(hashed.split('$')[2])
+
+
+def hashing_pool(workers=None):
+    # spawn rather than fork: the server process is multi-threaded
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def hash_many(pool, passwords, rounds):
+    return list(pool.map(hash_password, passwords, repeat(rounds), chunksize=8))
+
+
+class PasswordHasher:
+    # Runs bcrypt in worker processes, so a request thread only waits on a
+    # future and the rest of the server keeps its share of the GIL. At most
+    # max_pending operations are queued; past that a caller waits up to
+    # `wait` seconds for a slot and then gets HasherBusy instead of joining
+    # an unbounded queue.
+
+    def __init__(self, rounds=12, workers=None, max_pending=None, wait=1.0):
+        workers = workers or os.cpu_count() or 1
+        self.rounds = rounds
+        self.wait = wait
+        self.workers = workers
+        self.pool = hashing_pool(workers)
+        self.slots = threading.BoundedSemaphore(max_pending or workers * 4)
+
+    def _replace(self, broken):
+        # Once per broken pool, however many threads saw it break
+        with _hasher_lock:
+            if self.pool is broken:
+                self.pool = hashing_pool(self.workers)
+        broken.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        if not self.slots.acquire(timeout=self.wait):
+            raise HasherBusy()
+        try:
+            pool = self.pool
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A worker died (an OOM kill, say) and took the pool with it
+                self._replace(pool)
+                return self.pool.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.rounds)
+
+    def verify(self, password, hashed):
+        if not hashed:
+            return False
+        return self._run(check_password, password, hashed)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    # One pool per process, created on first use so forked server workers
+    # never share the parent's
+    from flask import current_app
+
+    hasher = current_app.extensions.get('password_hasher')
+    if hasher is None:
+        with _hasher_lock:
+            hasher = current_app.extensions.get('password_hasher')
+            if hasher is None:
+                config = current_app.config
+                hasher = PasswordHasher(
+                    rounds=config.get('BCRYPT_LOG_ROUNDS', 12),
+                    workers=config.get('PASSWORD_WORKERS'),
+                    max_pending=config.get('PASSWORD_MAX_PENDING'),
+                    wait=config.get('PASSWORD_QUEUE_TIMEOUT', 1.0),
+                )
+                current_app.extensions['password_hasher'] = hasher
+    return hasher
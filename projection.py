@@ -0,0 +1,101 @@
+from functools import lru_cache
+
+from flask import request
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, load_only, raiseload, selectinload
+
+from serializers import column_keys, compile_projection, is_hidden, to_dict
+
+
+class ProjectionError(ValueError):
+    pass
+
+
+class Projection:
+    def __init__(self, options, serialize, tables=None):
+        self.options = options
+        self.serialize = serialize
+        # Tables the serialized output reads; None for the full default graph
+        self.tables = tables
+
+
+def _split(value):
+    return tuple(sorted({part.strip() for part in (value or '').split(',') if part.strip()}))
+
+
+def from_request(model, load_plan, default_fields=None):
+    # ?fields=id,title,instructor.name selects columns (dotted names reach into
+    # relationships); ?include=instructor,enrollments.student adds relationships
+    # with all of their columns. Without either the full default graph is
+    # served, or default_fields where the resource has a leaner default.
+    fields = _split(request.args.get('fields'))
+    include = _split(request.args.get('include'))
+    if not fields and not include:
+        if default_fields is None:
+            return Projection(load_plan, to_dict)
+        fields = default_fields
+    return _compile(model, fields, include)
+
+
+class _Node:
+    def __init__(self, model):
+        self.model = model
+        self.mapper = inspect(model)
+        self.columns = set()
+        self.relations = {}
+
+    def relation(self, key):
+        prop = self.mapper.relationships.get(key)
+        if prop is None:
+            raise ProjectionError(f'Unknown relationship {key!r} on {self.model.__name__}')
+        if key not in self.relations:
+            self.relations[key] = _Node(prop.mapper.class_)
+        return self.relations[key]
+
+    def column_keys(self):
+        # A node with no explicitly requested columns returns all of them
+        if self.columns:
+            return sorted(self.columns)
+        return column_keys(self.model)
+
+    def tables(self):
+        tables = {self.mapper.local_table.name}
+        for node in self.relations.values():
+            tables |= node.tables()
+        return tables
+
+    def tree(self):
+        return self.column_keys(), {key: node.tree() for key, node in self.relations.items()}
+
+    def options(self):
+        columns = [getattr(self.model, key) for key in self.column_keys()]
+        options = [load_only(*columns, raiseload=True), raiseload('*')]
+        for key, node in self.relations.items():
+            prop = self.mapper.relationships[key]
+            loader = selectinload if prop.uselist else joinedload
+            options.append(loader(getattr(self.model, key)).options(*node.options()))
+        return options
+
+
+@lru_cache(maxsize=256)
+def _compile(model, fields, include):
+    root = _Node(model)
+    for path in include:
+        node = root
+        for key in path.split('.'):
+            node = node.relation(key)
+
+    for path in fields:
+        *parents, key = path.split('.')
+        node = root
+        for parent in parents:
+            node = node.relation(parent)
+        if key in node.mapper.relationships:
+            node.relation(key)
+        elif key in node.mapper.column_attrs and not is_hidden(node.model, key):
+            node.columns.add(key)
+        else:
+            raise ProjectionError(f'Unknown field {key!r} on {node.model.__name__}')
+
+    columns, relations = root.tree()
+    return Projection(root.options(), compile_projection(model, columns, relations), tuple(sorted(root.tables())))
@@ -0,0 +1,137 @@
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import changelog
+from models import db, Enrollments
+from counters import ENROLLED, take_seats, release_seats
+from summaries import apply_summary_deltas, summary_deltas, summary_key
+from transcripts import apply_enrollment_changes
+
+CREATED = 'created'
+FULL = 'full'
+DUPLICATE = 'duplicate'
+
+
+def enrollment_values(data):
+    # Raises KeyError/ValueError/TypeError for malformed payloads
+    return {
+        'student_id': int(data['student_id']),
+        'course_id': int(data['course_id']),
+        'grade': data.get('grade'),
+        'semester': str(data['semester']),
+        'enrollment_date': datetime.fromisoformat(data['enrollment_date']) if data.get('enrollment_date') else datetime.utcnow(),
+        'status': data.get('status', ENROLLED)
+    }
+
+
+def enrollment_fact(values):
+    # What transcripts.py needs to know about an enrollment
+    return values['student_id'], values['course_id'], values['semester'], values['status'], values['grade']
+
+
+def insert_ignoring_duplicates(connection):
+    insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    return insert(Enrollments).on_conflict_do_nothing()
+
+
+def write_enrollment(connection, values):
+    # Seat first, then the row: if the row turns out to be a duplicate the
+    # seat is handed back inside the same transaction.
+    enrolled = values['status'] == ENROLLED
+    if enrolled and not take_seats(connection, values['course_id']):
+        return FULL, None
+
+    enrollment_id = connection.execute(
+        insert_ignoring_duplicates(connection).values(**values).returning(Enrollments.id)
+    ).scalar()
+    if enrollment_id is None:
+        if enrolled:
+            release_seats(connection, values['course_id'])
+        return DUPLICATE, None
+    apply_summary_deltas(connection, summary_deltas(
+        None, summary_key(values['course_id'], values['semester'], values['status'], values['grade'])))
+    apply_enrollment_changes(connection, [(None, enrollment_fact(values))])
+    changelog.record(connection, Enrollments.__tablename__, [enrollment_id], changelog.INSERT)
+    return CREATED, enrollment_id
+
+
+class EnrollmentWriter:
+    # Group commit for enrollment POSTs. Request threads queue their rows and
+    # block on a future; one writer thread drains whatever has queued up
+    # while the previous batch was committing and writes it in a single
+    # transaction, so SQLite's write lock is taken once per batch instead
+    # of once per request.
+
+    def __init__(self, engine, max_batch=64):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='enrollment-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, values):
+        future = Future()
+        self.pending.put((values, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.pending.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            outcomes = []
+            try:
+                with self.engine.begin() as connection:
+                    if connection.dialect.name == 'sqlite':
+                        # pysqlite only opens a transaction before DML, and a
+                        # SAVEPOINT taken outside one commits on release
+                        connection.exec_driver_sql('BEGIN IMMEDIATE')
+                    for values, _ in batch:
+                        # One row failing (say a student deleted since the
+                        # request checked it) fails only its own request
+                        try:
+                            with connection.begin_nested():
+                                outcomes.append((True, write_enrollment(connection, values)))
+                        except Exception as e:
+                            outcomes.append((False, e))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), (ok, outcome) in zip(batch, outcomes):
+                if ok:
+                    future.set_result(outcome)
+                else:
+                    future.set_exception(outcome)
+
+
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    # Started lazily so that forked server workers each get their own thread
+    writer = current_app.extensions.get('enrollment_writer')
+    if writer is None:
+        with _writer_lock:
+            writer = current_app.extensions.get('enrollment_writer')
+            if writer is None:
+                writer = EnrollmentWriter(db.engine, current_app.config.get('ENROLLMENT_BATCH_SIZE', 64))
+                current_app.extensions['enrollment_writer'] = writer
+    return writer
+
+
+def enroll(values, timeout=30):
+    return get_writer().submit(values).result(timeout)
@@ -0,0 +1,144 @@
+import zlib
+
+import orjson
+from flask import current_app, make_response, request
+
+try:
+    import brotli
+except ImportError:  # optional: br is offered only where it is installed
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # optional: application/msgpack is offered only where it is installed
+    msgpack = None
+
+# The response pipeline. Resources' payloads are encoded as compact JSON by
+# orjson, or pretty-printed with ?pretty=1, or as MessagePack when the client
+# prefers it in Accept. Bodies above RESPONSE_COMPRESS_MIN_BYTES are then
+# compressed with the best Content-Encoding the client accepts.
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+COMPRESS_MIN_BYTES = 1024
+# Fast levels: on list pages they keep most of the saving of the slowest
+# settings for a fraction of the CPU
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+COMPRESSIBLE = {JSON, MSGPACK, 'application/x-ndjson', 'text/csv', 'text/plain'}
+
+
+def dumps(data, pretty=False):
+    options = orjson.OPT_NON_STR_KEYS
+    if pretty:
+        options |= orjson.OPT_INDENT_2
+    return orjson.dumps(data, option=options)
+
+
+def pretty_requested():
+    return request.args.get('pretty', '').lower() in ('1', 'true', 'yes')
+
+
+def _response(body, code, headers, mimetype):
+    response = make_response(body, code)
+    response.headers.extend(headers or {})
+    response.mimetype = mimetype
+    return response
+
+
+def output_json(data, code, headers=None):
+    return _response(dumps(data, pretty_requested()), code, headers, JSON)
+
+
+def output_msgpack(data, code, headers=None):
+    return _response(msgpack.packb(data, use_bin_type=True), code, headers, MSGPACK)
+
+
+# Ordered by preference; the first is the default
+REPRESENTATIONS = {JSON: output_json}
+if msgpack is not None:
+    REPRESENTATIONS[MSGPACK] = output_msgpack
+
+
+def negotiated():
+    return request.accept_mimetypes.best_match(list(REPRESENTATIONS), default=JSON) or JSON
+
+
+def render(data, code, headers=None):
+    return REPRESENTATIONS[negotiated()](data, code, headers)
+
+
+def _gzip():
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _deflate():
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS)
+
+
+class _Brotli:
+    # compressobj()'s interface over brotli's
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self, mode=zlib.Z_FINISH):
+        return self.compressor.finish() if mode == zlib.Z_FINISH else self.compressor.flush()
+
+
+# Ordered by preference when the client accepts several equally
+ENCODINGS = {'gzip': _gzip, 'deflate': _deflate}
+if brotli is not None:
+    ENCODINGS = {'br': _Brotli, **ENCODINGS}
+
+
+def compress(body, encoding):
+    compressor = ENCODINGS[encoding]()
+    return compressor.compress(body) + compressor.flush()
+
+
+def _compress_stream(chunks, compressor):
+    # Flushed after every chunk, so that import progress events are not held
+    # back; exports already write ~64KB chunks
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        yield data + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def _accepted_encoding():
+    offered = request.accept_encodings
+    best = max(ENCODINGS, key=lambda encoding: offered[encoding], default=None)
+    return best if best is not None and offered[best] > 0 else None
+
+
+def _compress_response(response):
+    if response.mimetype in REPRESENTATIONS or response.status_code == 304:
+        response.vary.update(('Accept', 'Accept-Encoding'))
+    elif response.mimetype in COMPRESSIBLE:
+        response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 304) or request.method == 'HEAD'
+            or response.mimetype not in COMPRESSIBLE or 'Content-Encoding' in response.headers):
+        return response
+    encoding = _accepted_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # Exports and import progress: compress as the chunks go out
+        response.response = _compress_stream(response.response, ENCODINGS[encoding]())
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < current_app.config.get('RESPONSE_COMPRESS_MIN_BYTES', COMPRESS_MIN_BYTES):
+            return response
+        response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app, api):
+    api.representations = dict(REPRESENTATIONS)
+    app.after_request(_compress_response)
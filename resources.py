@@ -1,15 +1,54 @@
-from flask import request
+from flask import Response, current_app, request, stream_with_context
 from flask_restful import Resource
 from models import db, Users, Students, Instructors, Courses, Enrollments
-from datetime import datetime
-import jwt
-import flask_bcrypt as Bcrypt
+from pagination import paginate, PaginationError
+import authentication
+import loading
+import metrics
+import projection
+from projection import ProjectionError
+import passwords
+import registration
+import search
+import analytics
+import transcripts
+import changelog
+import bulk
+import conditional
+import response_cache
+import export
+import filtering
+import importer
+from bulk import BatchError
+from changelog import ChangeFeedError, CursorExpired
+from counters import CourseFull
+from filtering import FilterError
+from passwords import HasherBusy
+from search import SearchError
+from serializers import to_dict
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+import io
+import json
+import shutil
+import tempfile
+
+SERVER_BUSY = {'error': 'Server busy, please retry'}, 503, {'Retry-After': '1'}
 
 
 class UsersResource(Resource):
+    load_plan = loading.USERS
+
     def get(self):
-        users = Users.query.all()
-        return [user.to_dict() for user in users], 200
+        try:
+            mimetype = export.requested_format()
+            if mimetype:
+                return export.export(Users, self.load_plan, mimetype)
+            view = projection.from_request(Users, self.load_plan)
+            users, headers = paginate(Users.query.options(*view.options), Users.id)
+        except (PaginationError, ProjectionError) as e:
+            return {'error': str(e)}, 400
+        return [view.serialize(user) for user in users], 200, headers
 
     def post(self):
         data = request.get_json()
@@ -22,7 +61,7 @@ class UsersResource(Resource):
             )
             db.session.add(user)
             db.session.commit()
-            return user.to_dict(), 201
+            return to_dict(user), 201
         except Exception as e:
             return {'error': str(e)}, 400
 
@@ -33,32 +72,39 @@ class SighnupResource(Resource):
         if not data.get('name') or not data.get('password') or not data.get('email'):
             return {'error': 'Name, email and password are required'}, 400
 
-        if Users.query.filter_by(username=data['name']).first():
-            return {'error': 'Username already exists'}, 400
-
-        if Users.query.filter_by(email=data['email']).first():
-            return {'error': 'Email already exists'}, 400
-
         try:
-
-            user = Users(
-               username=data['name'],
-               email=data['email'],
-               role='student'
-
-            )
-
-            user.set_password(data['password'])
-
+            password_hash = passwords.get_hasher().hash(data['password'])
+        except HasherBusy:
+            return SERVER_BUSY
+
+        # One INSERT: the unique indexes on username and email report
+        # duplicates instead of two SELECTs beforehand
+        user = Users(
+            username=data['name'],
+            email=data['email'],
+            role='student',
+            password_hash=password_hash
+        )
+        try:
             db.session.add(user)
-            db.session.commit()
-            token = user.generate_token()
-            return{
-                'user': user.to_dict(),
-                'token': token
+            db.session.flush()
+            # A new user has no profiles; saying so saves two lazy loads
+            set_committed_value(user, 'student_profile', None)
+            set_committed_value(user, 'instructor_profile', None)
+            body = {
+                'user': to_dict(user),
+                'token': user.generate_token()
             }
+            db.session.commit()
+            return body
 
+        except IntegrityError as e:
+            db.session.rollback()
+            if 'username' in str(e.orig):
+                return {'error': 'Username already exists'}, 400
+            return {'error': 'Email already exists'}, 400
         except Exception as e:
+            db.session.rollback()
             return {'error': str(e)}, 400
 
 class LoginResource(Resource):
@@ -68,16 +114,28 @@ class LoginResource(Resource):
         if not data.get ('email') or not data.get ('password'):
             return {'error': 'Email and password are required'}, 400
 
-        user=Users.query.filter_by(email=data['email']).first()
-
-        if not user or not user.check_password(data['password']):
+        user = Users.query.options(*loading.USERS).filter_by(email=data['email']).first()
+        if not user:
             return {'error': 'Invalid email or password'}, 401
 
-        token = user.generate_token()
-        return{
-            'user': user.to_dict(),
-            'token': token
-        }, 200
+        hasher = passwords.get_hasher()
+        try:
+            if not hasher.verify(data['password'], user.password_hash):
+                return {'error': 'Invalid email or password'}, 401
+            # BCRYPT_LOG_ROUNDS changed since this hash was made
+            rehash = hasher.needs_rehash(user.password_hash)
+            if rehash:
+                user.password_hash = hasher.hash(data['password'])
+        except HasherBusy:
+            return SERVER_BUSY
+
+        body = {
+            'user': to_dict(user),
+            'token': user.generate_token()
+        }
+        if rehash:
+            db.session.commit()
+        return body, 200
 
 class LogoutResource(Resource):
     def post(self):
@@ -91,9 +149,15 @@ class LogoutResource(Resource):
         
 
 class UserByIdResource(Resource):
+    load_plan = loading.USERS
+
     def get(self, user_id):
-        user = Users.query.get_or_404(user_id)
-        return user.to_dict(), 200
+        try:
+            view = projection.from_request(Users, self.load_plan)
+        except ProjectionError as e:
+            return {'error': str(e)}, 400
+        user = Users.query.options(*view.options).get_or_404(user_id)
+        return view.serialize(user), 200
 
     def patch(self, user_id):
         user = Users.query.get_or_404(user_id)
@@ -102,8 +166,9 @@ class UserByIdResource(Resource):
             for attr, value in data.items():
                 if hasattr(user, attr):
                     setattr(user, attr, value)
+            authentication.invalidate_user(user)
             db.session.commit()
-            return user.to_dict(), 200
+            return to_dict(user), 200
         except Exception as e:
             return {'error': str(e)}, 400
 
@@ -115,9 +180,18 @@ class UserByIdResource(Resource):
 
 
 class StudentsResource(Resource):
+    load_plan = loading.STUDENTS
+
     def get(self):
-        students = Students.query.all()
-        return [student.to_dict() for student in students], 200
+        try:
+            mimetype = export.requested_format()
+            if mimetype:
+                return export.export(Students, self.load_plan, mimetype)
+            view = projection.from_request(Students, self.load_plan)
+            students, headers = paginate(Students.query.options(*view.options), Students.id)
+        except (PaginationError, ProjectionError) as e:
+            return {'error': str(e)}, 400
+        return [view.serialize(student) for student in students], 200, headers
 
     def post(self):
         data = request.get_json()
@@ -142,16 +216,22 @@ class StudentsResource(Resource):
             )
             db.session.add(student)
             db.session.commit()
-            return student.to_dict(), 201
+            return to_dict(student), 201
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 400
 
 
 class StudentByIdResource(Resource):
+    load_plan = loading.STUDENTS
+
     def get(self, student_id):
-        student = Students.query.get_or_404(student_id)
-        return student.to_dict(), 200
+        try:
+            view = projection.from_request(Students, self.load_plan)
+        except ProjectionError as e:
+            return {'error': str(e)}, 400
+        student = Students.query.options(*view.options).get_or_404(student_id)
+        return view.serialize(student), 200
 
     def patch(self, student_id):
         student = Students.query.get_or_404(student_id)
@@ -161,7 +241,7 @@ class StudentByIdResource(Resource):
                 if hasattr(student, attr):
                     setattr(student, attr, value)
             db.session.commit()
-            return student.to_dict(), 200
+            return to_dict(student), 200
         except Exception as e:
             return {'error': str(e)}, 400
 
@@ -173,9 +253,21 @@ class StudentByIdResource(Resource):
 
 
 class CoursesResource(Resource):
+    load_plan = loading.COURSES
+    filters = filtering.COURSES
+
+    @response_cache.cached(Courses)
     def get(self):
-        courses = Courses.query.all()
-        return [course.to_dict() for course in courses], 200
+        try:
+            criteria = filtering.from_request(self.filters)
+            mimetype = export.requested_format()
+            if mimetype:
+                return export.export(Courses, self.load_plan, mimetype, criteria)
+            view = projection.from_request(Courses, self.load_plan)
+            courses, headers = paginate(Courses.query.options(*view.options).filter(*criteria), Courses.id)
+        except (PaginationError, ProjectionError, FilterError) as e:
+            return {'error': str(e)}, 400
+        return [view.serialize(course) for course in courses], 200, headers
 
     def post(self):
         data = request.get_json()
@@ -190,15 +282,43 @@ class CoursesResource(Resource):
             )
             db.session.add(course)
             db.session.commit()
-            return course.to_dict(), 201
+            return to_dict(course), 201
         except Exception as e:
             return {'error': str(e)}, 400
 
 
+class CourseSearchResource(Resource):
+    load_plan = loading.COURSES
+    # A results list, not the catalog: skip the nested enrollments
+    default_fields = ('course_code', 'credit_hours', 'description', 'enrolled_count', 'id',
+                      'instructor.id', 'instructor.name', 'instructor_id', 'max_capacity', 'title')
+
+    def get(self):
+        try:
+            terms, limit = search.search_args()
+            view = projection.from_request(Courses, self.load_plan, self.default_fields)
+        except (SearchError, ProjectionError) as e:
+            return {'error': str(e)}, 400
+        ids = search.ranked_course_ids(terms, limit)
+        if not ids:
+            return [], 200
+        courses = {course.id: course for course in Courses.query.options(*view.options).filter(Courses.id.in_(ids))}
+        return [view.serialize(courses[course_id]) for course_id in ids if course_id in courses], 200
+
+
 class CourseByIdResource(Resource):
+    load_plan = loading.COURSES
+
     def get(self, course_id):
-        course = Courses.query.get_or_404(course_id)
-        return course.to_dict(), 200
+        try:
+            view = projection.from_request(Courses, self.load_plan)
+        except ProjectionError as e:
+            return {'error': str(e)}, 400
+        not_modified, cache_headers = conditional.check(view.tables)
+        if not_modified:
+            return not_modified
+        course = Courses.query.options(*view.options).get_or_404(course_id)
+        return view.serialize(course), 200, cache_headers
 
     def patch(self, course_id):
         course = Courses.query.get_or_404(course_id)
@@ -208,7 +328,7 @@ class CourseByIdResource(Resource):
                 if hasattr(course, attr):
                     setattr(course, attr, value)
             db.session.commit()
-            return course.to_dict(), 200
+            return to_dict(course), 200
         except Exception as e:
             return {'error': str(e)}, 400
 
@@ -220,32 +340,69 @@ class CourseByIdResource(Resource):
 
 
 class EnrollmentsResource(Resource):
+    load_plan = loading.ENROLLMENTS
+    filters = filtering.ENROLLMENTS
+
     def get(self):
-        enrollments = Enrollments.query.all()
-        return [enrollment.to_dict() for enrollment in enrollments], 200
+        try:
+            criteria = filtering.from_request(self.filters)
+            mimetype = export.requested_format()
+            if mimetype:
+                return export.export(Enrollments, self.load_plan, mimetype, criteria)
+            view = projection.from_request(Enrollments, self.load_plan)
+            enrollments, headers = paginate(Enrollments.query.options(*view.options).filter(*criteria), Enrollments.id)
+        except (PaginationError, ProjectionError, FilterError) as e:
+            return {'error': str(e)}, 400
+        return [view.serialize(enrollment) for enrollment in enrollments], 200, headers
 
     def post(self):
         data = request.get_json()
         try:
-            enrollment = Enrollments(
-                student_id=data['student_id'],
-                course_id=data['course_id'],
-                grade=data.get('grade'),
-                semester=data['semester'],
-                enrollment_date=data.get('enrollment_date', datetime.utcnow()),
-                status=data.get('status', 'enrolled')
-            )
-            db.session.add(enrollment)
-            db.session.commit()
-            return enrollment.to_dict(), 201
+            values = registration.enrollment_values(data)
         except Exception as e:
             return {'error': str(e)}, 400
 
+        if not db.session.get(Students, values['student_id']):
+            return {'error': 'Student not found'}, 404
+        if not db.session.get(Courses, values['course_id']):
+            return {'error': 'Course not found'}, 404
+        db.session.rollback()  # release the read transaction before queueing the write
+
+        try:
+            result, enrollment_id = registration.enroll(values)
+        except Exception as e:
+            return {'error': str(e)}, 400
+        if result == registration.FULL:
+            return {'error': 'Course is full'}, 409
+        if result == registration.DUPLICATE:
+            return {'error': 'Student is already enrolled in this course for the semester'}, 409
+
+        enrollment = Enrollments.query.options(*self.load_plan).get(enrollment_id)
+        return to_dict(enrollment), 201
+
+
+class BulkEnrollmentsResource(Resource):
+    def post(self):
+        try:
+            results = bulk.enroll_many(db.session.connection(), request.get_json())
+            db.session.commit()
+        except BatchError as e:
+            db.session.rollback()
+            return {'error': str(e), 'errors': e.errors}, 400
+        created = sum(result['status'] == bulk.CREATED for result in results)
+        return {'created': created, 'results': results}, 200
+
 
 class EnrollmentByIdResource(Resource):
+    load_plan = loading.ENROLLMENTS
+
     def get(self, enrollment_id):
-        enrollment = Enrollments.query.get_or_404(enrollment_id)
-        return enrollment.to_dict(), 200
+        try:
+            view = projection.from_request(Enrollments, self.load_plan)
+        except ProjectionError as e:
+            return {'error': str(e)}, 400
+        enrollment = Enrollments.query.options(*view.options).get_or_404(enrollment_id)
+        return view.serialize(enrollment), 200
 
     def patch(self, enrollment_id):
         enrollment = Enrollments.query.get_or_404(enrollment_id)
@@ -255,7 +412,10 @@ class EnrollmentByIdResource(Resource):
                 if hasattr(enrollment, attr):
                     setattr(enrollment, attr, value)
             db.session.commit()
-            return enrollment.to_dict(), 200
+            return to_dict(enrollment), 200
+        except CourseFull as e:
+            db.session.rollback()
+            return {'error': str(e)}, 409
         except Exception as e:
             return {'error': str(e)}, 400
 
@@ -267,21 +427,73 @@ class EnrollmentByIdResource(Resource):
 
 
 class CourseEnrollmentsResource(Resource):
+    load_plan = loading.ENROLLMENTS
+    filters = filtering.ENROLLMENTS
+
+    @response_cache.cached(Enrollments)
     def get(self, course_id):
-        course = Courses.query.get_or_404(course_id)
-        return [enrollment.to_dict() for enrollment in course.enrollments], 200
+        Courses.query.get_or_404(course_id)
+        try:
+            criteria = filtering.from_request(self.filters)
+            view = projection.from_request(Enrollments, self.load_plan)
+            enrollments, headers = paginate(Enrollments.query.options(*view.options).filter_by(course_id=course_id).filter(*criteria), Enrollments.id)
+        except (PaginationError, ProjectionError, FilterError) as e:
+            return {'error': str(e)}, 400
+        return [view.serialize(enrollment) for enrollment in enrollments], 200, headers
+
+
+class CourseGradesResource(Resource):
+    def patch(self, course_id):
+        Courses.query.get_or_404(course_id)
+        try:
+            results = bulk.grade_roster(db.session.connection(), course_id, request.get_json())
+            db.session.commit()
+        except BatchError as e:
+            db.session.rollback()
+            return {'error': str(e), 'errors': e.errors}, 400
+        updated = sum(result['status'] == bulk.UPDATED for result in results)
+        return {'updated': updated, 'results': results}, 200
 
 
 class StudentEnrollmentsResource(Resource):
+    load_plan = loading.ENROLLMENTS
+    filters = filtering.ENROLLMENTS
+
     def get(self, student_id):
-        student = Students.query.get_or_404(student_id)
-        return [enrollment.to_dict() for enrollment in student.enrollments], 200
+        Students.query.get_or_404(student_id)
+        try:
+            criteria = filtering.from_request(self.filters)
+            view = projection.from_request(Enrollments, self.load_plan)
+            enrollments, headers = paginate(Enrollments.query.options(*view.options).filter_by(student_id=student_id).filter(*criteria), Enrollments.id)
+        except (PaginationError, ProjectionError, FilterError) as e:
+            return {'error': str(e)}, 400
+        return [view.serialize(enrollment) for enrollment in enrollments], 200, headers
+
+
+class StudentTranscriptResource(Resource):
+    tables = ('students', 'transcript_terms')
+
+    def get(self, student_id):
+        not_modified, cache_headers = conditional.check(self.tables)
+        if not_modified:
+            return not_modified
+        student = db.session.query(Students.id, Students.student_id, Students.name).filter_by(id=student_id).first_or_404()
+        return {**student._asdict(), **transcripts.transcript(student_id)}, 200, cache_headers
 
 
 class InstructorsResource(Resource):
+    load_plan = loading.INSTRUCTORS
+
     def get(self):
-        instructors = Instructors.query.all()
-        return [instructor.to_dict() for instructor in instructors], 200
+        try:
+            view = projection.from_request(Instructors, self.load_plan)
+            not_modified, cache_headers = conditional.check(view.tables)
+            if not_modified:
+                return not_modified
+            instructors, headers = paginate(Instructors.query.options(*view.options), Instructors.id)
+        except (PaginationError, ProjectionError) as e:
+            return {'error': str(e)}, 400
+        return [view.serialize(instructor) for instructor in instructors], 200, {**headers, **cache_headers}
 
     def post(self):
         data = request.get_json()
@@ -304,16 +516,25 @@ class InstructorsResource(Resource):
             )
             db.session.add(instructor)
             db.session.commit()
-            return instructor.to_dict(), 201
+            return to_dict(instructor), 201
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 400
 
 
 class InstructorByIdResource(Resource):
+    load_plan = loading.INSTRUCTORS
+
     def get(self, instructor_id):
-        instructor = Instructors.query.get_or_404(instructor_id)
-        return instructor.to_dict(), 200
+        try:
+            view = projection.from_request(Instructors, self.load_plan)
+        except ProjectionError as e:
+            return {'error': str(e)}, 400
+        not_modified, cache_headers = conditional.check(view.tables)
+        if not_modified:
+            return not_modified
+        instructor = Instructors.query.options(*view.options).get_or_404(instructor_id)
+        return view.serialize(instructor), 200, cache_headers
 
     def patch(self, instructor_id):
         instructor = Instructors.query.get_or_404(instructor_id)
@@ -323,7 +544,7 @@ class InstructorByIdResource(Resource):
                 if hasattr(instructor, attr):
                     setattr(instructor, attr, value)
             db.session.commit()
-            return instructor.to_dict(), 200
+            return to_dict(instructor), 200
         except Exception as e:
             return {'error': str(e)}, 400
 
@@ -335,6 +556,96 @@ class InstructorByIdResource(Resource):
 
 
 class InstructorCoursesResource(Resource):
+    load_plan = loading.COURSES
+    filters = filtering.COURSES
+
+    @response_cache.cached(Courses)
     def get(self, instructor_id):
-        instructor = Instructors.query.get_or_404(instructor_id)
-        return [course.to_dict() for course in instructor.courses], 200
+        Instructors.query.get_or_404(instructor_id)
+        try:
+            criteria = filtering.from_request(self.filters)
+            view = projection.from_request(Courses, self.load_plan)
+            courses, headers = paginate(Courses.query.options(*view.options).filter_by(instructor_id=instructor_id).filter(*criteria), Courses.id)
+        except (PaginationError, ProjectionError, FilterError) as e:
+            return {'error': str(e)}, 400
+        return [view.serialize(course) for course in courses], 200, headers
+
+
+class CourseAnalyticsResource(Resource):
+    filters = filtering.COURSES
+
+    def get(self):
+        try:
+            criteria = filtering.from_request(self.filters)
+            summary_criteria = filtering.from_request(analytics.FILTERS)
+            not_modified, cache_headers = conditional.check(analytics.COURSE_TABLES)
+            if not_modified:
+                return not_modified
+            courses, headers = paginate(
+                db.session.query(Courses.id, Courses.course_code, Courses.title, Courses.instructor_id,
+                                 Courses.max_capacity).filter(*criteria), Courses.id)
+        except (PaginationError, FilterError) as e:
+            return {'error': str(e)}, 400
+        reports = analytics.course_reports([course.id for course in courses], summary_criteria)
+        return [{**course._asdict(), **reports[course.id]} for course in courses], 200, {**headers, **cache_headers}
+
+
+class InstructorAnalyticsResource(Resource):
+    def get(self):
+        try:
+            summary_criteria = filtering.from_request(analytics.FILTERS)
+            not_modified, cache_headers = conditional.check(analytics.INSTRUCTOR_TABLES)
+            if not_modified:
+                return not_modified
+            instructors, headers = paginate(
+                db.session.query(Instructors.id, Instructors.name, Instructors.specialty), Instructors.id)
+        except (PaginationError, FilterError) as e:
+            return {'error': str(e)}, 400
+        reports = analytics.instructor_reports([instructor.id for instructor in instructors], summary_criteria)
+        return ([{**instructor._asdict(), **reports[instructor.id]} for instructor in instructors], 200,
+                {**headers, **cache_headers})
+
+
+class ChangesResource(Resource):
+    # Clients take a cursor from GET /api/changes before loading the
+    # collections, then poll ?since=<cursor>. Inserts and updates carry the
+    # row as it is now and apply as upserts; deletes are tombstones.
+    def get(self):
+        try:
+            since, limit = changelog.feed_args()
+            if since is None:
+                return {'changes': [], 'cursor': changelog.latest_cursor(), 'more': False}, 200
+            changes, cursor, more = changelog.changes_since(since, limit)
+        except (PaginationError, ChangeFeedError) as e:
+            return {'error': str(e)}, 400
+        except CursorExpired:
+            return {'error': 'Cursor expired, reload the collections and take a new cursor'}, 410
+        return {'changes': changes, 'cursor': cursor, 'more': more}, 200
+
+
+class MetricsResource(Resource):
+    def get(self):
+        return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ImportResource(Resource):
+    def post(self, kind):
+        if kind not in importer.KINDS:
+            return {'error': f'Unknown import type {kind!r}'}, 404
+
+        upload = request.files.get('file')
+        if upload is not None:
+            body = upload.stream
+        else:
+            # Spool a raw text/csv body to disk so parsing never holds it all in memory
+            body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+            shutil.copyfileobj(request.stream, body)
+            body.seek(0)
+
+        events = importer.import_csv(
+            kind, io.TextIOWrapper(body, encoding='utf-8-sig', newline=''),
+            rounds=current_app.config.get('BCRYPT_LOG_ROUNDS', 12),
+            batch_size=current_app.config.get('IMPORT_BATCH_SIZE', importer.BATCH_SIZE),
+        )
+        return Response(stream_with_context(json.dumps(event) + '\n' for event in events),
+                        mimetype='application/x-ndjson')
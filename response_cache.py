@@ -0,0 +1,268 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import Counter
+from functools import wraps
+
+from flask import Response, current_app, request
+from flask_restful.utils import unpack
+
+import conditional
+import export
+import metrics
+import projection
+import representations
+import versions
+from cache import TTLCache
+from projection import ProjectionError
+
+# Read-through cache of whole JSON responses. Entries are keyed by the ETag
+# from conditional.check(), a hash of the path, the query and the versions of
+# the tables the response reads: once a write moves a version on, entries
+# built from the old data can no longer be reached from any process. Writes
+# also purge the entries tagged with the tables they touched, so dead entries
+# do not hold memory until they are evicted.
+#
+# RESPONSE_CACHE picks the backend: 'memory' (default, per process), 'sqlite'
+# (one file shared by every worker on the host, standing in for Redis or
+# memcached) or 'off'. A request sent with Cache-Control: no-cache skips the
+# lookup and refreshes the entry.
+
+CACHED_HEADERS = ('X-Next-Cursor', 'Link')
+RESULTS = ('hit', 'miss', 'bypass')
+
+lookups = Counter()
+_backends = weakref.WeakSet()
+_backend_lock = threading.Lock()
+
+
+def _depends_on(entry_tables, tables):
+    return entry_tables is None or not tables.isdisjoint(entry_tables)
+
+
+class MemoryBackend:
+    def __init__(self, maxsize, maxbytes, ttl):
+        self.entries = TTLCache(maxsize, ttl, weigh=lambda entry: len(entry[1]), maxweight=maxbytes)
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        return None if entry is None else entry[1:]
+
+    def set(self, key, tables, body, headers):
+        self.entries.set(key, (tables, body, headers))
+
+    def invalidate(self, tables):
+        self.invalidations += self.entries.pop_matching(lambda entry: _depends_on(entry[0], tables))
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.entries.weight,
+                'evictions': self.entries.evictions, 'invalidations': self.invalidations}
+
+
+class SQLiteBackend:
+    # Cache errors (a locked file, a full disk) count as misses rather than
+    # failing the request
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS responses ('
+        'key TEXT PRIMARY KEY, tables TEXT, body BLOB NOT NULL, headers TEXT NOT NULL, '
+        'size INTEGER NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS ix_responses_accessed ON responses (accessed)',
+    )
+    # Least recently used first out, by count and by total size
+    TRIM = (
+        'DELETE FROM responses WHERE key IN (SELECT key FROM ('
+        'SELECT key, ROW_NUMBER() OVER recent AS position, SUM(size) OVER recent AS running '
+        'FROM responses WINDOW recent AS (ORDER BY accessed DESC)) WHERE position > ? OR running > ?)'
+    )
+
+    def __init__(self, path, maxsize, maxbytes, ttl):
+        self.path = path
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.evictions = 0
+        self.invalidations = 0
+        self.local = threading.local()
+        connection = self._connection()
+        for statement in self.SCHEMA:
+            connection.execute(statement)
+
+    def _connection(self):
+        # One connection per thread, and a new one after a fork
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return self.local.connection
+
+    def get(self, key):
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                'SELECT body, headers, expires, accessed FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            body, headers, expires, accessed = row
+            now = time.time()
+            if expires <= now:
+                return None
+            # Recency only needs to be roughly right; skip the write on hot keys
+            if now - accessed > 1:
+                connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            return body, json.loads(headers)
+        except sqlite3.Error:
+            return None
+
+    def set(self, key, tables, body, headers):
+        if len(body) > self.maxbytes:
+            return
+        now = time.time()
+        tag = None if tables is None else ',' + ','.join(tables) + ','
+        try:
+            connection = self._connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   (key, tag, body, json.dumps(headers), len(body), now + self.ttl, now))
+                connection.execute('DELETE FROM responses WHERE expires <= ?', (now,))
+                self.evictions += connection.execute(self.TRIM, (self.maxsize, self.maxbytes)).rowcount
+                connection.execute('COMMIT')
+            except sqlite3.Error:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            pass
+
+    def invalidate(self, tables):
+        clauses = ' OR '.join(['tables LIKE ?'] * len(tables))
+        try:
+            self.invalidations += self._connection().execute(
+                f'DELETE FROM responses WHERE tables IS NULL OR {clauses}',
+                [f'%,{table},%' for table in tables]).rowcount
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        try:
+            self._connection().execute('DELETE FROM responses')
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        # An unreadable file reports as empty rather than failing /api/metrics
+        try:
+            entries, size = self._connection().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        except sqlite3.Error:
+            entries, size = 0, 0
+        return {'entries': entries, 'bytes': size, 'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+BACKENDS = {'memory': MemoryBackend, 'sqlite': SQLiteBackend}
+
+
+def get_backend():
+    # Created lazily so that forked server workers each build their own;
+    # None when RESPONSE_CACHE is 'off'
+    backend = current_app.extensions.get('response_cache')
+    if backend is None:
+        with _backend_lock:
+            backend = current_app.extensions.get('response_cache')
+            if backend is None:
+                config = current_app.config
+                kind = config.get('RESPONSE_CACHE', 'memory')
+                if kind == 'off':
+                    backend = False
+                else:
+                    options = {
+                        'maxsize': config.get('RESPONSE_CACHE_SIZE', 1024),
+                        'maxbytes': config.get('RESPONSE_CACHE_BYTES', 64 * 1024 * 1024),
+                        'ttl': config.get('RESPONSE_CACHE_TTL', 300),
+                    }
+                    if kind == 'sqlite':
+                        options['path'] = config.get('RESPONSE_CACHE_PATH') or os.path.join(
+                            current_app.instance_path, 'response_cache.db')
+                    backend = BACKENDS[kind](**options)
+                    _backends.add(backend)
+                current_app.extensions['response_cache'] = backend
+    return backend or None
+
+
+@versions.on_commit
+def _invalidate(tables):
+    for backend in list(_backends):
+        backend.invalidate(tables)
+
+
+def _totals(key):
+    return sum(backend.stats()[key] for backend in list(_backends))
+
+
+metrics.registry.register(
+    'response_cache_lookups_total', 'counter', 'Response cache lookups by result',
+    lambda: {f'result="{result}"': lookups[result] for result in RESULTS})
+metrics.registry.register(
+    'response_cache_entries', 'gauge', 'Responses held by the response cache',
+    lambda: {'': _totals('entries')})
+metrics.registry.register(
+    'response_cache_bytes', 'gauge', 'Body bytes held by the response cache',
+    lambda: {'': _totals('bytes')})
+metrics.registry.register(
+    'response_cache_evictions_total', 'counter', 'Entries evicted by the size limits',
+    lambda: {'': _totals('evictions')})
+metrics.registry.register(
+    'response_cache_invalidations_total', 'counter', 'Entries purged by writes to tables they read',
+    lambda: {'': _totals('invalidations')})
+
+
+def cached(model):
+    # For Resource GETs that return (payload, status, headers) and have a
+    # load_plan. Also answers conditional requests, like conditional.check().
+    def decorator(get):
+        @wraps(get)
+        def wrapper(resource, *args, **kwargs):
+            if export.requested_format():
+                return get(resource, *args, **kwargs)
+            try:
+                view = projection.from_request(model, resource.load_plan)
+            except ProjectionError:
+                # The resource reports it
+                return get(resource, *args, **kwargs)
+            not_modified, validators = conditional.check(view.tables)
+            if not_modified:
+                return not_modified
+
+            backend = get_backend()
+            # The ETag covers the media type, so JSON and MessagePack bodies
+            # are cached apart
+            key = f'{request.host} {validators["ETag"]}'
+            if backend is not None:
+                if request.cache_control.no_cache:
+                    lookups['bypass'] += 1
+                else:
+                    entry = backend.get(key)
+                    if entry is not None:
+                        lookups['hit'] += 1
+                        body, headers = entry
+                        return Response(body, 200, {**headers, **validators},
+                                        content_type=representations.negotiated())
+                    lookups['miss'] += 1
+
+            data, code, headers = unpack(get(resource, *args, **kwargs))
+            if code != 200:
+                return representations.render(data, code, headers)
+            response = representations.render(data, code, {**headers, **validators})
+            if backend is not None:
+                backend.set(key, view.tables, response.get_data(),
+                            {name: headers[name] for name in CACHED_HEADERS if name in headers})
+            return response
+        return wrapper
+    return decorator
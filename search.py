@@ -0,0 +1,103 @@
+import re
+
+from flask import request
+from sqlalchemy import DDL, event, text
+
+from models import db, Courses
+
+# Course search. On SQLite an external-content FTS5 table indexes the title,
+# course code and description, kept in step with courses by triggers so that
+# Core writes and imports are covered as well as the ORM; on PostgreSQL a
+# generated tsvector column with a GIN index does the same job. The
+# statements below run after create_all(); the migration that adds search to
+# existing databases carries its own copy.
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# title, course_code, description
+WEIGHTS = (10.0, 5.0, 1.0)
+TOKEN = re.compile(r'\w+')
+
+# Prefix queries up to six characters (after stemming) read a prefix index;
+# longer ones merge the doclists of every matching token first
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE courses_fts USING fts5("
+    "title, course_code, description, content='courses', content_rowid='id', "
+    "tokenize='porter unicode61 remove_diacritics 2', prefix='1 2 3 4 5 6')",
+    "CREATE TRIGGER courses_fts_insert AFTER INSERT ON courses BEGIN "
+    "INSERT INTO courses_fts (rowid, title, course_code, description) "
+    "VALUES (new.id, new.title, new.course_code, new.description); END",
+    "CREATE TRIGGER courses_fts_delete AFTER DELETE ON courses BEGIN "
+    "INSERT INTO courses_fts (courses_fts, rowid, title, course_code, description) "
+    "VALUES ('delete', old.id, old.title, old.course_code, old.description); END",
+    # Seat counter updates leave the index alone
+    "CREATE TRIGGER courses_fts_update AFTER UPDATE OF title, course_code, description ON courses BEGIN "
+    "INSERT INTO courses_fts (courses_fts, rowid, title, course_code, description) "
+    "VALUES ('delete', old.id, old.title, old.course_code, old.description); "
+    "INSERT INTO courses_fts (rowid, title, course_code, description) "
+    "VALUES (new.id, new.title, new.course_code, new.description); END",
+)
+
+POSTGRESQL_DDL = (
+    "ALTER TABLE courses ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(course_code, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')) STORED",
+    "CREATE INDEX ix_courses_search_vector ON courses USING gin (search_vector)",
+)
+
+for statement in SQLITE_DDL:
+    event.listen(Courses.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRESQL_DDL:
+    event.listen(Courses.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+event.listen(Courses.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS courses_fts').execute_if(dialect='sqlite'))
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Keeps autogenerate from dropping the search objects it cannot see in
+    # the models
+    if type_ == 'table' and (name == 'courses_fts' or name.startswith('courses_fts_')):
+        return False
+    return name not in ('search_vector', 'ix_courses_search_vector')
+
+
+class SearchError(ValueError):
+    pass
+
+
+def search_args():
+    terms = TOKEN.findall(request.args.get('q', '').lower())
+    if not terms:
+        raise SearchError('q must contain at least one word')
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise SearchError('limit must be an integer')
+    if limit < 1:
+        raise SearchError('limit must be positive')
+    return terms, min(limit, MAX_LIMIT)
+
+
+def _sqlite_ids(terms, limit):
+    # Every term is a quoted prefix, so user input never reaches the FTS5
+    # query syntax and "phys intro" finds "Physics: Introduction to ...".
+    # Every match is ranked: FTS5 scores them in C and keeps the best `limit`.
+    query = ' '.join(f'"{term}"*' for term in terms)
+    return db.session.execute(text(
+        'SELECT rowid FROM courses_fts WHERE courses_fts MATCH :query '
+        f'ORDER BY bm25(courses_fts, {", ".join(map(str, WEIGHTS))}), rowid LIMIT :limit'
+    ), {'query': query, 'limit': limit}).scalars().all()
+
+
+def _postgresql_ids(terms, limit):
+    query = ' & '.join(f'{term}:*' for term in terms)
+    return db.session.execute(text(
+        "SELECT id FROM courses, to_tsquery('english', :query) AS query WHERE search_vector @@ query "
+        'ORDER BY ts_rank_cd(search_vector, query) DESC, id LIMIT :limit'
+    ), {'query': query, 'limit': limit}).scalars().all()
+
+
+def ranked_course_ids(terms, limit):
+    if db.engine.dialect.name == 'postgresql':
+        return _postgresql_ids(terms, limit)
+    return _sqlite_ids(terms, limit)
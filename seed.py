@@ -1,206 +1,305 @@
 #!/usr/bin/env python3
+"""Generate a synthetic course-hub dataset.
+
+With no options this reproduces the small development dataset in the app
+database. Larger runs build production-sized data for benchmarking:
+
+    python seed.py --students 500000 --courses 5000 --semesters 12 --seed 1 --output /tmp/big.db
+
+Course popularity follows a Zipf distribution, so a few courses fill up
+while most stay half empty, and students stay active for a skewed number
+of consecutive semesters. Every seeded user's password is 'password'
+(test@example.com keeps 'password123').
+"""
 
 # Standard library imports
-from random import randint, choice as rc, sample
+import argparse
+import os
+import random
+import time
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
 
 # Remote library imports
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
 from faker import Faker
-from datetime import datetime
+from flask import current_app
+from flask_migrate import stamp
+from sqlalchemy import bindparam, create_engine, insert, select, text, update
 
 # Local imports
-from app import app
+from app import create_app
 from models import db, Users, Students, Instructors, Courses, Enrollments
+from passwords import hash_password
+from summaries import rebuild_summaries
+from transcripts import rebuild_transcripts
+
+SPECIALTIES = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'Computer Science']
+SUBJECTS = [
+    ('Mathematics', 'MTH'), ('Physics', 'PHY'), ('Chemistry', 'CHM'), ('Biology', 'BIO'),
+    ('Computer Science', 'CSC'), ('Economics', 'ECO'), ('History', 'HIS'), ('Literature', 'LIT'),
+    ('Statistics', 'STA'), ('Psychology', 'PSY'), ('Philosophy', 'PHL'), ('Engineering', 'ENG'),
+]
+GRADES = ['A', 'B', 'C', 'D', 'F']
+GRADE_WEIGHTS = [25, 35, 25, 10, 5]
+LOAD_WEIGHTS = [10, 20, 35, 25, 10]  # courses taken per semester: 1..5
+CAPACITIES = [30, 50, 100, 200]
+CAPACITY_WEIGHTS = [55, 25, 15, 5]
+NAME_POOL = 1000
+PASSWORD_HASHES = 4
+BATCH_SIZE = 50000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=20)
+    parser.add_argument('--courses', type=int, default=5)
+    parser.add_argument('--instructors', type=int, help='default: one per ten courses, at least 5')
+    parser.add_argument('--semesters', type=int, default=3)
+    parser.add_argument('--first-year', type=int, default=2023)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for course popularity')
+    parser.add_argument('--seed', type=int, help='make the dataset reproducible')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--output', help='write a fresh SQLite file here instead of the app database')
+    return parser.parse_args()
 
-fake = Faker()
 
 def clear_data():
     print("Clearing data...")
     db.drop_all()
     db.create_all()
-
-def create_users():
+    stamp()
+
+
+def fresh_database(path):
+    # A new file needs neither a journal nor fsyncs until it is complete
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f'sqlite:///{os.path.abspath(path)}')
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        script = ScriptDirectory(os.path.join(current_app.root_path, 'migrations'))
+        MigrationContext.configure(connection).stamp(script, 'head')
+    return engine
+
+
+def insert_batches(connection, model, rows, batch_size):
+    # Core executemany in large batches, bypassing the unit of work
+    count, batch = 0, []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            connection.execute(insert(model), batch)
+            count, batch = count + len(batch), []
+    if batch:
+        connection.execute(insert(model), batch)
+        count += len(batch)
+    return count
+
+
+def semester_calendar(first_year, semesters):
+    calendar = []
+    for index in range(semesters):
+        year = first_year + index // 2
+        if index % 2 == 0:
+            calendar.append((f'Spring{year}', datetime(year, 1, 10), year))
+        else:
+            calendar.append((f'Fall{year}', datetime(year, 8, 20), year))
+    return calendar
+
+
+def create_users(connection, rng, fake, options):
     print("Creating users...")
-    users = []
-
-    # Create 5 instructors
-    for _ in range(5):
-        user = Users(
-            username=fake.user_name(),
-            email=fake.email(),
-            role='instructor'
-        )
-        user.set_password(fake.password(length=12))
-        users.append(user)
-
-    # Create 20 students
-    for _ in range(20):
-        user = Users(
-            username=fake.user_name(),
-            email=fake.email(),
-            role='student'
-        )
-        user.set_password(fake.password(length=12))
-        users.append(user)
-
-    # Add test user
-    test_user = Users(
-        username='testuser',
-        email='test@example.com',
-        role='student'
-    )
-    test_user.set_password('password123')
-    users.append(test_user)
-
-    db.session.add_all(users)
-    db.session.commit()
-    return users
-
-def create_instructors(users):
-    print("Creating instructors...")
-    instructors = []
+    rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+    # A few distinct salts rather than one bcrypt run per user
+    hashes = [hash_password('password', rounds) for _ in range(PASSWORD_HASHES)]
+    first_names = [fake.first_name().lower() for _ in range(NAME_POOL)]
+    last_names = [fake.last_name().lower() for _ in range(NAME_POOL)]
+    instructors, students = options['instructors'], options['students']
+
+    def rows():
+        for user_id in range(1, instructors + students + 1):
+            role = 'instructor' if user_id <= instructors else 'student'
+            yield {
+                'id': user_id,
+                'username': f'{rng.choice(first_names)}.{rng.choice(last_names)}{user_id}',
+                'email': f'{role}{user_id}@example.com',
+                'role': role,
+                'password_hash': hashes[user_id % PASSWORD_HASHES],
+            }
+        yield {
+            'id': instructors + students + 1,
+            'username': 'testuser',
+            'email': 'test@example.com',
+            'role': 'student',
+            'password_hash': hash_password('password123', rounds),
+        }
+    return insert_batches(connection, Users, rows(), options['batch_size'])
 
-    instructor_users = [user for user in users if user.role == 'instructor']
 
-    specialties = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'Computer Science']
+def create_instructors(connection, rng, names, options):
+    print("Creating instructors...")
+    rows = ({'id': i, 'name': rng.choice(names), 'specialty': rng.choice(SPECIALTIES), 'user_id': i}
+            for i in range(1, options['instructors'] + 1))
+    return insert_batches(connection, Instructors, rows, options['batch_size'])
 
-    for user in instructor_users:
-        instructor = Instructors(
-            name=fake.name(),
-            specialty=rc(specialties),
-            user_id=user.id
-        )
-        instructors.append(instructor)
 
-    db.session.add_all(instructors)
-    db.session.commit()
-    return instructors
+def create_courses(connection, rng, options):
+    print("Creating courses...")
 
-def create_students(users):
+    def rows():
+        for index in range(options['courses']):
+            subject, prefix = SUBJECTS[index % len(SUBJECTS)]
+            level = index // len(SUBJECTS)
+            # The first five are the original introductory courses
+            introductory = index < 5
+            yield {
+                'id': index + 1,
+                'title': subject if introductory else f'{subject} {101 + level}',
+                'course_code': f'{prefix}{101 + level}',
+                'description': f'{"Introduction to" if introductory else "Topics in"} {subject}',
+                'credit_hours': 3 if introductory else rng.choice([2, 3, 3, 4]),
+                'max_capacity': 30 if introductory else rng.choices(CAPACITIES, CAPACITY_WEIGHTS)[0],
+                'instructor_id': rng.randint(1, options['instructors']),
+            }
+    return insert_batches(connection, Courses, rows(), options['batch_size'])
+
+
+def create_students(connection, rng, names, calendar, options):
     print("Creating students...")
-    students = []
-    student_users = [user for user in users if user.role == 'student']
-
-    for user in student_users:
-        student = Students(
-            name=fake.name(),
-            age=randint(18, 25),
-            student_id=f"STU{fake.unique.random_int(min=1000, max=9999)}",
-            enrolment_year=randint(2020, 2023),
-            user_id=user.id
-        )
-        students.append(student)
-
-    db.session.add_all(students)
-    db.session.commit()
-    return students
-
-def create_courses(instructors):
-    print("Creating courses...")
-    courses_data = [
-        {
-            'title': 'Mathematics',
-            'course_code': 'MTH101',
-            'description': 'Introduction to Mathematics',
-            'credit_hours': 3,
-            'max_capacity': 30,
-        },
-        {
-            'title': 'Physics',
-            'course_code': 'PHY101',
-            'description': 'Introduction to Physics',
-            'credit_hours': 3,
-            'max_capacity': 30,
-        },
-        {
-            'title': 'Chemistry',
-            'course_code': 'CHM101',
-            'description': 'Introduction to Chemistry',
-            'credit_hours': 3,
-            'max_capacity': 30,
-        },
-        {
-            'title': 'Biology',
-            'course_code': 'BIO101',
-            'description': 'Introduction to Biology',
-            'credit_hours': 3,
-            'max_capacity': 30,
-        },
-        {
-            'title': 'Computer Science',
-            'course_code': 'CSC101',
-            'description': 'Introduction to Computer Science',
-            'credit_hours': 3,
-            'max_capacity': 30,
-        }
-    ]
-
-    courses = []
-
-    for course_data in courses_data:
-        course = Courses(
-            title=course_data['title'],
-            course_code=course_data['course_code'],
-            description=course_data['description'],
-            credit_hours=course_data['credit_hours'],
-            max_capacity=course_data['max_capacity'],
-            instructor_id=rc(instructors).id
+    # Each student is active for a run of consecutive semesters
+    windows = []
+
+    def rows():
+        # The extra student is the test user's profile
+        for index in range(options['students'] + 1):
+            start = rng.randrange(len(calendar))
+            length = 1 + min(int(rng.expovariate(1 / 4)), 7)
+            windows.append((start, min(start + length, len(calendar))))
+            yield {
+                'id': index + 1,
+                'name': rng.choice(names),
+                'age': 18 + min(int(rng.expovariate(1 / 2.5)), 12),
+                'student_id': f'STU{1000 + index}',
+                'enrolment_year': calendar[start][2],
+                'user_id': options['instructors'] + index + 1,
+            }
+    count = insert_batches(connection, Students, rows(), options['batch_size'])
+    return count, windows
+
+
+def create_enrollments(connection, rng, calendar, windows, options):
+    print("Creating enrollments...")
+    # Zipf popularity over a shuffled course order, so the popular courses
+    # are spread across subjects and ids
+    ranking = list(range(1, options['courses'] + 1))
+    rng.shuffle(ranking)
+    popularity = list(accumulate(1 / (rank + 1) ** options['skew'] for rank in range(len(ranking))))
+    capacity = dict(connection.execute(select(Courses.id, Courses.max_capacity)).all())
+    taken = [dict.fromkeys(capacity, 0) for _ in calendar]
+    current = len(calendar) - 1
+    grade_weights = list(accumulate(GRADE_WEIGHTS))
+    load_weights = list(accumulate(LOAD_WEIGHTS))
+
+    def weighted(cumulative):
+        return bisect(cumulative, rng.random() * cumulative[-1])
+
+    def rows():
+        for student_id, (start, end) in enumerate(windows, start=1):
+            for semester in range(start, end):
+                name, opens, _ = calendar[semester]
+                seats = taken[semester]
+                wanted = min(1 + weighted(load_weights), len(ranking))
+                chosen = set()
+                # Full courses are skipped, so students of popular courses
+                # sometimes end up taking fewer than they wanted
+                for _ in range(wanted * 3):
+                    if len(chosen) == wanted:
+                        break
+                    course_id = ranking[weighted(popularity)]
+                    if course_id in chosen or seats[course_id] >= capacity[course_id]:
+                        continue
+                    chosen.add(course_id)
+                    if semester == current:
+                        status = 'enrolled' if rng.random() < 0.92 else 'dropped'
+                    else:
+                        status = 'completed' if rng.random() < 0.9 else 'dropped'
+                    if status != 'dropped':
+                        seats[course_id] += 1
+                    yield {
+                        'student_id': student_id,
+                        'course_id': course_id,
+                        'grade': GRADES[weighted(grade_weights)] if status == 'completed' else None,
+                        'semester': name,
+                        'enrollment_date': opens + timedelta(minutes=rng.randrange(60 * 24 * 21)),
+                        'status': status,
+                    }
+
+    count = insert_batches(connection, Enrollments, rows(), options['batch_size'])
+    # Core inserts bypass the ORM events that maintain the seat counters, the
+    # enrollment summary and the transcripts
+    counts = [{'b_id': course_id, 'b_count': seats} for course_id, seats in taken[current].items() if seats]
+    if counts:
+        connection.execute(
+            update(Courses.__table__).where(Courses.id == bindparam('b_id'))
+            .values(enrolled_count=bindparam('b_count')),
+            counts,
         )
-        courses.append(course)
+    rebuild_summaries(connection)
+    rebuild_transcripts(connection)
+    return count
+
+
+def generate(engine, students=20, courses=5, instructors=None, semesters=3, first_year=2023,
+             skew=1.1, seed=None, batch_size=BATCH_SIZE):
+    options = {
+        'students': students, 'courses': courses, 'instructors': instructors or max(5, courses // 10),
+        'skew': skew, 'batch_size': batch_size,
+    }
+    rng = random.Random(seed)
+    fake = Faker()
+    if seed is not None:
+        fake.seed_instance(seed)
+    calendar = semester_calendar(first_year, semesters)
+    names = [fake.name() for _ in range(NAME_POOL)]
+
+    with engine.begin() as connection:
+        if engine.dialect.name == 'sqlite':
+            connection.execute(text('PRAGMA synchronous=OFF'))
+        users = create_users(connection, rng, fake, options)
+        instructors = create_instructors(connection, rng, names, options)
+        courses = create_courses(connection, rng, options)
+        students, windows = create_students(connection, rng, names, calendar, options)
+        enrollments = create_enrollments(connection, rng, calendar, windows, options)
+        # Planner statistics, so the filter indexes are chosen on the new data
+        connection.execute(text('ANALYZE'))
+    return {'users': users, 'instructors': instructors, 'students': students,
+            'courses': courses, 'enrollments': enrollments}
 
-    db.session.add_all(courses)
-    db.session.commit()
-    return courses
-
-def create_enrollments(students, courses):
-    print("Creating enrollments...")
-    enrollments = []
-    semesters = ['phase1', 'phase2', 'phase3']
-    grades = ['A', 'B', 'C', 'D', 'F']
-    statuses = ['enrolled', 'completed', 'dropped']
-
-    for student in students:
-        # Ensure we don't try to sample more courses than available
-        max_possible = min(6, len(courses))
-        num_courses = randint(3, max_possible) if max_possible >= 3 else len(courses)
-        
-        if num_courses > 0 and len(courses) >= num_courses:
-            student_courses = sample(courses, num_courses)
-
-            for course in student_courses:
-                semester = rc(semesters)
-                status = rc(statuses)
-                grade = rc(grades) if status == 'completed' else None
-
-                enrollment = Enrollments(
-                    student_id=student.id,
-                    course_id=course.id,
-                    grade=grade,
-                    semester=semester,
-                    enrollment_date=fake.date_time_between(start_date='-1y', end_date='now'),
-                    status=status,
-                )
-                enrollments.append(enrollment)
-
-    db.session.add_all(enrollments)
-    db.session.commit()
-    return enrollments
 
 def main():
-    with app.app_context():
+    args = parse_args()
+    with create_app().app_context():
         print("Starting seed data generation...")
+        started = time.perf_counter()
+        if args.output:
+            engine = fresh_database(args.output)
+        else:
+            clear_data()
+            engine = db.engine
+
+        created = generate(
+            engine, students=args.students, courses=args.courses, instructors=args.instructors,
+            semesters=args.semesters, first_year=args.first_year, skew=args.skew, seed=args.seed,
+            batch_size=args.batch_size,
+        )
 
-        clear_data()
-
-        users = create_users()
-        instructors = create_instructors(users)
-        students = create_students(users)
-        courses = create_courses(instructors)
-        enrollments = create_enrollments(students, courses)
-
-        print("Seed data generation complete!")
-        print(f"Created: {len(users)} users, {len(instructors)} instructors, "
-              f"{len(students)} students, {len(courses)} courses, "
-              f"{len(enrollments)} enrollments")
+        print(f"Seed data generation complete in {time.perf_counter() - started:.1f}s!")
+        print(f"Created: {created['users']} users, {created['instructors']} instructors, "
+              f"{created['students']} students, {created['courses']} courses, "
+              f"{created['enrollments']} enrollments")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,156 @@
+from datetime import date, datetime, time
+from itertools import count
+from time import perf_counter
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import ColumnProperty, RelationshipProperty
+from sqlalchemy_serializer import Serializer
+from sqlalchemy_serializer.lib.schema import Schema
+
+import metrics
+from models import Users, Students, Instructors, Courses, Enrollments
+
+# Relationship hops below the root. Deep enough for every branch that can hold
+# data under the current serialize_rules; the one-to-one profile chains that
+# are only ever null are cut here instead of recursing forever.
+MAX_DEPTH = 6
+
+SIMPLE_TYPES = (int, str, float, bool)
+# Columns no response, export or change feed serializes, by table
+HIDDEN = {'users': {'password_hash', 'token_version'}}
+
+
+def is_hidden(model, key):
+    return key in HIDDEN.get(inspect(model).local_table.name, ())
+
+
+def column_keys(model):
+    # Every column a response may carry
+    return [prop.key for prop in inspect(model).column_attrs if not is_hidden(model, prop.key)]
+
+
+def column_converter(model, column):
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = None
+
+    if python_type is datetime:
+        fmt = model.datetime_format
+    elif python_type is date:
+        fmt = model.date_format
+    elif python_type is time:
+        fmt = model.time_format
+    elif python_type in SIMPLE_TYPES:
+        return None
+    else:
+        return _fallback_converter(model)
+    return lambda value: value.strftime(fmt) if value is not None else None
+
+
+def _fallback_converter(model):
+    serializer = Serializer(
+        date_format=model.date_format, datetime_format=model.datetime_format,
+        time_format=model.time_format, decimal_format=model.decimal_format,
+        tzinfo=None, serialize_types=model.serialize_types)
+    return serializer.serialize
+
+
+class _Compiler:
+    # Walks the same rule tree SerializerMixin.to_dict() builds at runtime,
+    # but once per model instead of once per object, and emits a single
+    # dict-building function per node of the serialized graph.
+
+    def __init__(self, max_depth=MAX_DEPTH):
+        self.max_depth = max_depth
+        self.namespace = {}
+        self.names = count()
+
+    def bind(self, value):
+        name = f'_f{next(self.names)}'
+        self.namespace[name] = value
+        return name
+
+    def column(self, model, key):
+        converter = column_converter(model, inspect(model).attrs[key].columns[0])
+        if converter is None:
+            return f'{key!r}: obj.{key}'
+        return f'{key!r}: {self.bind(converter)}(obj.{key})'
+
+    def relationship(self, prop, child):
+        key = prop.key
+        if prop.uselist:
+            return f'{key!r}: [{child}(o) for o in obj.{key}]'
+        return f'{key!r}: {child}(o) if (o := obj.{key}) is not None else None'
+
+    def define(self, model, items):
+        name = f'_{model.__name__.lower()}_{next(self.names)}'
+        source = f'def {name}(obj):\n    return {{{", ".join(items)}}}\n'
+        exec(compile(source, f'<serializer {model.__name__}>', 'exec'), self.namespace)
+        return name
+
+    def compile(self, model, schema, depth=0):
+        mapper = inspect(model)
+        schema.update(only=model.serialize_only, extend=model.serialize_rules)
+
+        keys = schema.keys
+        if schema.is_greedy:
+            keys.update(attr.key for attr in mapper.attrs)
+
+        items = []
+        for key in sorted(keys):
+            if not schema.is_included(key) or is_hidden(model, key):
+                continue
+            prop = mapper.attrs.get(key)
+            if isinstance(prop, ColumnProperty):
+                items.append(self.column(model, key))
+            elif isinstance(prop, RelationshipProperty):
+                if depth < self.max_depth:
+                    items.append(self.relationship(prop, self.compile(prop.mapper.class_, schema.fork(key), depth + 1)))
+            else:
+                # Positive rules may name plain attributes or methods
+                fallback = self.bind(_fallback_converter(model))
+                items.append(f'{key!r}: {fallback}(getattr(obj, {key!r}))')
+        return self.define(model, items)
+
+    def compile_projection(self, model, columns, relations):
+        mapper = inspect(model)
+        items = [self.column(model, key) for key in columns]
+        for key, (child_columns, child_relations) in relations.items():
+            prop = mapper.relationships[key]
+            child = self.compile_projection(prop.mapper.class_, child_columns, child_relations)
+            items.append(self.relationship(prop, child))
+        return self.define(model, items)
+
+
+def compile_serializer(model, max_depth=MAX_DEPTH):
+    compiler = _Compiler(max_depth)
+    return compiler.namespace[compiler.compile(model, Schema())]
+
+
+def compile_projection(model, columns, relations):
+    # columns: attribute keys to emit; relations: {key: (columns, relations)}
+    compiler = _Compiler()
+    return timed(compiler.namespace[compiler.compile_projection(model, columns, relations)])
+
+
+def timed(serialize):
+    # Charges the time spent to the current request's serialize timing
+    def timed_serialize(obj):
+        started = perf_counter()
+        try:
+            return serialize(obj)
+        finally:
+            metrics.add_serialize_time(perf_counter() - started)
+    return timed_serialize
+
+
+SERIALIZERS = {model: compile_serializer(model) for model in (Users, Students, Instructors, Courses, Enrollments)}
+
+
+def to_dict(obj):
+    started = perf_counter()
+    try:
+        return SERIALIZERS[type(obj)](obj)
+    finally:
+        metrics.add_serialize_time(perf_counter() - started)
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""Pre-forking production server for the course-hub API.
+
+The master process builds the app once, with its imports, mappers and
+compiled serializers, opens the listening socket and forks the workers,
+which inherit both. Each worker accepts connections only while one of its
+threads is free to serve them, so a busy worker leaves new connections to
+an idle one. Workers open their own database connections: database.py
+drops the pools inherited over fork, and the response cache, enrollment
+writer and password pool are built lazily in each worker, since the master
+serves no requests.
+
+    python serve.py --bind 0.0.0.0:5000 --workers 4 --threads 4 --max-requests 10000
+
+Signals to the master:
+
+    TERM, INT   graceful shutdown: workers finish the requests in flight
+                (up to --graceful-timeout) and exit
+    HUP         graceful reload: once the new code imports cleanly the master
+                re-executes itself on the same socket and starts new workers,
+                then the old workers finish their requests and exit
+    TTIN, TTOU  one worker more, one fewer
+
+Only the master needs a supervisor (systemd, runit, a container runtime);
+it keeps the same pid across reloads.
+"""
+
+# Standard library imports
+import argparse
+import logging
+import os
+import random
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Remote library imports
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Local imports
+import database
+from app import create_app
+from models import db
+
+log = logging.getLogger('serve')
+
+# Passed across a reload's exec
+LISTENER_FD = 'SERVE_LISTENER_FD'
+RETIRING = 'SERVE_RETIRING'
+POLL_INTERVAL = 0.5
+# A worker that dies this soon after starting is respawned no faster than this
+RESPAWN_DELAY = 1.0
+
+
+def parse_args():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bind', default=f'0.0.0.0:{os.environ.get("PORT", 5000)}', help='host:port')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', cpus)),
+                        help='worker processes (default: WEB_CONCURRENCY, or one per CPU)')
+    parser.add_argument('--threads', type=int, default=4, help='request threads per worker')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='recycle a worker after serving this many requests (0: never)')
+    parser.add_argument('--max-requests-jitter', type=int,
+                        help='up to this many more per worker, so they do not recycle together '
+                             '(default: a tenth of --max-requests)')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds a read from or write to a client may take')
+    parser.add_argument('--graceful-timeout', type=float, default=30,
+                        help='seconds workers get to finish their requests before they are killed')
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--access-log', action='store_true', help='log every request')
+    args = parser.parse_args()
+    if args.max_requests_jitter is None:
+        args.max_requests_jitter = args.max_requests // 10
+    return args
+
+
+def bind(address, backlog):
+    host, _, port = address.rpartition(':')
+    host = host.strip('[]') or '0.0.0.0'
+    listener = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, int(port)))
+    listener.listen(backlog)
+    return listener
+
+
+def preload(app):
+    # Work each worker would otherwise repeat on its first requests. The
+    # query fails fast on a bad DATABASE_URL; the connection it opened is
+    # closed again so no worker inherits it.
+    with app.app_context():
+        configure_mappers()
+        app.url_map.update()
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+class RequestHandler(WSGIRequestHandler):
+    def setup(self):
+        # A stalled client holds a thread for at most this long per read
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def log_request(self, code='-', size='-'):
+        if self.server.access_log:
+            super().log_request(code, size)
+
+
+class Worker(BaseWSGIServer):
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, app, listener, master, args):
+        host, port = listener.getsockname()[:2]
+        super().__init__(host, port, app, handler=RequestHandler, fd=listener.fileno())
+        # Shared with every worker; accept() loses the race with EAGAIN
+        self.socket.setblocking(False)
+        self.master = master
+        self.threads = args.threads
+        self.request_timeout = args.timeout
+        self.access_log = args.access_log
+        self.max_requests = args.max_requests and args.max_requests + random.randint(0, args.max_requests_jitter)
+        self.served = 0
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def _serve(self, request, client_address, free):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.lock:
+                self.served += 1
+                if self.max_requests and self.served >= self.max_requests and not self.stopping.is_set():
+                    log.info('Recycling worker %s after %s requests', os.getpid(), self.served)
+                    self.stopping.set()
+            free.release()
+
+    def run(self):
+        free = threading.Semaphore(self.threads)
+        pool = ThreadPoolExecutor(self.threads, thread_name_prefix='request')
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.socket, selectors.EVENT_READ)
+            # Exits when told to stop, when recycled, or when the master is gone
+            while not self.stopping.is_set() and os.getppid() == self.master:
+                if not free.acquire(timeout=POLL_INTERVAL):
+                    continue
+                try:
+                    if not selector.select(POLL_INTERVAL):
+                        free.release()
+                        continue
+                    request, client_address = self.get_request()
+                except OSError:
+                    free.release()
+                    continue
+                pool.submit(self._serve, request, client_address, free)
+        # Stop listening, then wait for the requests in flight
+        self.socket.close()
+        pool.shutdown()
+
+
+class Master:
+    def __init__(self, app, listener, args):
+        self.app = app
+        self.listener = listener
+        self.args = args
+        self.count = args.workers
+        self.workers = {}
+        # Workers of the previous generation, during a reload
+        self.retiring = {int(pid) for pid in os.environ.pop(RETIRING, '').split(',') if pid}
+        self.signals = []
+        self.respawn_after = 0
+
+    def _signal(self, signum, frame):
+        self.signals.append(signum)
+
+    def _kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            log.info('Booted worker %s', pid)
+            return
+        status = 1
+        try:
+            signal.set_wakeup_fd(-1)
+            os.close(self.wakeup[0])
+            os.close(self.wakeup[1])
+            # Interrupts from a terminal reach the master, which stops the workers
+            for signum in (signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+                signal.signal(signum, signal.SIG_IGN)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            worker = Worker(self.app, self.listener, os.getppid(), self.args)
+            # The worker accepts on its own copy, which it closes when it stops
+            self.listener.close()
+            signal.signal(signal.SIGTERM, lambda signum, frame: worker.stopping.set())
+            worker.run()
+            status = 0
+        except BaseException:
+            log.exception('Worker %s failed', os.getpid())
+        finally:
+            os._exit(status)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.discard(pid)
+            started = self.workers.pop(pid, None)
+            if started is None:
+                continue
+            # Negative for a signal, as os.waitstatus_to_exitcode (3.9+) reports it
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            if code != 0:
+                log.warning('Worker %s exited with %s', pid, code)
+                if time.monotonic() - started < RESPAWN_DELAY:
+                    self.respawn_after = time.monotonic() + RESPAWN_DELAY
+
+    def manage(self):
+        while len(self.workers) > self.count:
+            pid = max(self.workers, key=self.workers.get)
+            self.workers.pop(pid)
+            self.retiring.add(pid)
+            self._kill(pid, signal.SIGTERM)
+        if time.monotonic() >= self.respawn_after:
+            while len(self.workers) < self.count:
+                self.spawn()
+
+    def reload(self):
+        # Replace this process only once the new code loads, so a broken
+        # deploy leaves the current workers serving
+        check = subprocess.run([sys.executable, '-c', 'from app import create_app; create_app()'],
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+        if check.returncode != 0:
+            log.error('Reload aborted: the app failed to load')
+            return
+        log.info('Reloading')
+        os.set_inheritable(self.listener.fileno(), True)
+        env = dict(os.environ)
+        env[LISTENER_FD] = str(self.listener.fileno())
+        env[RETIRING] = ','.join(str(pid) for pid in (*self.workers, *self.retiring))
+        signal.set_wakeup_fd(-1)
+        os.execve(sys.executable, [sys.executable, *sys.argv], env)
+
+    def stop(self):
+        # New connections are refused from here on, not left in the backlog
+        self.listener.close()
+        for pid in (*self.workers, *self.retiring):
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while (self.workers or self.retiring) and time.monotonic() < deadline:
+            time.sleep(0.1)
+            self.reap()
+        for pid in (*self.workers, *self.retiring):
+            log.warning('Killing worker %s', pid)
+            self._kill(pid, signal.SIGKILL)
+        while self.workers or self.retiring:
+            time.sleep(0.1)
+            self.reap()
+
+    def run(self):
+        self.wakeup = os.pipe()
+        for fd in self.wakeup:
+            os.set_blocking(fd, False)
+        signal.set_wakeup_fd(self.wakeup[1])
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU, signal.SIGCHLD):
+            signal.signal(signum, self._signal)
+
+        self.manage()
+        # The new generation is serving; let the old one finish
+        for pid in self.retiring:
+            self._kill(pid, signal.SIGTERM)
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.wakeup[0], selectors.EVENT_READ)
+            while True:
+                selector.select(1.0)
+                try:
+                    while os.read(self.wakeup[0], 512):
+                        pass
+                except BlockingIOError:
+                    pass
+                signals, self.signals = self.signals, []
+                self.reap()
+                if signal.SIGTERM in signals or signal.SIGINT in signals:
+                    log.info('Shutting down')
+                    self.stop()
+                    return
+                if signal.SIGHUP in signals:
+                    self.reload()
+                self.count += signals.count(signal.SIGTTIN)
+                self.count = max(1, self.count - signals.count(signal.SIGTTOU))
+                self.manage()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(message)s')
+
+    if LISTENER_FD in os.environ:
+        listener = socket.socket(fileno=int(os.environ.pop(LISTENER_FD)))
+        listener.set_inheritable(False)
+    else:
+        listener = bind(args.bind, args.backlog)
+    listener.setblocking(False)
+
+    # Each worker gets its share of the CPUs for bcrypt
+    app = create_app({'PASSWORD_WORKERS': max(1, (os.cpu_count() or 1) // args.workers)})
+    preload(app)
+    host, port = listener.getsockname()[:2]
+    log.info('Listening at http://%s:%s with %s workers x %s threads, database %s', host, port, args.workers,
+             args.threads, database.display_url(app.config['SQLALCHEMY_DATABASE_URI']))
+    Master(app, listener, args).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+from collections import Counter
+
+from sqlalchemy import delete, event, func, insert, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, EnrollmentSummary, Enrollments
+from counters import previous_value
+
+# enrollment_summary mirrors COUNT(*) of enrollments grouped by course,
+# semester, status and grade, so the analytics endpoints read a few rows per
+# course instead of scanning enrollments. Like the seat counters, ORM
+# flushes keep it current through the mapper events below and code that
+# writes enrollments with Core statements applies summary_deltas() itself.
+
+KEY = (EnrollmentSummary.course_id, EnrollmentSummary.semester, EnrollmentSummary.status, EnrollmentSummary.grade)
+
+
+def summary_key(course_id, semester, status, grade):
+    return course_id, semester, status, grade or ''
+
+
+def summary_deltas(before, after):
+    # before/after are summary_key() tuples, or None for a missing row
+    deltas = Counter()
+    if before is not None:
+        deltas[before] -= 1
+    if after is not None:
+        deltas[after] += 1
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def apply_summary_deltas(connection, deltas):
+    rows = [
+        {'course_id': course_id, 'semester': semester, 'status': status, 'grade': grade, 'count': delta}
+        for (course_id, semester, status, grade), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+    upsert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    statement = upsert(EnrollmentSummary)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=list(KEY),
+        set_={'count': EnrollmentSummary.count + statement.excluded['count']},
+    ), rows)
+    emptied = [key for key, delta in deltas.items() if delta < 0]
+    if emptied:
+        connection.execute(delete(EnrollmentSummary).where(
+            tuple_(*KEY).in_(emptied), EnrollmentSummary.count <= 0))
+
+
+def _key(target, value):
+    return summary_key(value(target, 'course_id'), value(target, 'semester'),
+                       value(target, 'status'), value(target, 'grade'))
+
+
+@event.listens_for(Enrollments, 'after_insert')
+def _enrollment_inserted(mapper, connection, target):
+    apply_summary_deltas(connection, summary_deltas(None, _key(target, getattr)))
+
+
+@event.listens_for(Enrollments, 'after_update')
+def _enrollment_updated(mapper, connection, target):
+    apply_summary_deltas(connection, summary_deltas(_key(target, previous_value), _key(target, getattr)))
+
+
+@event.listens_for(Enrollments, 'after_delete')
+def _enrollment_deleted(mapper, connection, target):
+    apply_summary_deltas(connection, summary_deltas(_key(target, previous_value), None))
+
+
+def _actual_counts():
+    grade = func.coalesce(Enrollments.grade, '').label('grade')
+    return (
+        select(Enrollments.course_id, Enrollments.semester, Enrollments.status, grade,
+               func.count(Enrollments.id).label('count'))
+        .group_by(Enrollments.course_id, Enrollments.semester, Enrollments.status, grade)
+    )
+
+
+def remove_enrollments(connection, criteria):
+    # Takes the enrollments matching `criteria` out of the summary, for a
+    # delete the database cascades to them: an UPDATE ... FROM their grouped
+    # counts, so no rows pass through Python
+    removed = _actual_counts().where(*criteria).subquery()
+    connection.execute(
+        update(EnrollmentSummary)
+        .where(*(column == removed.c[column.key] for column in KEY))
+        .values(count=EnrollmentSummary.count - removed.c['count'])
+    )
+    connection.execute(delete(EnrollmentSummary).where(
+        tuple_(*KEY).in_(select(*(removed.c[column.key] for column in KEY))), EnrollmentSummary.count <= 0))
+
+
+def check_summaries():
+    # [(key, stored, counted)] for every group the summary gets wrong
+    stored = {tuple(row[:4]): row[4] for row in db.session.execute(select(*KEY, EnrollmentSummary.count))}
+    counted = {tuple(row[:4]): row[4] for row in db.session.execute(_actual_counts())}
+    return [(key, stored.get(key, 0), counted.get(key, 0))
+            for key in sorted(stored.keys() | counted.keys()) if stored.get(key, 0) != counted.get(key, 0)]
+
+
+def rebuild_summaries(connection):
+    connection.execute(delete(EnrollmentSummary))
+    return connection.execute(insert(EnrollmentSummary).from_select(
+        ['course_id', 'semester', 'status', 'grade', 'count'], _actual_counts())).rowcount
@@ -0,0 +1,41 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    # A copy of the seeded instance database, so the guards see real rows
+    path = tmp_path_factory.mktemp('db') / 'app.db'
+    shutil.copy(os.path.join(ROOT, 'instance', 'app.db'), path)
+    environ = {'DATABASE_URL': f'sqlite:///{path}', 'RESPONSE_CACHE': 'off'}
+    saved = {key: os.environ.get(key) for key in environ}
+    os.environ.update(environ)
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        yield app
+    for key, value in saved.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+
+
+def test_collections_load_in_constant_queries(app):
+    from loading import assert_constant_queries, collection_urls
+    client = app.test_client()
+    for url in collection_urls():
+        assert_constant_queries(client, url)
+
+
+def test_declared_filters_use_an_index(app):
+    import filtering
+    for model, columns in filtering.DECLARED:
+        scans = [keys for keys, uses_index, plan in filtering.query_plans(model, columns) if not uses_index]
+        assert not scans, f'{model.__tablename__} filters answered by a table scan: {scans}'
@@ -0,0 +1,182 @@
+from collections import Counter, defaultdict
+
+from sqlalchemy import case, delete, event, func, insert, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Courses, Enrollments, TranscriptTerms
+from analytics import DROPPED, FAILING, GRADE_POINTS
+from counters import previous_value
+
+# transcript_terms holds each student's credit and grade point totals per
+# semester, so a transcript reads one row per semester instead of every
+# enrollment and its course. ORM flushes keep it current through the mapper
+# events below; code that writes enrollments with Core statements passes its
+# (before, after) enrollment facts to apply_enrollment_changes() itself.
+#
+# A fact is (student_id, course_id, semester, status, grade). Dropped
+# enrollments count for nothing; completed ones without an F earn their
+# credits; grades in GRADE_POINTS count towards the GPA, weighted by the
+# course's credit hours.
+
+COMPLETED = 'completed'
+FIELDS = ('courses', 'credits_attempted', 'credits_earned', 'gpa_credits', 'grade_points')
+KEY = (TranscriptTerms.student_id, TranscriptTerms.semester)
+
+
+def contribution(status, grade, credit_hours):
+    if status == DROPPED:
+        return None
+    points = GRADE_POINTS.get(grade)
+    return {
+        'courses': 1,
+        'credits_attempted': credit_hours,
+        'credits_earned': credit_hours if status == COMPLETED and grade != FAILING else 0,
+        'gpa_credits': 0 if points is None else credit_hours,
+        'grade_points': 0 if points is None else points * credit_hours,
+    }
+
+
+def _credit_hours(connection, course_ids):
+    if not course_ids:
+        return {}
+    return dict(connection.execute(select(Courses.id, Courses.credit_hours).where(Courses.id.in_(course_ids))).all())
+
+
+def transcript_deltas(changes, credit_hours):
+    # changes is [(before, after)] facts, either of which may be None;
+    # credit_hours maps course ids to their hours
+    deltas = defaultdict(Counter)
+    for sign, facts in ((-1, (before for before, _ in changes)), (1, (after for _, after in changes))):
+        for fact in facts:
+            if fact is None:
+                continue
+            student_id, course_id, semester, status, grade = fact
+            counts = contribution(status, grade, credit_hours[course_id])
+            if counts is not None:
+                deltas[student_id, semester].update({field: sign * value for field, value in counts.items()})
+    return {key: counts for key, counts in deltas.items() if any(counts.values())}
+
+
+def apply_transcript_deltas(connection, deltas):
+    if not deltas:
+        return
+    rows = [{'student_id': student_id, 'semester': semester, **{field: counts[field] for field in FIELDS}}
+            for (student_id, semester), counts in deltas.items()]
+    upsert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    statement = upsert(TranscriptTerms)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=list(KEY),
+        set_={field: getattr(TranscriptTerms, field) + statement.excluded[field] for field in FIELDS},
+    ), rows)
+    emptied = [key for key, counts in deltas.items() if counts['courses'] < 0]
+    if emptied:
+        connection.execute(delete(TranscriptTerms).where(tuple_(*KEY).in_(emptied), TranscriptTerms.courses <= 0))
+
+
+def apply_enrollment_changes(connection, changes):
+    courses = {fact[1] for change in changes for fact in change if fact is not None}
+    apply_transcript_deltas(connection, transcript_deltas(changes, _credit_hours(connection, courses)))
+
+
+def _fact(target, value):
+    return (value(target, 'student_id'), value(target, 'course_id'), value(target, 'semester'),
+            value(target, 'status'), value(target, 'grade'))
+
+
+@event.listens_for(Enrollments, 'after_insert')
+def _enrollment_inserted(mapper, connection, target):
+    apply_enrollment_changes(connection, [(None, _fact(target, getattr))])
+
+
+@event.listens_for(Enrollments, 'after_update')
+def _enrollment_updated(mapper, connection, target):
+    before, after = _fact(target, previous_value), _fact(target, getattr)
+    if before != after:
+        apply_enrollment_changes(connection, [(before, after)])
+
+
+@event.listens_for(Enrollments, 'after_delete')
+def _enrollment_deleted(mapper, connection, target):
+    apply_enrollment_changes(connection, [(_fact(target, previous_value), None)])
+
+
+@event.listens_for(Courses, 'after_update')
+def _course_updated(mapper, connection, target):
+    # New credit hours reweight every enrollment in the course
+    before, after = previous_value(target, 'credit_hours'), target.credit_hours
+    if before == after:
+        return
+    enrollments = connection.execute(
+        select(Enrollments.student_id, Enrollments.course_id, Enrollments.semester, Enrollments.status,
+               Enrollments.grade)
+        .where(Enrollments.course_id == target.id)
+    ).tuples().all()
+    deltas = defaultdict(Counter)
+    for student_id, _, semester, status, grade in enrollments:
+        old, new = contribution(status, grade, before), contribution(status, grade, after)
+        if old is not None:
+            deltas[student_id, semester].update({field: new[field] - old[field] for field in FIELDS})
+    apply_transcript_deltas(connection, {key: counts for key, counts in deltas.items() if any(counts.values())})
+
+
+def _actual_terms():
+    points = case({grade: points for grade, points in GRADE_POINTS.items()}, value=Enrollments.grade)
+    hours = Courses.credit_hours
+    return (
+        select(
+            Enrollments.student_id, Enrollments.semester,
+            func.count(Enrollments.id).label('courses'),
+            func.sum(hours).label('credits_attempted'),
+            func.sum(case(((Enrollments.status == COMPLETED) & (func.coalesce(Enrollments.grade, '') != FAILING),
+                           hours), else_=0)).label('credits_earned'),
+            func.sum(case((Enrollments.grade.in_(list(GRADE_POINTS)), hours), else_=0)).label('gpa_credits'),
+            func.sum(func.coalesce(points * hours, 0)).label('grade_points'),
+        )
+        .join(Courses, Courses.id == Enrollments.course_id)
+        .where(Enrollments.status != DROPPED)
+        .group_by(Enrollments.student_id, Enrollments.semester)
+    )
+
+
+def remove_enrollments(connection, criteria):
+    # Takes the enrollments matching `criteria` out of the totals, for a
+    # delete the database cascades to them: an UPDATE ... FROM their
+    # per-semester sums, so no rows pass through Python
+    removed = _actual_terms().where(*criteria).subquery()
+    matched = (TranscriptTerms.student_id == removed.c.student_id, TranscriptTerms.semester == removed.c.semester)
+    connection.execute(
+        update(TranscriptTerms).where(*matched)
+        .values({field: getattr(TranscriptTerms, field) - removed.c[field] for field in FIELDS})
+    )
+    connection.execute(delete(TranscriptTerms).where(
+        tuple_(*KEY).in_(select(removed.c.student_id, removed.c.semester)), TranscriptTerms.courses <= 0))
+
+
+def check_transcripts():
+    # [(key, stored, counted)] for every student and semester whose totals
+    # are wrong; stored and counted are tuples in FIELDS order
+    zero = (0,) * len(FIELDS)
+    stored = {tuple(row[:2]): tuple(row[2:]) for row in db.session.execute(
+        select(*KEY, *(getattr(TranscriptTerms, field) for field in FIELDS)))}
+    counted = {tuple(row[:2]): tuple(row[2:]) for row in db.session.execute(_actual_terms())}
+    return [(key, stored.get(key, zero), counted.get(key, zero))
+            for key in sorted(stored.keys() | counted.keys()) if stored.get(key, zero) != counted.get(key, zero)]
+
+
+def rebuild_transcripts(connection):
+    connection.execute(delete(TranscriptTerms))
+    return connection.execute(insert(TranscriptTerms).from_select(
+        ['student_id', 'semester', *FIELDS], _actual_terms())).rowcount
+
+
+def transcript(student_id):
+    # Per-semester rows in semester order plus cumulative totals, with GPAs
+    terms = db.session.execute(
+        select(TranscriptTerms).where(TranscriptTerms.student_id == student_id).order_by(TranscriptTerms.semester)
+    ).scalars().all()
+    semesters = [{'semester': term.semester, **{field: getattr(term, field) for field in FIELDS}} for term in terms]
+    totals = {field: sum(semester[field] for semester in semesters) for field in FIELDS}
+    for counts in (*semesters, totals):
+        counts['gpa'] = round(counts['grade_points'] / counts['gpa_credits'], 2) if counts['gpa_credits'] else None
+    return {'semesters': semesters, 'totals': totals}
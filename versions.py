@@ -0,0 +1,103 @@
+from datetime import datetime
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from sqlalchemy.sql.dml import Delete, UpdateBase
+
+from models import db, ChangeLogState, Changes, TableVersions
+
+# Every INSERT, UPDATE or DELETE on a model table bumps that table's row in
+# table_versions, once per transaction and inside it, so a version only
+# becomes visible together with the data it describes. Listening on the
+# connection catches ORM flushes and the Core writes in bulk.py, counters.py,
+# registration.py and importer.py alike; raw text() SQL is not tracked. A
+# DELETE also bumps every table the database cascades it to.
+
+_commit_hooks = []
+# Bookkeeping that no response reads
+UNVERSIONED = {TableVersions.__tablename__, Changes.__tablename__, ChangeLogState.__tablename__}
+
+
+def _cascades(metadata):
+    # {table name: names of the tables a DELETE from it reaches through
+    # ON DELETE CASCADE, directly or not}
+    children = {}
+    for table in metadata.tables.values():
+        for foreign_key in table.foreign_keys:
+            if (foreign_key.ondelete or '').upper() == 'CASCADE':
+                children.setdefault(foreign_key.column.table.name, set()).add(table.name)
+    reached = {}
+    for name in children:
+        pending, seen = [name], set()
+        while pending:
+            for child in children.get(pending.pop(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    pending.append(child)
+        reached[name] = seen
+    return reached
+
+
+CASCADES = _cascades(db.metadata)
+
+
+def on_commit(hook):
+    # hook(tables) runs as a transaction that wrote to `tables` commits
+    _commit_hooks.append(hook)
+    return hook
+
+
+def _bump(connection, table_name):
+    now = datetime.utcnow()
+    insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    statement = insert(TableVersions).values(table_name=table_name, version=1, updated_at=now)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[TableVersions.table_name],
+        set_={'version': TableVersions.version + 1, 'updated_at': now},
+    ))
+
+
+@event.listens_for(Engine, 'after_execute')
+def _after_execute(connection, clauseelement, multiparams, params, execution_options, result):
+    if not isinstance(clauseelement, UpdateBase):
+        return
+    name = clauseelement.table.name
+    if name in UNVERSIONED or name not in db.metadata.tables:
+        return
+    names = {name} | CASCADES.get(name, set()) if isinstance(clauseelement, Delete) else {name}
+    bumped = connection.info.setdefault('bumped_tables', set())
+    for name in sorted(names - bumped - UNVERSIONED):
+        bumped.add(name)
+        _bump(connection, name)
+
+
+@event.listens_for(Engine, 'commit')
+def _run_commit_hooks(connection):
+    bumped = connection.info.pop('bumped_tables', None)
+    if bumped:
+        for hook in _commit_hooks:
+            hook(frozenset(bumped))
+
+
+@event.listens_for(Engine, 'rollback')
+@event.listens_for(Engine, 'rollback_savepoint')
+def _forget_bumps(connection, *args):
+    # After a rolled back savepoint the next write bumps again; a table
+    # bumped twice in one transaction is harmless, one not bumped is not
+    connection.info.pop('bumped_tables', None)
+
+
+@event.listens_for(Pool, 'checkin')
+def _forget_bumps_on_checkin(dbapi_connection, connection_record):
+    connection_record.info.pop('bumped_tables', None)
+
+
+def current(tables=None):
+    # [(table_name, version, updated_at)] for the given tables, or all of them
+    statement = select(TableVersions.table_name, TableVersions.version, TableVersions.updated_at)
+    if tables is not None:
+        statement = statement.where(TableVersions.table_name.in_(tables))
+    return db.session.execute(statement.order_by(TableVersions.table_name)).all()